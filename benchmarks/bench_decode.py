@@ -0,0 +1,96 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares decoding channel payloads with the json module and with orjson, and
+parsing their samples into timeseries date by date and with the shared day,
+time and offset parts of the dates parsed once. Reports the time and the peak
+memory of each step for payloads of quarter-hourly data.
+
+Run with `python -m benchmarks.bench_decode`. Decoding with orjson is only
+measured if orjson is installed.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from array import array
+
+from benchmarks.stubserver import channel_payload
+from trafficdatafetcher import jsonutils
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries
+from trafficdatafetcher.timestamps import parse_date
+
+
+def _from_samples_date_by_date(samples):
+    # The parsing which was used before the dates were parsed in parts:
+    dates = [parse_date(sample["date"]) for sample in samples]
+    return TimeSeries(array("q", [timestamp for timestamp, _ in dates]),
+                      array("i", [offset for _, offset in dates]),
+                      array("q", [NO_COUNT if sample["comptage"] is None else sample["comptage"]
+                                  for sample in samples]))
+
+
+def _payload(years):
+    samples = channel_payload(1, {"step": "2", "begin": f"{2024 - years}0101", "end": "20240101"})
+    # The API gives dates with their offset from UTC:
+    for sample in samples:
+        sample["date"] = sample["date"].replace(" ", "T") + "+0100"
+    return json.dumps(samples).encode("utf-8")
+
+
+def _measure(function, argument):
+    parse_date.cache_clear()
+    start = time.perf_counter()
+    result = function(argument)
+    duration = time.perf_counter() - start
+    # Tracing slows down the run, so that it is measured separately:
+    parse_date.cache_clear()
+    tracemalloc.start()
+    function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default=[1, 4], type=int, nargs="+",
+                        help="years of quarter-hourly samples per payload")
+    args = parser.parse_args()
+
+    decoders = {"json": json.loads}
+    if jsonutils.orjson is not None:
+        decoders["orjson"] = jsonutils.orjson.loads
+    parsers = {"date by date": _from_samples_date_by_date, "in parts": TimeSeries.from_samples}
+
+    print(f"{'years':>5} {'MB':>6} {'step':<20} {'seconds':>8} {'peak MiB':>9}")
+    for years in args.years:
+        payload = _payload(years)
+        for name, decode in decoders.items():
+            duration, peak, samples = _measure(decode, payload)
+            print(f"{years:5d} {len(payload) / 1e6:6.1f} {'decode ' + name:<20} {duration:8.3f} {peak / 2 ** 20:9.1f}")
+        series = []
+        for name, parse in parsers.items():
+            duration, peak, parsed = _measure(parse, samples)
+            series.append(parsed)
+            print(f"{years:5d} {len(payload) / 1e6:6.1f} {'parse ' + name:<20} {duration:8.3f} {peak / 2 ** 20:9.1f}")
+        assert series[0] == series[1]
+
+
+if __name__ == "__main__":
+    main()
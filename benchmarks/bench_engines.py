@@ -0,0 +1,81 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares the threads and the async engine of fetch-counts against the
+aiohttp stub server for growing concurrency. Each request to the stub
+takes the configured latency, so the run time shows how many requests
+each engine keeps in flight.
+
+Run with `python -m benchmarks.bench_engines`. Requires aiohttp.
+"""
+
+import argparse
+import os
+import time
+from datetime import date
+from functools import partial
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_async_stub_server
+from trafficdatafetcher.apiclient import ApiClient, Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.asyncclient import AsyncApiClient
+from trafficdatafetcher.commands import fetchcounts
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.writers import OutputFormat
+
+
+def _time(server, engine, concurrency, sites):
+    clients = {
+        "ApiClient": partial(ApiClient, api_url=server.api_url, domains_url=server.domains_url),
+        "AsyncApiClient": partial(AsyncApiClient, api_url=server.api_url, domains_url=server.domains_url),
+    }
+    requests_before = server.requests
+    start = time.perf_counter()
+    with patch.multiple(fetchcounts, **clients):
+        # Quarter-hourly data of a year takes a request per month:
+        fetchcounts.fetch_data(domain_id=None, site_ids=[1000 + site for site in range(sites)],
+                               step_sizes=[StepSize.QUARTER_OF_AN_HOUR], file=os.devnull,
+                               output_format=OutputFormat.CSV, begin=date(2023, 1, 1), end=date(2024, 1, 1),
+                               direction=list(Direction), means_of_transport=list(MeansOfTransport),
+                               concurrency=concurrency, incremental=False, state_file=None,
+                               cache_dir=None, no_cache=True, rate=1_000_000, max_attempts=1,
+                               store=None, engine=engine, metrics_file=None)
+    return time.perf_counter() - start, server.requests - requests_before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", default=50, type=int)
+    parser.add_argument("--latency", default=0.1, type=float,
+                        help="latency of each request in seconds")
+    parser.add_argument("-c", "--concurrency", default=[8, 64, 256], type=int, nargs="+")
+    args = parser.parse_args()
+
+    server = start_async_stub_server(StubConfig(sites_per_domain=args.sites, channels_per_site=4,
+                                                latency=args.latency))
+    try:
+        print(f"{'concurrency':>11} {'requests':>8} {'threads s':>10} {'async s':>8}")
+        for concurrency in args.concurrency:
+            threads, requests_count = _time(server, Engine.THREADS, concurrency, args.sites)
+            asynchronous, _ = _time(server, Engine.ASYNC, concurrency, args.sites)
+            print(f"{concurrency:11d} {requests_count:8d} {threads:10.2f} {asynchronous:8.2f}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
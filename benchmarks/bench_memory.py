@@ -0,0 +1,72 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measures the peak memory of fetch-counts for growing time ranges of
+quarter-hourly data. The peak should stay flat regardless of the range.
+
+Run with `python -m benchmarks.bench_memory`.
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+from datetime import date
+from unittest.mock import patch
+
+from benchmarks.stubserver import SyntheticApiClient
+from trafficdatafetcher.apiclient import Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.commands import fetchcounts
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.writers import OutputFormat
+
+
+def _measure(years, concurrency):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with patch.object(fetchcounts, "ApiClient", SyntheticApiClient):
+        fetchcounts.fetch_data(domain_id=None, site_ids=[1000],
+                               step_sizes=[StepSize.QUARTER_OF_AN_HOUR],
+                               file=os.devnull,
+                               output_format=OutputFormat.CSV,
+                               begin=date(2024 - years, 1, 1),
+                               end=date(2024, 1, 1),
+                               direction=list(Direction),
+                               means_of_transport=list(MeansOfTransport),
+                               concurrency=concurrency, incremental=False,
+                               state_file=None, cache_dir=None, no_cache=True,
+                               rate=1000, max_attempts=1, store=None, engine=Engine.THREADS, metrics_file=None)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--concurrency", default=4, type=int)
+    parser.add_argument("--years", default=[1, 2, 4, 8], type=int, nargs="+")
+    args = parser.parse_args()
+
+    print(f"{'years':>5} {'seconds':>8} {'peak MiB':>9}")
+    for years in args.years:
+        duration, peak = _measure(years, args.concurrency)
+        print(f"{years:5d} {duration:8.2f} {peak / 2 ** 20:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
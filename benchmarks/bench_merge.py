@@ -0,0 +1,117 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares merging the channels of a series pairwise as lists of sample dicts
+with merging them in a single pass as arrays. Also reports the memory needed
+per sample by both representations.
+
+Run with `python -m benchmarks.bench_merge`.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from functools import reduce
+
+from trafficdatafetcher.commands import fetchcounts
+from trafficdatafetcher.timeseries import TimeSeries
+
+
+def _pairwise_merge(data1, data2):
+    # The two-way merge which used to be folded over all channels:
+    iter1 = iter(data1)
+    iter2 = iter(data2)
+    sample1 = next(iter1, None)
+    sample2 = next(iter2, None)
+    while sample1 is not None and sample2 is not None:
+        if sample1["date"] == sample2["date"]:
+            sample1["comptage"] += sample2["comptage"]
+            yield sample1
+            sample1 = next(iter1, None)
+            sample2 = next(iter2, None)
+        elif sample1["date"] < sample2["date"]:
+            yield sample1
+            sample1 = next(iter1, None)
+        else:
+            yield sample2
+            sample2 = next(iter2, None)
+    if sample1 is not None:
+        yield sample1
+    if sample2 is not None:
+        yield sample2
+    yield from iter1
+    yield from iter2
+
+
+def _channels(count, samples, aligned=False):
+    begin = datetime(2024, 1, 1)
+    dates = [(begin + timedelta(minutes=15 * i)).strftime("%Y-%m-%d %H:%M:%S")
+             for i in range(samples)]
+    # Unless aligned, every channel misses a few samples so that the merge
+    # has to interleave them:
+    return [[{"date": day, "comptage": i % 100}
+             for i, day in enumerate(dates) if aligned or i % (channel + 2) != 1]
+            for channel in range(count)]
+
+
+def _time(merge, channels):
+    start = time.perf_counter()
+    merged = merge(channels)
+    return time.perf_counter() - start, merged
+
+
+def _bytes_per_sample(samples, load):
+    # Decoding the payload is part of the representation:
+    payload = json.dumps(samples)
+    tracemalloc.start()
+    loaded = load(payload)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return size / len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", default=100_000, type=int,
+                        help="number of samples per channel")
+    parser.add_argument("--channels", default=[2, 8, 32], type=int, nargs="+")
+    parser.add_argument("--aligned", action="store_true",
+                        help="give all channels samples for the same dates")
+    args = parser.parse_args()
+
+    samples = _channels(1, args.samples)[0]
+    dicts = _bytes_per_sample(samples, json.loads)
+    arrays = _bytes_per_sample(samples, lambda payload: TimeSeries.from_samples(json.loads(payload)))
+    print(f"bytes per sample: {dicts:.0f} as dicts, {arrays:.0f} as arrays")
+
+    print(f"{'channels':>8} {'pairwise s':>11} {'single pass s':>14}")
+    for count in args.channels:
+        pairwise, expected = _time(lambda channels: list(reduce(_pairwise_merge, channels)),
+                                   _channels(count, args.samples, args.aligned))
+        channels = [TimeSeries.from_samples(samples)
+                    for samples in _channels(count, args.samples, args.aligned)]
+        single_pass, merged = _time(lambda channels: fetchcounts._merge_timeseries(*channels),
+                                    channels)
+        assert merged.to_samples() == expected
+        print(f"{count:8d} {pairwise:11.2f} {single_pass:14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares writing the quarter-hourly counts of many sites to a single CSV
+file with writing them compressed and partitioned by site and month. Reports
+the time to write them, their size on disk and the time to scan the counts
+of one site in one month.
+
+Run with `python -m benchmarks.bench_output`.
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+from array import array
+from contextlib import redirect_stderr
+from io import StringIO, TextIOWrapper
+
+from trafficdatafetcher.apiclient import Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.commands.common import open_output_writer
+from trafficdatafetcher.commands.fetchcounts import COLUMN_TYPES, Columns, output_columns
+from trafficdatafetcher.partitions import Partition
+from trafficdatafetcher.timeseries import TimeSeries
+from trafficdatafetcher.writers import Compression, OutputFormat, open_compressed
+
+QUARTER = 15 * 60
+BEGIN = 1704063600
+OFFSET = 3600
+
+
+def _series(days):
+    samples = days * 96
+    return TimeSeries(array("q", range(BEGIN, BEGIN + samples * QUARTER, QUARTER)),
+                      array("i", [OFFSET]) * samples,
+                      array("q", (i % 100 for i in range(samples))))
+
+
+def _write(path, sites, series, compression, partition_by):
+    columns = output_columns([StepSize.QUARTER_OF_AN_HOUR])
+    start = time.perf_counter()
+    with redirect_stderr(StringIO()), \
+            open_output_writer(path, OutputFormat.CSV, columns, COLUMN_TYPES, False, compression, partition_by,
+                               Columns.COUNTER_ID) as (_, writer):
+        for site_id in range(sites):
+            for means_of_transport in (MeansOfTransport.FOOT, MeansOfTransport.BIKE):
+                for direction in (Direction.IN, Direction.OUT):
+                    values = {Columns.COUNTER_ID: site_id, Columns.MEANS_OF_TRANSPORT: means_of_transport,
+                              Columns.DIRECTION: direction}
+                    writer.writeseries(values, series.timestamps, series.offsets, list(series.counts))
+    return time.perf_counter() - start
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(parent, name))
+               for parent, _, names in os.walk(path) for name in names)
+
+
+def _scan(path, compression, site_id, month):
+    # Counts the rows of the site in the month like a reader filtering them:
+    start = time.perf_counter()
+    if os.path.isdir(path):
+        path = os.path.join(path, f"site={site_id}", f"month={month}", f"counts.csv{compression.suffix}")
+    with TextIOWrapper(open_compressed(path, "rb", compression), encoding="UTF-8") as file:
+        rows = sum(1 for row in csv.DictReader(file)
+                   if row["counter_id"] == str(site_id) and row["timestamp"].startswith(month))
+    return time.perf_counter() - start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", default=20, type=int)
+    parser.add_argument("--days", default=366, type=int,
+                        help="number of days of quarter-hourly counts per channel")
+    parser.add_argument("--compression", default=[Compression.NONE, Compression.GZIP, Compression.ZSTD],
+                        type=Compression.from_string, nargs="+")
+    args = parser.parse_args()
+
+    series = _series(args.days)
+    print(f"{'output':<28} {'write s':>8} {'MiB':>8} {'scan s':>8} {'rows':>6}")
+    with tempfile.TemporaryDirectory() as directory:
+        for partition_by in (None, [Partition.SITE, Partition.MONTH]):
+            for compression in args.compression:
+                name = f"{'partitioned' if partition_by else 'file'} {compression}"
+                path = os.path.join(directory, name.replace(" ", "-"))
+                duration = _write(path, args.sites, series, compression, partition_by)
+                scan, rows = _scan(path, compression, 0, "2024-02")
+                print(f"{name:<28} {duration:8.2f} {_size(path) / 2 ** 20:8.1f} {scan:8.2f} {rows:6d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measures the sustained throughput of concurrent requests against a stub
+which throttles clients exceeding its rate limit, for several client rates.
+
+Run with `python -m benchmarks.bench_ratelimit`.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient
+from trafficdatafetcher.ratelimit import RateLimiter
+
+
+def _run(server, rate, concurrency, requests_count):
+    throttled_before = server.throttled
+    limiter = RateLimiter(rate)
+    start = time.perf_counter()
+    with ApiClient(pool_size=concurrency, rate_limiter=limiter,
+                   api_url=server.api_url) as client, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client.fetch_site, [1000 + i % 10 for i in range(requests_count)]))
+    duration = time.perf_counter() - start
+    statistics = client.statistics
+    print(f"{rate:8.0f} {requests_count / duration:10.1f} {server.throttled - throttled_before:9d}"
+          f" {statistics.backoff:9.1f} {statistics.max_backoff:12.2f} {limiter.rate:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--requests", default=400, type=int,
+                        help="number of requests per run")
+    parser.add_argument("-c", "--concurrency", default=8, type=int)
+    parser.add_argument("--server-rate", default=100, type=float,
+                        help="requests per second the stub accepts before throttling")
+    parser.add_argument("--rates", default=[50, 90, 200, 1000], type=float, nargs="+",
+                        help="client rates to measure")
+    args = parser.parse_args()
+
+    server = start_stub_server(StubConfig(latency=0.005, rate_limit=args.server_rate,
+                                          retry_after=1))
+    try:
+        print(f"{'rate':>8} {'requests/s':>10} {'throttled':>9} {'backoff s':>9}"
+              f" {'max backoff':>12} {'final rate':>10}")
+        for rate in args.rates:
+            # Let the bucket of the stub fill up between runs:
+            time.sleep(1)
+            _run(server, rate, args.concurrency, args.requests)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares summing up quarter-hourly samples into coarser step sizes with a
+loop over the samples with the array-based resampling of fetch-counts.
+
+Run with `python -m benchmarks.bench_resample`.
+"""
+
+import argparse
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from trafficdatafetcher.apiclient import StepSize
+from trafficdatafetcher.resample import resample
+from trafficdatafetcher.timeseries import TimeSeries
+from trafficdatafetcher.timestamps import NO_OFFSET
+
+QUARTER = 15 * 60
+EPOCH = datetime(1970, 1, 1)
+
+
+def _series(years):
+    begin = int((datetime(2024 - years, 1, 1) - EPOCH).total_seconds())
+    samples = years * 365 * 96
+    return TimeSeries(array("q", range(begin, begin + samples * QUARTER, QUARTER)),
+                      array("i", [NO_OFFSET]) * samples,
+                      array("q", (i % 100 for i in range(samples))))
+
+
+def _bucket_start(timestamp, step_size):
+    day = EPOCH + timedelta(seconds=timestamp)
+    if step_size == StepSize.HOUR:
+        return day.replace(minute=0)
+    day = day.replace(hour=0, minute=0)
+    if step_size == StepSize.WEEK:
+        return day.fromordinal(day.toordinal() - day.weekday())
+    if step_size == StepSize.MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _loop(series, step_size):
+    totals = {}
+    for timestamp, count in zip(series.timestamps, series.counts):
+        bucket = _bucket_start(timestamp, step_size)
+        totals[bucket] = totals.get(bucket, 0) + count
+    return totals
+
+
+def _time(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default=5, type=int,
+                        help="number of years of quarter-hourly samples")
+    args = parser.parse_args()
+
+    series = _series(args.years)
+    print(f"{len(series)} quarter-hourly samples")
+    print(f"{'step size':>10} {'loop s':>7} {'arrays s':>9}")
+    for step_size in (StepSize.HOUR, StepSize.DAY, StepSize.WEEK, StepSize.MONTH):
+        loop, expected = _time(_loop, series, step_size)
+        arrays, resampled = _time(resample, series, step_size)
+        assert list(resampled.counts) == list(expected.values())
+        print(f"{str(step_size):>10} {loop:7.2f} {arrays:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
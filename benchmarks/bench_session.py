@@ -0,0 +1,83 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares a fresh connection per request with the pooled session of
+`ApiClient`.
+
+Run with `python -m benchmarks.bench_session`.
+"""
+
+import argparse
+import time
+
+import requests
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, HEADERS
+
+
+def _time_unpooled(server, site_ids):
+    start = time.perf_counter()
+    for site_id in site_ids:
+        response = requests.get(f"{server.api_url}/publicwebpage/{site_id}?withNull=true",
+                                headers=HEADERS)
+        response.raise_for_status()
+        response.json()
+    return time.perf_counter() - start
+
+
+def _time_pooled(server, site_ids):
+    start = time.perf_counter()
+    with ApiClient(api_url=server.api_url) as client:
+        for site_id in site_ids:
+            client.fetch_site(site_id)
+    return time.perf_counter() - start
+
+
+def _report(name, server, duration, requests_count, connections_before):
+    connections = server.connections - connections_before
+    print(f"{name:<10} {duration / requests_count * 1000:8.2f} ms/request"
+          f" {connections:6d} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--requests", default=200, type=int,
+                        help="number of requests per run")
+    parser.add_argument("--handshake-delay", default=0.02, type=float,
+                        help="simulated handshake time per new connection in seconds")
+    args = parser.parse_args()
+
+    server = start_stub_server(StubConfig(connect_delay=args.handshake_delay))
+    try:
+        site_ids = [1000 + i % 10 for i in range(args.requests)]
+
+        connections_before = server.connections
+        unpooled = _time_unpooled(server, site_ids)
+        _report("unpooled", server, unpooled, len(site_ids), connections_before)
+
+        connections_before = server.connections
+        pooled = _time_pooled(server, site_ids)
+        _report("pooled", server, pooled, len(site_ids), connections_before)
+
+        print(f"saved {(unpooled - pooled) / len(site_ids) * 1000:.2f} ms per request")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
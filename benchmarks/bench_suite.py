@@ -0,0 +1,190 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measures the wall time, peak memory and request throughput of `list-sites`
+and `fetch-counts` end-to-end against the stub server for combinations of
+domain sizes, step sizes, concurrencies and engines.
+
+Each scenario runs in a fresh process so that its peak resident set size is
+not inflated by earlier scenarios. With `--processes`, fetch-counts is also
+run sharded across worker processes, whose peak is reported if it is higher.
+The stub runs in the benchmark process.
+The results can be saved with `--output` and compared with the results of an
+earlier run with `--baseline` to track regressions.
+
+With `--fixtures`, the stub replays payloads recorded from the real API in a
+cache directory instead of synthetic ones (see `stubserver`). The domain sizes
+are then given by the recording.
+
+Run with `python -m benchmarks.bench_suite`. The peak memory is measured with
+`resource` and is therefore not available on Windows.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr
+from datetime import date
+from functools import partial
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.asyncclient import AsyncApiClient
+from trafficdatafetcher.commands import fetchcounts, listsites
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.writers import OutputFormat
+
+COMMANDS = ["list-sites", "fetch-counts"]
+
+# Results of earlier runs have no processes:
+Scenario = namedtuple("Scenario", ["command", "engine", "sites", "step_size", "concurrency", "processes"],
+                      defaults=(1,))
+
+
+def _run_scenario(scenario, api_url, domains_url, domain_id, begin, end):
+    """
+    Runs a scenario in the current process and returns its wall time and
+    the peak resident set size of the process in bytes.
+    """
+    clients = {
+        "ApiClient": partial(ApiClient, api_url=api_url, domains_url=domains_url),
+        "AsyncApiClient": partial(AsyncApiClient, api_url=api_url, domains_url=domains_url),
+    }
+    engine = Engine.from_string(scenario.engine)
+    options = dict(concurrency=scenario.concurrency, cache_dir=None, no_cache=True, rate=1_000_000,
+                   max_attempts=1, engine=engine, metrics_file=None)
+    start = time.perf_counter()
+    # The statistics printed by the commands would clutter the results:
+    with redirect_stderr(io.StringIO()):
+        if scenario.command == "list-sites":
+            with patch.multiple(listsites, **clients), open(os.devnull, "w") as file:
+                listsites.list_sites(domain_id=domain_id, site_ids=None, file=file, **options)
+        else:
+            with patch.multiple(fetchcounts, **clients):
+                fetchcounts.fetch_data(domain_id=domain_id, site_ids=None,
+                                       step_sizes=[StepSize.from_string(scenario.step_size)],
+                                       file=os.devnull, output_format=OutputFormat.CSV, begin=begin, end=end,
+                                       direction=list(Direction), means_of_transport=list(MeansOfTransport),
+                                       incremental=False, state_file=None, store=None,
+                                       processes=scenario.processes, **options)
+    duration = time.perf_counter() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports KiB, macOS bytes:
+    return duration, peak if sys.platform == "darwin" else peak * 1024
+
+
+def _scenarios(args):
+    for command in args.commands:
+        # Site details do not depend on the step size and are not sharded:
+        step_sizes = args.step_sizes if command == "fetch-counts" else [None]
+        processes = args.processes if command == "fetch-counts" else [1]
+        for engine in args.engines:
+            for sites in args.sites:
+                for step_size in step_sizes:
+                    for concurrency in args.concurrency:
+                        for count in processes:
+                            # Sharded fetches only support the threads engine:
+                            if count == 1 or engine == str(Engine.THREADS):
+                                yield Scenario(command, engine, sites, step_size, concurrency, count)
+
+
+def _load_baseline(file):
+    if file is None:
+        return {}
+    with open(file, encoding="UTF-8") as baseline:
+        return {Scenario(**result["scenario"]): result for result in json.load(baseline)}
+
+
+def _change(result, baseline):
+    if baseline is None:
+        return ""
+    return f"{(result['seconds'] / baseline['seconds'] - 1) * 100:+7.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", default=COMMANDS, choices=COMMANDS, nargs="+")
+    parser.add_argument("--engines", default=[str(Engine.THREADS)], choices=[str(engine) for engine in Engine],
+                        nargs="+", help="the async engine requires aiohttp")
+    parser.add_argument("--sites", default=[10, 50], type=int, nargs="+",
+                        help="numbers of sites in the domain")
+    parser.add_argument("--channels", default=4, type=int,
+                        help="number of channels per site")
+    parser.add_argument("-S", "--step-sizes", default=["hour", "quarter_of_an_hour"],
+                        choices=[str(step_size) for step_size in StepSize], nargs="+")
+    parser.add_argument("-c", "--concurrency", default=[1, 8], type=int, nargs="+")
+    parser.add_argument("-P", "--processes", default=[1], type=int, nargs="+",
+                        help="numbers of processes fetch-counts shards the sites across")
+    parser.add_argument("--days", default=31, type=int,
+                        help="number of days of counts to fetch")
+    parser.add_argument("--latency", default=0.01, type=float,
+                        help="latency of each request in seconds")
+    parser.add_argument("--fixtures",
+                        help="cache directory with payloads recorded from the real API")
+    parser.add_argument("--domain", default=1, type=int,
+                        help="domain to fetch. Only needed with --fixtures")
+    parser.add_argument("--output", help="store the results in a JSON file")
+    parser.add_argument("--baseline", help="compare the wall times with the results in a JSON file")
+    args = parser.parse_args()
+    if args.fixtures is not None:
+        # The recording determines the size of the domain:
+        args.sites = [0]
+
+    baseline = _load_baseline(args.baseline)
+    end = date(2024, 1, 1)
+    begin = date.fromordinal(end.toordinal() - args.days)
+    # Scenarios run in a fresh interpreter each:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    print(f"{'command':<12} {'engine':<7} {'sites':>5} {'step size':<18} {'conc':>4} {'proc':>4} {'seconds':>8} "
+          f"{'requests':>8} {'req/s':>8} {'peak MiB':>8} {'change':>8}")
+    for scenario in _scenarios(args):
+        server = start_stub_server(StubConfig(domains=args.domain, sites_per_domain=scenario.sites,
+                                              channels_per_site=args.channels, latency=args.latency,
+                                              fixtures=args.fixtures))
+        try:
+            # Unlike pool processes, the process may start worker processes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                duration, peak = executor.submit(_run_scenario, scenario, server.api_url, server.domains_url,
+                                                 args.domain, begin, end).result()
+            requests_count = server.requests
+        finally:
+            server.shutdown()
+            server.server_close()
+        result = {"scenario": scenario._asdict(), "seconds": duration, "requests": requests_count,
+                  "requests_per_second": requests_count / duration, "peak_rss": peak}
+        results.append(result)
+        print(f"{scenario.command:<12} {scenario.engine:<7} {scenario.sites:5d} {scenario.step_size or '-':<18} "
+              f"{scenario.concurrency:4d} {scenario.processes:4d} {duration:8.2f} {requests_count:8d} "
+              f"{result['requests_per_second']:8.1f} {peak / 2 ** 20:8.1f} "
+              f"{_change(result, baseline.get(scenario)):>8}")
+    if args.output is not None:
+        with open(args.output, "w", encoding="UTF-8") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares writing the samples of fetch-counts to CSV row by row, with a dict
+per sample, with writing whole series with the values shared by their
+samples rendered once.
+
+Run with `python -m benchmarks.bench_write`.
+"""
+
+import argparse
+import io
+import time
+from array import array
+
+from trafficdatafetcher.apiclient import Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.commands.fetchcounts import COLUMN_TYPES, Columns, output_columns
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries
+from trafficdatafetcher.writers import OutputFormat, open_writer
+
+QUARTER = 15 * 60
+BEGIN = 1704067200
+
+
+def _series(samples, offset):
+    # Every tenth sample has no count:
+    return TimeSeries(array("q", range(BEGIN, BEGIN + samples * QUARTER, QUARTER)),
+                      array("i", [offset]) * samples,
+                      array("q", (NO_COUNT if i % 10 == 9 else i % 100 for i in range(samples))))
+
+
+def _write_rows(writer, series):
+    # The way fetch-counts used to write each sample:
+    for timestamp, offset, count in zip(series.timestamps, series.offsets, series.counts):
+        writer.writerow({
+            Columns.COUNTER_ID: 100012345,
+            Columns.MEANS_OF_TRANSPORT: MeansOfTransport.BIKE,
+            Columns.DIRECTION: Direction.IN,
+            Columns.STEP_SIZE: StepSize.QUARTER_OF_AN_HOUR,
+            Columns.TIMESTAMP: (timestamp, offset),
+            Columns.COUNT: None if count == NO_COUNT else count,
+        })
+
+
+def _write_series(writer, series):
+    values = {
+        Columns.COUNTER_ID: 100012345,
+        Columns.MEANS_OF_TRANSPORT: MeansOfTransport.BIKE,
+        Columns.DIRECTION: Direction.IN,
+        Columns.STEP_SIZE: StepSize.QUARTER_OF_AN_HOUR,
+    }
+    counts = [None if count == NO_COUNT else count for count in series.counts]
+    writer.writeseries(values, series.timestamps, series.offsets, counts)
+
+
+def _time(write, series, columns):
+    file = io.StringIO()
+    start = time.perf_counter()
+    with open_writer(OutputFormat.CSV, file, columns, COLUMN_TYPES) as writer:
+        for part in series:
+            write(writer, part)
+    return time.perf_counter() - start, file.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", default=200_000, type=int,
+                        help="number of samples per series")
+    parser.add_argument("--series", default=5, type=int,
+                        help="number of series to write")
+    parser.add_argument("--offset", default=3600, type=int,
+                        help="offset of the dates from UTC in seconds")
+    args = parser.parse_args()
+
+    series = [_series(args.samples, args.offset) for _ in range(args.series)]
+    columns = output_columns([StepSize.QUARTER_OF_AN_HOUR, StepSize.HOUR])
+    rows = args.samples * args.series
+    by_row, expected = _time(_write_rows, series, columns)
+    by_series, written = _time(_write_series, series, columns)
+    assert written == expected
+    print(f"{'writer':<10} {'seconds':>8} {'rows/s':>10}")
+    print(f"{'rows':<10} {by_row:8.2f} {rows / by_row:10.0f}")
+    print(f"{'series':<10} {by_series:8.2f} {rows / by_series:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
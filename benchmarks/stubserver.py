@@ -0,0 +1,417 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A local stub of Eco Counter's API serving synthetic payloads.
+
+The stub answers the same endpoints as the real API. `SyntheticApiClient`
+returns the same payloads in process without any requests. The number of sites
+per domain, channels per site and the range of the generated samples are
+configurable, as is the latency of each request and the time needed to
+establish a new connection (which simulates TCP and TLS handshakes).
+
+The stub can throttle clients like the real API: requests exceeding
+`rate_limit` requests per second and every `fail_every`-th request are
+answered with 429 and 503 respectively, with a Retry-After header if
+`retry_after` is set.
+
+Instead of synthetic payloads, the stub can replay payloads recorded from the
+real API. Any cache directory written by a command run with `--cache-dir` serves
+as recording; set `fixtures` to the directory. Requests which were not recorded
+are answered with 404. As the commands split time ranges deterministically, a
+command replays the recording if it is run with the same arguments. Sites are
+cached without their session token, so the stub adds one to replayed sites.
+
+`AsyncStubServer` serves the same endpoints from an aiohttp event loop. It
+waits for the latency without blocking and therefore answers thousands of
+concurrent requests. It requires aiohttp.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from trafficdatafetcher.apiclient import API_URL, DOMAINS_URL, cache_key
+from trafficdatafetcher.cache import ResponseCache
+from trafficdatafetcher.ratelimit import RequestStatistics
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+STEPS = {
+    "2": timedelta(minutes=15),
+    "3": timedelta(hours=1),
+    "4": timedelta(days=1),
+    "5": timedelta(weeks=1),
+}
+
+DEFAULT_BEGIN = datetime(2024, 1, 1)
+DEFAULT_END = datetime(2024, 1, 8)
+
+
+class StubConfig:
+    def __init__(self, domains=10, sites_per_domain=10, channels_per_site=4,
+                 latency=0.0, connect_delay=0.0, compress=True, rate_limit=None,
+                 fail_every=0, retry_after=None, fixtures=None):
+        self.domains = domains
+        self.sites_per_domain = sites_per_domain
+        self.channels_per_site = channels_per_site
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self.compress = compress
+        self.rate_limit = rate_limit
+        self.fail_every = fail_every
+        self.retry_after = retry_after
+        self.fixtures = fixtures
+
+
+class _StubCounters:
+    """
+    Counts the connections and requests of a stub server and throttles
+    requests.
+    """
+
+    def _init_counters(self, config):
+        self.config = config
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+        self._tokens = config.rate_limit
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def count_request(self):
+        """
+        Counts a request and returns the status to answer it with if it is
+        throttled.
+        """
+        with self._lock:
+            self.requests += 1
+            status = self._throttle_status()
+            if status is not None:
+                self.throttled += 1
+            return status
+
+    def _throttle_status(self):
+        if self.config.fail_every and self.requests % self.config.fail_every == 0:
+            return 503
+        if self.config.rate_limit is None:
+            return None
+        now = time.monotonic()
+        self._tokens = min(self.config.rate_limit,
+                           self._tokens + (now - self._updated) * self.config.rate_limit)
+        self._updated = now
+        if self._tokens < 1:
+            return 429
+        self._tokens -= 1
+        return None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/api"
+
+    @property
+    def domains_url(self):
+        return f"{self.base_url}/domains.json"
+
+
+class StubServer(_StubCounters, ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config):
+        super().__init__(("127.0.0.1", 0), StubRequestHandler)
+        self._init_counters(config)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        time.sleep(self.server.config.connect_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        status = self.server.count_request()
+        config = self.server.config
+        time.sleep(config.latency)
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, headers, body = respond(config, status, url.path, params, self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class AsyncStubServer(_StubCounters):
+    """
+    Serves the stub from an aiohttp application in a background thread.
+    Also records the largest number of requests served at the same time in
+    `max_in_flight`.
+    """
+
+    def __init__(self, config):
+        from aiohttp import web
+
+        self._init_counters(config)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._transports = set()
+        self._loop = asyncio.new_event_loop()
+        application = web.Application()
+        application.router.add_get("/{path:.*}", self._handle)
+        self._runner = web.AppRunner(application, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0, backlog=1024)
+        self._loop.run_until_complete(site.start())
+        self.server_address = self._runner.addresses[0]
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        if request.transport not in self._transports:
+            self._transports.add(request.transport)
+            self.count_connection()
+            await asyncio.sleep(self.config.connect_delay)
+        status = self.count_request()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.config.latency)
+        finally:
+            self.in_flight -= 1
+        status, headers, body = respond(self.config, status, request.path, dict(request.query),
+                                         request.headers)
+        return web.Response(status=status, headers=headers, body=body)
+
+
+def respond(config, throttle_status, path, params, request_headers):
+    """
+    Returns the status, headers and body of the response to a request.
+    """
+    if throttle_status is not None:
+        headers = {}
+        if config.retry_after is not None:
+            headers["Retry-After"] = str(config.retry_after)
+        return throttle_status, headers, b""
+    payload = _route(config, path, params)
+    if payload is None:
+        return 404, {}, b""
+    body = json.dumps(payload).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    if request_headers.get("If-None-Match") == etag:
+        return 304, {"ETag": etag}, b""
+    headers = {"Content-Type": "application/json", "ETag": etag}
+    if config.compress and "gzip" in request_headers.get("Accept-Encoding", ""):
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    return 200, headers, body
+
+
+def _route(config, path, params):
+    if config.fixtures is not None:
+        return _recorded_payload(config, path, params)
+    parts = path.strip("/").split("/")
+    if parts == ["domains.json"]:
+        return domains_payload(config)
+    if parts[:2] == ["api", "publicwebpageplus"] and len(parts) == 3:
+        return sites_in_domain_payload(config, int(parts[2]))
+    if parts[:3] == ["api", "publicwebpage", "data"] and len(parts) == 4:
+        return channel_payload(int(parts[3]), params)
+    if parts[:2] == ["api", "publicwebpage"] and len(parts) == 3:
+        return site_payload(config, int(parts[2]))
+    return None
+
+
+def _recorded_payload(config, path, params):
+    """
+    Returns the payload recorded for a request in the response cache in
+    config.fixtures or None if the request was not recorded. The cache keys
+    are the urls of the real API without the token.
+    """
+    parts = path.strip("/").split("/")
+    if parts == ["domains.json"]:
+        url = DOMAINS_URL
+    elif parts[0] == "api":
+        url = "/".join([API_URL, *parts[1:]])
+    else:
+        return None
+    params = {name: value for name, value in params.items() if name != "t"}
+    entry = ResponseCache(config.fixtures).lookup(cache_key(url, params))
+    if entry is None:
+        return None
+    if parts[:2] == ["api", "publicwebpage"] and len(parts) == 3:
+        return dict(entry.payload, token="recorded")
+    return entry.payload
+
+
+def site_ids_in_domain(config, domain_id):
+    first_site_id = domain_id * 1000
+    return list(range(first_site_id, first_site_id + config.sites_per_domain))
+
+
+def domains_payload(config):
+    return [{"id": domain_id, "name": f"Domain {domain_id}"}
+            for domain_id in range(1, config.domains + 1)]
+
+
+def sites_in_domain_payload(config, domain_id):
+    return [{
+        "idPdc": site_id,
+        "nom": f"Site {site_id}",
+        "lat": 50.0 + site_id % 1000 / 1000,
+        "lon": 7.0 + site_id % 1000 / 1000,
+        "lienPublic": site_id,
+        "pratique": [{"pratique": 2}],
+        "mainPratique": 2,
+        "publicMessage": None,
+    } for site_id in site_ids_in_domain(config, domain_id)]
+
+
+def site_payload(config, site_id):
+    return {
+        "idPdc": site_id,
+        "domaine": site_id // 1000,
+        "titre": f"Site {site_id}",
+        "latitude": 50.0 + site_id % 1000 / 1000,
+        "longitude": 7.0 + site_id % 1000 / 1000,
+        "directionIn": "North",
+        "directionOut": "South",
+        "nbPratiques": 1,
+        "pratique": 2,
+        "date": "2020-01-01 00:00:00",
+        "message": None,
+        "token": "stub",
+        "channels": [{
+            "id": site_id * 100 + channel,
+            "sens": 1 if channel % 2 == 0 else 2,
+            "userType": 2,
+        } for channel in range(config.channels_per_site)],
+    }
+
+
+def channel_payload(channel_id, params):
+    step = STEPS.get(params.get("step", "3"))
+    begin = _parse_date(params.get("begin"), DEFAULT_BEGIN)
+    end = _parse_date(params.get("end"), DEFAULT_END)
+    samples = []
+    timestamp = begin
+    index = 0
+    while timestamp < end:
+        samples.append({
+            "date": timestamp.strftime(DATE_FORMAT),
+            "comptage": (channel_id + index) % 100,
+        })
+        index += 1
+        if step is None:
+            timestamp = _next_month(timestamp)
+        else:
+            timestamp += step
+    return samples
+
+
+def _parse_date(value, default):
+    if value is None:
+        return default
+    return datetime.strptime(value, "%Y%m%d")
+
+
+def _next_month(timestamp):
+    if timestamp.month == 12:
+        return timestamp.replace(year=timestamp.year + 1, month=1)
+    return timestamp.replace(month=timestamp.month + 1)
+
+
+class SyntheticApiClient:
+    """
+    Stands in for ApiClient and returns the payloads of the stub server
+    without sending any requests.
+    """
+    config = StubConfig()
+
+    def __init__(self, **kwargs):
+        self.statistics = RequestStatistics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def fetch_domains(self):
+        return domains_payload(self.config)
+
+    def fetch_sites_in_domain(self, domain_id):
+        return sites_in_domain_payload(self.config, domain_id)
+
+    def fetch_site(self, site_id):
+        return site_payload(self.config, site_id)
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        params = {"step": str(step_size.value)}
+        if begin is not None:
+            params["begin"] = begin.strftime("%Y%m%d")
+        if end is not None:
+            params["end"] = end.strftime("%Y%m%d")
+        return channel_payload(channel_id, params)
+
+
+def start_stub_server(config=None):
+    """
+    Starts a stub server in a background thread. Call `shutdown()` on the
+    returned server to stop it.
+    """
+    server = StubServer(config or StubConfig())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def start_async_stub_server(config=None):
+    """
+    Starts an aiohttp stub server in a background thread. Call `shutdown()`
+    on the returned server to stop it.
+    """
+    return AsyncStubServer(config or StubConfig())
@@ -0,0 +1,112 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import unittest
+from enum import auto
+from unittest import TestCase
+
+from trafficdatafetcher.apiclient import Direction
+from trafficdatafetcher.arrowutils import ColumnType, open_arrow, open_parquet
+from trafficdatafetcher.timestamps import NO_OFFSET, parse_date
+from trafficdatafetcher.types import EnumWithLowerCaseNames
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class Columns(EnumWithLowerCaseNames):
+    ID = auto()
+    DIRECTION = auto()
+    TIMESTAMP = auto()
+    COUNT = auto()
+
+
+COLUMN_TYPES = {
+    Columns.ID: ColumnType.INT64,
+    Columns.DIRECTION: Direction,
+    Columns.TIMESTAMP: ColumnType.TIMESTAMP,
+    Columns.COUNT: ColumnType.INT32,
+}
+
+
+def _write_rows(writer):
+    for hour in range(5):
+        writer.writerow({
+            Columns.ID: 1,
+            Columns.DIRECTION: Direction.IN if hour % 2 == 0 else Direction.OUT,
+            Columns.TIMESTAMP: parse_date(f"2024-01-01 {hour:02d}:00:00"),
+            Columns.COUNT: hour if hour < 4 else None,
+        })
+    writer.close()
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class ArrowUtilsTest(TestCase):
+    def test_parquet_file_has_typed_columns_and_row_groups(self):
+        file = io.BytesIO()
+        writer = open_parquet(file, Columns, COLUMN_TYPES)
+        writer._row_group_size = 2
+        _write_rows(writer)
+
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(file.getvalue()))
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        table = parquet_file.read()
+        self.assertEqual(table.schema.field("id").type, pyarrow.int64())
+        self.assertEqual(table.schema.field("direction").type,
+                         pyarrow.dictionary(pyarrow.int8(), pyarrow.string()))
+        # Parquet has no timestamps with a resolution of seconds:
+        self.assertEqual(table.schema.field("timestamp").type, pyarrow.timestamp("ms"))
+        self.assertEqual(table.schema.field("count").type, pyarrow.int32())
+        self.assertEqual(table.column("direction").to_pylist(),
+                         ["in", "out", "in", "out", "in"])
+        self.assertEqual(table.column("count").to_pylist(), [0, 1, 2, 3, None])
+
+    def test_arrow_file_contains_all_batches(self):
+        file = io.BytesIO()
+        writer = open_arrow(file, Columns, COLUMN_TYPES)
+        writer._row_group_size = 2
+        _write_rows(writer)
+
+        reader = pyarrow.ipc.open_file(io.BytesIO(file.getvalue()))
+        self.assertEqual(reader.num_record_batches, 3)
+        table = reader.read_all()
+        self.assertEqual(table.schema.field("timestamp").type, pyarrow.timestamp("s"))
+        self.assertEqual(table.column("timestamp").cast(pyarrow.int64()).to_pylist(),
+                         [1704067200 + hour * 3600 for hour in range(5)])
+
+    def test_series_are_split_into_batches(self):
+        file = io.BytesIO()
+        writer = open_arrow(file, Columns, COLUMN_TYPES)
+        writer._row_group_size = 2
+        writer.writerow({Columns.ID: 1, Columns.DIRECTION: Direction.OUT, Columns.COUNT: 7})
+        writer.writeseries({Columns.ID: 2, Columns.DIRECTION: Direction.IN},
+                           [1704067200 + hour * 3600 for hour in range(4)], [NO_OFFSET] * 4, [0, 1, 2, None])
+        writer.close()
+
+        reader = pyarrow.ipc.open_file(io.BytesIO(file.getvalue()))
+        self.assertEqual(reader.num_record_batches, 3)
+        table = reader.read_all()
+        self.assertEqual(table.column("id").to_pylist(), [1, 2, 2, 2, 2])
+        self.assertEqual(table.column("direction").to_pylist(), ["out", "in", "in", "in", "in"])
+        self.assertEqual(table.column("count").to_pylist(), [7, 0, 1, 2, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
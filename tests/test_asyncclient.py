@@ -0,0 +1,204 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import io
+import os
+import socket
+import threading
+import tempfile
+import unittest
+from datetime import date
+from functools import partial
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, SyntheticApiClient, start_async_stub_server
+from trafficdatafetcher.apiclient import ApiClient, ApiError, Direction, MeansOfTransport, StepSize
+from trafficdatafetcher import asyncclient
+from trafficdatafetcher.asyncclient import AsyncApiClient, EventLoopThread
+from trafficdatafetcher.cache import ResponseCache
+from trafficdatafetcher.commands import fetchcounts, listsites
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.ratelimit import RateLimiter
+from trafficdatafetcher.writers import OutputFormat
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class AsyncApiClientTest(TestCase):
+    def setUp(self):
+        self.server = start_async_stub_server(StubConfig(latency=0.02))
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def _run(self, fetch, **kwargs):
+        async def run():
+            async with AsyncApiClient(api_url=self.server.api_url, domains_url=self.server.domains_url,
+                                      **kwargs) as client:
+                return await fetch(client)
+        return asyncio.run(run())
+
+    def test_payloads_match_api_client(self):
+        synthetic = SyntheticApiClient()
+        self.assertEqual(self._run(lambda client: client.fetch_domains()), synthetic.fetch_domains())
+        self.assertEqual(self._run(lambda client: client.fetch_sites_in_domain(2)),
+                         synthetic.fetch_sites_in_domain(2))
+        self.assertEqual(self._run(lambda client: client.fetch_site(2001)), synthetic.fetch_site(2001))
+        self.assertEqual(
+            self._run(lambda client: client.fetch_channel(2, 200101, date(2024, 1, 1), date(2024, 1, 3),
+                                                          StepSize.HOUR, "token")),
+            synthetic.fetch_channel(2, 200101, date(2024, 1, 1), date(2024, 1, 3), StepSize.HOUR, "token"))
+
+    def test_concurrent_requests_are_limited_to_pool_size(self):
+        async def fetch(client):
+            return await asyncio.gather(*(client.fetch_site(site_id) for site_id in range(1000, 1040)))
+
+        self.assertEqual(len(self._run(fetch, pool_size=8)), 40)
+        self.assertEqual(self.server.max_in_flight, 8)
+        self.assertLessEqual(self.server.connections, 8)
+
+    def test_throttled_requests_are_retried(self):
+        self.server.config.fail_every = 3
+        self.server.config.retry_after = 0
+
+        async def fetch(client):
+            sites = await asyncio.gather(*(client.fetch_site(site_id) for site_id in range(1000, 1010)))
+            return sites, client.statistics
+
+        sites, statistics = self._run(fetch, pool_size=4, rate_limiter=RateLimiter(1000))
+        self.assertEqual(len(sites), 10)
+        self.assertGreater(statistics.retries, 0)
+        self.assertEqual(statistics.throttled, self.server.throttled)
+
+    def test_failed_requests_raise_api_error(self):
+        async def fetch(client):
+            client._api_url = f"{self.server.base_url}/unknown"
+            return await client.fetch_site(1000)
+
+        with self.assertRaises(ApiError):
+            self._run(fetch)
+
+    def test_backoff_of_requests_failing_to_connect_is_counted(self):
+        async def fetch(client):
+            with socket.socket() as unused:
+                unused.bind(("127.0.0.1", 0))
+                client._api_url = f"http://127.0.0.1:{unused.getsockname()[1]}"
+            with self.assertRaises(ApiError):
+                await client.fetch_site(1000)
+            return client.statistics
+
+        with patch.object(asyncclient, "backoff_delay", lambda attempt: 0.01):
+            statistics = self._run(fetch, max_attempts=3)
+        self.assertEqual(statistics.retries, 2)
+        self.assertAlmostEqual(statistics.max_backoff, 0.02)
+
+    def test_responses_are_cached(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            self._run(lambda client: client.fetch_site(1000), cache=cache)
+            site = self._run(lambda client: client.fetch_site(1000, with_token=False), cache=cache)
+        self.assertNotIn("token", site)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_cache_is_used_outside_the_event_loop(self):
+        threads = []
+
+        def record_thread(method):
+            def recorded(*args):
+                threads.append(threading.current_thread())
+                return method(*args)
+            return recorded
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            cache.lookup = record_thread(cache.lookup)
+            cache.store = record_thread(cache.store)
+            self._run(lambda client: client.fetch_site(1000, with_token=False), cache=cache)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class EventLoopThreadTest(TestCase):
+    def test_coroutines_are_submitted_like_functions(self):
+        async def double(value):
+            await asyncio.sleep(0.01)
+            return 2 * value
+
+        with EventLoopThread() as loop:
+            futures = [loop.submit(double, value) for value in range(3)]
+            self.assertEqual([future.result() for future in futures], [0, 2, 4])
+            self.assertEqual(loop.run(double(4)), 8)
+
+    def test_running_coroutines_are_cancelled_on_shutdown(self):
+        with EventLoopThread() as loop:
+            future = loop.submit(asyncio.sleep, 60)
+        self.assertTrue(future.cancelled())
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class AsyncEngineTest(TestCase):
+    def setUp(self):
+        self.server = start_async_stub_server(StubConfig(domains=1, sites_per_domain=6, latency=0.01))
+        self.clients = {
+            "ApiClient": partial(ApiClient, api_url=self.server.api_url, domains_url=self.server.domains_url),
+            "AsyncApiClient": partial(AsyncApiClient, api_url=self.server.api_url,
+                                      domains_url=self.server.domains_url),
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def _fetch_counts(self, engine):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.multiple(fetchcounts, **self.clients):
+            file = os.path.join(directory, "counts.csv")
+            fetchcounts.fetch_data(domain_id=1, site_ids=None, step_sizes=[StepSize.QUARTER_OF_AN_HOUR],
+                                   file=file, output_format=OutputFormat.CSV,
+                                   begin=date(2023, 12, 30), end=date(2024, 1, 2),
+                                   direction=list(Direction), means_of_transport=list(MeansOfTransport),
+                                   concurrency=8, incremental=False, state_file=None, cache_dir=None,
+                                   no_cache=True, rate=1000, max_attempts=1, store=None, engine=engine,
+                                   metrics_file=None)
+            with open(file, encoding="UTF-8") as output:
+                return output.read()
+
+    def _list_sites(self, engine):
+        file = io.StringIO()
+        with patch.multiple(listsites, **self.clients):
+            listsites.list_sites(domain_id=1, site_ids=None, file=file, concurrency=8, cache_dir=None,
+                                 no_cache=True, rate=1000, max_attempts=1, engine=engine, metrics_file=None)
+        return file.getvalue()
+
+    def test_fetch_counts_writes_the_same_rows_with_both_engines(self):
+        counts = self._fetch_counts(Engine.ASYNC)
+        # 6 sites with 2 directions of 3 days of quarter-hourly samples:
+        self.assertEqual(counts.count("\n"), 1 + 6 * 2 * 3 * 96)
+        self.assertEqual(counts, self._fetch_counts(Engine.THREADS))
+
+    def test_list_sites_writes_the_same_rows_with_both_engines(self):
+        self.assertEqual(self._list_sites(Engine.ASYNC), self._list_sites(Engine.THREADS))
+
+
+if __name__ == '__main__':
+    unittest.main()
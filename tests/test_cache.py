@@ -0,0 +1,116 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import TestCase
+
+from benchmarks.stubserver import start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, StepSize, cached_payload
+from trafficdatafetcher.cache import ResponseCache
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup_returns_stored_payload(self):
+        self.cache.store("key", [{"date": "2024-01-01 01:00:00", "comptage": 1}],
+                         timedelta(hours=1))
+        entry = self.cache.lookup("key")
+        self.assertEqual(entry.payload, [{"date": "2024-01-01 01:00:00", "comptage": 1}])
+        self.assertTrue(entry.is_fresh())
+
+    def test_lookup_returns_none_for_unknown_key(self):
+        self.assertIsNone(self.cache.lookup("key"))
+
+    def test_entry_expires_after_ttl(self):
+        self.cache.store("key", {}, timedelta(seconds=-1), etag='"1"')
+        entry = self.cache.lookup("key")
+        self.assertFalse(entry.is_fresh())
+        self.assertEqual(entry.etag, '"1"')
+
+    def test_entry_without_ttl_never_expires(self):
+        self.cache.store("key", {}, None)
+        self.assertTrue(self.cache.lookup("key").is_fresh())
+
+    def test_counts_of_past_time_ranges_never_expire(self):
+        self.assertIsNone(self.cache.ttl_for_counts(date(2024, 1, 1)))
+
+    def test_counts_of_open_time_ranges_expire(self):
+        self.assertEqual(self.cache.ttl_for_counts(None), self.cache.counts_ttl)
+        self.assertEqual(self.cache.ttl_for_counts(date.today()), self.cache.counts_ttl)
+
+
+class CachingApiClientTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = start_stub_server()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def _client(self, cache):
+        return ApiClient(cache=cache, api_url=self.server.api_url)
+
+    def test_second_request_is_answered_from_cache(self):
+        cache = ResponseCache(self.directory.name)
+        with self._client(cache) as client:
+            first = client.fetch_channel(1, 100000, date(2024, 1, 1),
+                                         date(2024, 1, 2), StepSize.HOUR, "a")
+            # The token is not part of the cache key:
+            second = client.fetch_channel(1, 100000, date(2024, 1, 1),
+                                          date(2024, 1, 2), StepSize.HOUR, "b")
+        self.assertEqual(first, second)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(self.server.requests, 1)
+
+    def test_expired_entry_is_revalidated(self):
+        cache = ResponseCache(self.directory.name, metadata_ttl=timedelta(seconds=-1))
+        with self._client(cache) as client:
+            first = client.fetch_site(1000, with_token=False)
+            second = client.fetch_site(1000, with_token=False)
+        self.assertEqual(first, second)
+        self.assertEqual((cache.hits, cache.misses, cache.revalidated), (0, 1, 1))
+
+    def test_sites_are_cached_without_token(self):
+        cache = ResponseCache(self.directory.name)
+        with self._client(cache) as client:
+            first = client.fetch_site(1000)
+            cached = client.fetch_site(1000, with_token=False)
+            # A token is always fetched from the API:
+            second = client.fetch_site(1000)
+        self.assertEqual(first["token"], "stub")
+        self.assertNotIn("token", cached)
+        self.assertEqual(second, first)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(self.server.requests, 2)
+
+    def test_empty_responses_are_not_cached(self):
+        self.assertIsNone(cached_payload({}))
+        self.assertIsNone(cached_payload([]))
+        self.assertEqual(cached_payload({"idPdc": 1, "token": "a"}), {"idPdc": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
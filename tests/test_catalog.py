@@ -0,0 +1,173 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from functools import partial
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, ApiError, MeansOfTransport
+from trafficdatafetcher.catalog import Catalog, distance
+from trafficdatafetcher.commands import findsites, updatecatalog
+
+
+def _site(site_id, name, latitude, longitude, *means_of_transport, public=True):
+    return {
+        "idPdc": site_id,
+        "nom": name,
+        "lat": latitude,
+        "lon": longitude,
+        "lienPublic": site_id + 100 if public else None,
+        "pratique": [{"pratique": means.value} for means in means_of_transport],
+        "mainPratique": means_of_transport[0].value if means_of_transport else None,
+    }
+
+
+class CatalogTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.catalog = Catalog(os.path.join(directory.name, "catalog.sqlite3"))
+        self.addCleanup(self.catalog.close)
+        self.catalog.replace_domain(1, "Bonn", [
+            _site(1, "Kennedybrücke", 50.7390, 7.1120, MeansOfTransport.BIKE, MeansOfTransport.FOOT),
+            _site(2, "Rheinufer Beuel", 50.7360, 7.1110, MeansOfTransport.FOOT),
+            _site(3, "Nordbrücke", 50.7530, 7.1050, MeansOfTransport.BIKE, public=False),
+        ])
+        self.catalog.replace_domain(2, "Montpellier Méditerranée Métropole", [
+            _site(4, "Pont de l'Université", 43.6320, 3.8700, MeansOfTransport.BIKE),
+        ])
+
+    def _ids(self, *args, **kwargs):
+        return [site.site_id for site in self.catalog.find_sites(*args, **kwargs)]
+
+    def test_words_are_prefixes_of_words_of_the_site_or_domain_names(self):
+        self.assertEqual(self._ids(["bon"]), [1, 3, 2])
+        self.assertEqual(self._ids(["nordbrü"]), [3])
+        self.assertEqual(self._ids(["BONN", "rhein"]), [2])
+        self.assertEqual(self._ids(["universite"]), [4])
+        self.assertEqual(self._ids(["mediterranee", "pont"]), [4])
+        self.assertEqual(self._ids(["bruxelles"]), [])
+
+    def test_sites_are_found_within_a_box_or_radius(self):
+        self.assertEqual(self._ids(box=(50.73, 7.10, 50.74, 7.12)), [1, 2])
+        near = self.catalog.find_sites(near=(50.7528, 7.1052, 2))
+        self.assertEqual([site.site_id for site in near], [3, 1, 2])
+        self.assertLess(near[0].distance, near[1].distance)
+        self.assertEqual(self._ids(near=(43.6, 3.9, 10)), [4])
+
+    def test_sites_are_filtered_by_domain_and_means_of_transport(self):
+        self.assertEqual(self._ids(domain_id=1, means_of_transport=[MeansOfTransport.BIKE]), [1, 3])
+        site = self.catalog.find_sites(["kennedy"])[0]
+        self.assertEqual((site.public_id, site.domain_name, site.means_of_transport),
+                         (101, "Bonn", [MeansOfTransport.FOOT, MeansOfTransport.BIKE]))
+
+    def test_replacing_a_domain_drops_its_old_sites(self):
+        self.catalog.replace_domain(1, "Bonn", [_site(5, "Kennedybrücke Nord", 50.74, 7.11)])
+        self.assertEqual(self._ids(["kennedy"]), [5])
+        self.catalog.remove_domains({2})
+        self.assertEqual(self._ids(), [4])
+
+    def test_a_refresh_is_only_started_once_within_the_timeout(self):
+        self.assertTrue(self.catalog.claim_refresh(60, now=1000))
+        self.assertFalse(self.catalog.claim_refresh(60, now=1030))
+        self.assertTrue(self.catalog.claim_refresh(60, now=1061))
+
+    def test_distances_are_great_circle_distances(self):
+        self.assertAlmostEqual(distance(0, 0, 0, 1), 111.195, places=3)
+        self.assertAlmostEqual(distance(0, 179.5, 0, -179.5), 111.195, places=3)
+
+
+class FailingApiClient(ApiClient):
+    """
+    Fails to fetch the sites of domain 1.
+    """
+
+    def fetch_sites_in_domain(self, domain_id):
+        if domain_id == 1:
+            raise ApiError("Fetching sites in domain 1 failed")
+        return super().fetch_sites_in_domain(domain_id)
+
+
+class CatalogCommandsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.catalog = os.path.join(directory.name, "catalog.sqlite3")
+        self.server = start_stub_server(StubConfig(domains=2, sites_per_domain=3))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _find_sites(self, *words, **kwargs):
+        options = dict(words=list(words), domain_id=None, box=None, near=None, means_of_transport=None,
+                       catalog=self.catalog, max_age=24, no_refresh=False)
+        options.update(kwargs)
+        file = io.StringIO()
+        with patch.object(findsites, "_start_refresh") as start_refresh:
+            findsites.find_sites(file=file, **options)
+        return file.getvalue(), start_refresh
+
+    def test_sites_are_found_offline_after_an_update(self):
+        client = partial(ApiClient, api_url=self.server.api_url, domains_url=self.server.domains_url)
+        with patch.object(updatecatalog, "ApiClient", client), redirect_stderr(io.StringIO()):
+            updatecatalog.update_catalog(domain_ids=None, catalog=self.catalog, concurrency=2, cache_dir=None,
+                                         no_cache=True, rate=1000, max_attempts=1)
+        requests = self.server.requests
+        output, start_refresh = self._find_sites("domain", "2", near=(50.002, 7.002, 1))
+        self.assertEqual(output, (
+            '"id","public_id","domain_id","domain_name","name","latitude","longitude","means_of_transport",'
+            '"distance"\n'
+            '"2002","2002","2","Domain 2","Site 2002","50.002","7.002","bike","0.000"\n'
+            '"2001","2001","2","Domain 2","Site 2001","50.001","7.001","bike","0.132"\n'
+            '"2000","2000","2","Domain 2","Site 2000","50.0","7.0","bike","0.264"\n'))
+        self.assertEqual(self.server.requests, requests)
+        start_refresh.assert_not_called()
+
+    def test_failing_domains_do_not_stop_the_update(self):
+        client = partial(FailingApiClient, api_url=self.server.api_url, domains_url=self.server.domains_url)
+        with patch.object(updatecatalog, "ApiClient", client), redirect_stderr(io.StringIO()) as stderr, \
+                self.assertRaises(SystemExit):
+            updatecatalog.update_catalog(domain_ids=None, catalog=self.catalog, concurrency=2, cache_dir=None,
+                                         no_cache=True, rate=1000, max_attempts=1)
+        self.assertIn("Fetching sites in domain 1 failed", stderr.getvalue())
+        self.assertIn("1 domains with 3 sites updated, 1 failed", stderr.getvalue())
+        with Catalog(self.catalog) as catalog:
+            self.assertEqual(sorted(site.site_id for site in catalog.find_sites([])), [2000, 2001, 2002])
+            self.assertIsNone(catalog.refreshed())
+
+    def test_stale_catalogs_are_refreshed_in_the_background(self):
+        with Catalog(self.catalog) as catalog:
+            catalog.mark_refreshed(now=0)
+        with redirect_stderr(io.StringIO()) as stderr:
+            _, start_refresh = self._find_sites()
+            _, start_refresh_again = self._find_sites()
+        start_refresh.assert_called_once_with(self.catalog)
+        start_refresh_again.assert_not_called()
+        self.assertIn("refreshing in the background", stderr.getvalue())
+
+    def test_missing_catalogs_are_an_error(self):
+        with self.assertRaises(SystemExit) as context:
+            self._find_sites()
+        self.assertIn("update-catalog", str(context.exception.code))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from datetime import date
+from functools import partial
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, StepSize
+from trafficdatafetcher.commands import crawl
+from trafficdatafetcher.jobqueue import DONE, FAILED, PENDING, RUNNING, JobQueue
+from trafficdatafetcher.writers import OutputFormat
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(os.path.join(self.directory.name, "queue.sqlite3"))
+
+    def tearDown(self):
+        self.queue.close()
+        self.directory.cleanup()
+
+    def test_tasks_are_claimed_in_order_and_only_queued_once(self):
+        self.queue.put("site", {"site_id": 1})
+        self.queue.put("site", {"site_id": 2})
+        self.queue.put("site", {"site_id": 1})
+        self.assertEqual(self.queue.claim().payload, {"site_id": 1})
+        self.assertEqual(self.queue.claim().payload, {"site_id": 2})
+        self.assertIsNone(self.queue.claim())
+
+    def test_completing_a_task_queues_its_follow_ups(self):
+        self.queue.put("domain", {"domain_id": 1})
+        task = self.queue.claim()
+        self.queue.complete(task, [("site", {"site_id": 1}), ("site", {"site_id": 2})])
+        self.assertEqual(self.queue.counts(), {PENDING: 2, RUNNING: 0, DONE: 1, FAILED: 0})
+
+    def test_resume_queues_running_and_failed_tasks_again(self):
+        for site_id in range(3):
+            self.queue.put("site", {"site_id": site_id})
+        self.queue.fail(self.queue.claim(), "error")
+        self.queue.claim()
+        self.queue.resume()
+        task = self.queue.claim()
+        self.assertEqual((task.payload, task.attempts), ({"site_id": 0}, 2))
+        self.assertEqual(self.queue.counts(), {PENDING: 2, RUNNING: 1, DONE: 0, FAILED: 0})
+
+    def test_parameters_of_the_first_run_are_kept(self):
+        self.assertEqual(self.queue.parameters({"step_size": "hour"}), {"step_size": "hour"})
+        self.assertEqual(self.queue.parameters({"step_size": "day"}), {"step_size": "hour"})
+        self.queue.clear()
+        self.assertEqual(self.queue.parameters({"step_size": "day"}), {"step_size": "day"})
+
+
+class CrawlTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = start_stub_server(StubConfig(domains=2, sites_per_domain=2,
+                                                   channels_per_site=2))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def _crawl(self, step_size=StepSize.HOUR, refresh=False):
+        client = partial(ApiClient, api_url=self.server.api_url,
+                         domains_url=self.server.domains_url)
+        with patch.object(crawl, "ApiClient", client):
+            crawl.crawl(domain_ids=None, all_domains=True, output_dir=self.directory.name,
+                        output_format=OutputFormat.CSV, step_size=step_size,
+                        begin=date(2023, 6, 1), end=date(2024, 3, 1), concurrency=4,
+                        cache_dir=None, no_cache=True, rate=1000, max_attempts=1, refresh=refresh)
+
+    def _files(self):
+        return sorted(str(path.relative_to(self.directory.name))
+                      for path in Path(self.directory.name).rglob("*.csv"))
+
+    def test_each_window_of_each_channel_is_stored_in_a_file(self):
+        self._crawl()
+        files = self._files()
+        self.assertEqual(len(files), 2 * 2 * 2 * 2)
+        self.assertEqual(files[:2], [
+            os.path.join("1", "1000", "100000", "2023-06-01_2024-01-01.csv"),
+            os.path.join("1", "1000", "100000", "2024-01-01_2024-03-01.csv"),
+        ])
+        with open(os.path.join(self.directory.name, files[0]), encoding="UTF-8") as file:
+            self.assertEqual(file.readline(),
+                             '"counter_id","channel_id","means_of_transport","direction","timestamp","count"\n')
+            self.assertEqual(file.readline(), '"1000","100000","bike","in","2023-06-01 00:00:00","0"\n')
+
+    def test_failed_crawl_is_resumed(self):
+        self.server.config.fail_every = 5
+        with self.assertRaises(SystemExit):
+            self._crawl()
+        first_run_requests = self.server.requests
+        self.server.config.fail_every = 0
+        self._crawl()
+        self.assertEqual(len(self._files()), 16)
+        # A complete crawl takes 23 requests: the list of domains, 2 domains,
+        # 4 sites and 16 windows. Only failed tasks and the sites whose
+        # tokens are needed are fetched again:
+        self.assertLess(self.server.requests - first_run_requests, 23 - 5)
+
+    def test_completed_crawl_is_not_repeated(self):
+        self._crawl()
+        requests = self.server.requests
+        self._crawl()
+        # Only the list of domains is fetched again:
+        self.assertEqual(self.server.requests - requests, 1)
+
+    def test_refreshed_crawl_is_repeated(self):
+        self._crawl()
+        requests = self.server.requests
+        self._crawl(refresh=True)
+        self.assertEqual(self.server.requests - requests, 23)
+
+    def test_crawl_is_not_resumed_with_other_parameters(self):
+        self._crawl()
+        with self.assertRaises(SystemExit) as raised:
+            self._crawl(step_size=StepSize.DAY)
+        self.assertIn("step_size hour", str(raised.exception))
+        self._crawl(step_size=StepSize.DAY, refresh=True)
+
+    def test_tasks_failing_with_other_errors_are_resumed(self):
+        with patch.object(crawl._Crawler, "_write", side_effect=OSError("disk full")):
+            with self.assertRaises(SystemExit):
+                self._crawl()
+        self.assertEqual(self._files(), [])
+        self._crawl()
+        self.assertEqual(len(self._files()), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import unittest
+from unittest import TestCase
+
+from trafficdatafetcher.apiclient import Direction
+from trafficdatafetcher.csvutils import open_csv
+from trafficdatafetcher.timeseries import TimeSeries
+from trafficdatafetcher.timestamps import NO_OFFSET
+
+
+def _write(columns, values, timestamps, offsets, counts, series, date_format=None):
+    file = io.StringIO()
+    writer = open_csv(file, columns, timestamp_columns=["timestamp"])
+    if series:
+        writer.writeseries(values, timestamps, offsets, counts, date_format)
+    else:
+        for timestamp, offset, count in zip(timestamps, offsets, counts):
+            writer.writerow(dict(values, timestamp=(timestamp, offset, date_format), count=count))
+    return file.getvalue()
+
+
+class CsvUtilsTest(TestCase):
+    def assertSeriesWrittenLikeRows(self, columns, values, timestamps, offsets, counts, date_format=None):
+        rows = _write(columns, values, timestamps, offsets, counts, False, date_format)
+        self.assertEqual(_write(columns, values, timestamps, offsets, counts, True, date_format), rows)
+        return rows
+
+    def test_series_are_written_like_rows(self):
+        rows = self.assertSeriesWrittenLikeRows(
+            ["id", "direction", "name", "timestamp", "count"],
+            {"id": 1, "direction": Direction.IN, "name": 'Pont "100%", {Nord}'},
+            [1704067200, 1704070800, 1704074400], [3600, 3600, NO_OFFSET], [5, None, 0])
+        self.assertEqual(rows, (
+            '"id","direction","name","timestamp","count"\n'
+            '"1","in","Pont ""100%"", {Nord}","2024-01-01T01:00:00+0100","5"\n'
+            '"1","in","Pont ""100%"", {Nord}","2024-01-01T02:00:00+0100",""\n'
+            '"1","in","Pont ""100%"", {Nord}","2024-01-01 02:00:00","0"\n'))
+
+    def test_dates_are_written_in_their_original_format(self):
+        for dates in (["2024-01-01T01:00:00+01:00", "2024-01-01T02:00:00+01:00"],
+                      ["2024-01-01T00:00:00Z", "2024-01-01T01:00:00Z"]):
+            with self.subTest(dates=dates):
+                series = TimeSeries.from_samples([{"date": value, "comptage": 1} for value in dates])
+                rows = self.assertSeriesWrittenLikeRows(["id", "timestamp", "count"], {"id": 1}, series.timestamps,
+                                                        series.offsets, [1, 1], series.date_format)
+                self.assertEqual(rows, '"id","timestamp","count"\n'
+                                       + "".join(f'"1","{value}","1"\n' for value in dates))
+
+    def test_counts_may_precede_the_timestamps(self):
+        self.assertSeriesWrittenLikeRows(["count", "id", "timestamp", "note"], {"id": 2, "note": None},
+                                         [0, 900], [0, 0], [1, 2])
+
+    def test_written_rows_are_left_unchanged(self):
+        row = {"id": 1, "timestamp": (0, 0), "count": 1}
+        open_csv(io.StringIO(), ["id", "timestamp", "count"], timestamp_columns=["timestamp"]).writerow(row)
+        self.assertEqual(row, {"id": 1, "timestamp": (0, 0), "count": 1})
+
+    def test_series_need_a_single_timestamp_and_count_column(self):
+        with self.assertRaises(ValueError):
+            _write(["id", "timestamp", "count"], {}, [0], [0], [1], series=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from datetime import date, timedelta
+from unittest import TestCase
+
+from trafficdatafetcher.apiclient import StepSize
+from trafficdatafetcher.daterange import split_date_range
+
+
+class SplitDateRangeTest(TestCase):
+    def test_quarter_of_an_hour_is_split_into_months(self):
+        self.assertEqual(split_date_range(date(2024, 1, 15), date(2024, 3, 10),
+                                          StepSize.QUARTER_OF_AN_HOUR), [
+            (date(2024, 1, 15), date(2024, 2, 1)),
+            (date(2024, 2, 1), date(2024, 3, 1)),
+            (date(2024, 3, 1), date(2024, 3, 10)),
+        ])
+
+    def test_hour_is_split_into_years(self):
+        self.assertEqual(split_date_range(date(2022, 6, 1), date(2024, 1, 1),
+                                          StepSize.HOUR), [
+            (date(2022, 6, 1), date(2023, 1, 1)),
+            (date(2023, 1, 1), date(2024, 1, 1)),
+        ])
+
+    def test_coarse_step_sizes_are_not_split(self):
+        self.assertEqual(split_date_range(date(2020, 1, 1), date(2024, 1, 1),
+                                          StepSize.DAY),
+                         [(date(2020, 1, 1), date(2024, 1, 1))])
+
+    def test_range_without_begin_is_not_split(self):
+        self.assertEqual(split_date_range(None, date(2024, 1, 1), StepSize.HOUR),
+                         [(None, date(2024, 1, 1))])
+
+    def test_first_day_is_used_if_begin_is_missing(self):
+        self.assertEqual(split_date_range(None, date(2024, 2, 1), StepSize.QUARTER_OF_AN_HOUR,
+                                          first_day=date(2023, 12, 1)), [
+            (date(2023, 12, 1), date(2024, 1, 1)),
+            (date(2024, 1, 1), date(2024, 2, 1)),
+        ])
+
+    def test_open_range_ends_after_today(self):
+        windows = split_date_range(date.today(), None, StepSize.HOUR)
+        self.assertEqual(windows, [(date.today(), date.today() + timedelta(days=1))])
+
+    def test_empty_range_has_no_windows(self):
+        self.assertEqual(split_date_range(date(2024, 1, 1), date(2024, 1, 1),
+                                          StepSize.HOUR), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
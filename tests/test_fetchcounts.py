@@ -14,10 +14,48 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import gzip
+import io
+import os
+import tempfile
+import time
 import unittest
+from contextlib import redirect_stderr
+from datetime import date
 from unittest import TestCase
+from unittest.mock import patch
 
+from trafficdatafetcher.apiclient import ApiError, StepSize, Direction, MeansOfTransport
 from trafficdatafetcher.commands import fetchcounts
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.metrics import Metrics
+from trafficdatafetcher.partitions import Partition
+from trafficdatafetcher.ratelimit import RequestStatistics
+from trafficdatafetcher.timeseries import TimeSeries
+from trafficdatafetcher.writers import OutputFormat, open_writer
+
+
+def _merge(*timeseries):
+    merged = fetchcounts._merge_timeseries(*map(TimeSeries.from_samples, timeseries))
+    return merged.to_samples()
+
+
+def _read(path):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="UTF-8") as file:
+            return file.read()
+    with open(path, encoding="UTF-8") as file:
+        return file.read()
+
+
+def _read_partitions(directory):
+    return {os.path.relpath(os.path.join(parent, name), directory): _read(os.path.join(parent, name))
+            for parent, _, names in os.walk(directory) for name in names}
+
+
+def _hours(begin, end, count=1):
+    return [{"date": f"2024-01-01 {hour:02d}:00:00", "comptage": count}
+            for hour in range(begin, end)]
 
 
 class FetchCountsTest(TestCase):
@@ -34,7 +72,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 03:00:00", "comptage": 200},
             {"date": "2024-01-01 04:00:00", "comptage": 2000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 3},
             {"date": "2024-01-01 02:00:00", "comptage": 30},
@@ -55,7 +93,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 10:00:00", "comptage": 200},
             {"date": "2024-01-01 11:00:00", "comptage": 2000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 10},
@@ -79,7 +117,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 03:00:00", "comptage": 200},
             {"date": "2024-01-01 04:00:00", "comptage": 2000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 2},
             {"date": "2024-01-01 02:00:00", "comptage": 20},
@@ -103,7 +141,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 06:00:00", "comptage": 200},
             {"date": "2024-01-01 08:00:00", "comptage": 2000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 2},
@@ -125,7 +163,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 02:00:00", "comptage": 20},
             {"date": "2024-01-01 03:00:00", "comptage": 200}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 30},
@@ -143,7 +181,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 03:00:00", "comptage": 100},
             {"date": "2024-01-01 04:00:00", "comptage": 1000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 30},
@@ -164,7 +202,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 05:00:00", "comptage": 200},
             {"date": "2024-01-01 06:00:00", "comptage": 2000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 10},
@@ -181,7 +219,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 04:00:00", "comptage": 1000}
         ]
         data2 = []
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 10},
@@ -197,7 +235,7 @@ class FetchCountsTest(TestCase):
             {"date": "2024-01-01 03:00:00", "comptage": 100},
             {"date": "2024-01-01 04:00:00", "comptage": 1000}
         ]
-        merged = fetchcounts._merge_timeseries(data1, data2)
+        merged = _merge(data1, data2)
         self.assertEqual(merged, [
             {"date": "2024-01-01 01:00:00", "comptage": 1},
             {"date": "2024-01-01 02:00:00", "comptage": 10},
@@ -208,9 +246,427 @@ class FetchCountsTest(TestCase):
     def test_return_empty_array_if_both_are_empty(self):
         data1 = []
         date2 = []
-        merged = fetchcounts._merge_timeseries(data1, date2)
+        merged = _merge(data1, date2)
         self.assertEqual(merged, [])
 
+    def test_three_arrays_are_merged_in_one_pass(self):
+        data1 = [
+            {"date": "2024-01-01 01:00:00", "comptage": 1},
+            {"date": "2024-01-01 03:00:00", "comptage": 10}
+        ]
+        data2 = [
+            {"date": "2024-01-01 02:00:00", "comptage": 2},
+            {"date": "2024-01-01 03:00:00", "comptage": 20}
+        ]
+        data3 = [
+            {"date": "2024-01-01 01:00:00", "comptage": 3},
+            {"date": "2024-01-01 04:00:00", "comptage": 30}
+        ]
+        merged = _merge(data1, data2, data3)
+        self.assertEqual(merged, [
+            {"date": "2024-01-01 01:00:00", "comptage": 4},
+            {"date": "2024-01-01 02:00:00", "comptage": 2},
+            {"date": "2024-01-01 03:00:00", "comptage": 30},
+            {"date": "2024-01-01 04:00:00", "comptage": 30}
+        ])
+
+    def test_repeated_dates_are_summed_by_occurrence(self):
+        # Local times repeat when daylight saving time ends:
+        data1 = [
+            {"date": "2024-10-27 02:00:00", "comptage": 1},
+            {"date": "2024-10-27 02:00:00", "comptage": 10},
+            {"date": "2024-10-27 03:00:00", "comptage": 100}
+        ]
+        data2 = [
+            {"date": "2024-10-27 02:00:00", "comptage": 2},
+            {"date": "2024-10-27 03:00:00", "comptage": 200}
+        ]
+        data3 = [
+            {"date": "2024-10-27 02:00:00", "comptage": 3},
+            {"date": "2024-10-27 02:00:00", "comptage": 30}
+        ]
+        merged = _merge(data1, data2, data3)
+        self.assertEqual(merged, [
+            {"date": "2024-10-27 02:00:00", "comptage": 6},
+            {"date": "2024-10-27 02:00:00", "comptage": 40},
+            {"date": "2024-10-27 03:00:00", "comptage": 300}
+        ])
+
+    def test_dates_with_offsets_are_merged_in_chronological_order(self):
+        data1 = [
+            {"date": "2024-10-27T02:30:00+0200", "comptage": 1},
+            {"date": "2024-10-27T02:30:00+0100", "comptage": 10}
+        ]
+        data2 = [
+            {"date": "2024-10-27T02:15:00+0100", "comptage": 2}
+        ]
+        merged = _merge(data1, data2)
+        self.assertEqual(merged, [
+            {"date": "2024-10-27T02:30:00+0200", "comptage": 1},
+            {"date": "2024-10-27T02:15:00+0100", "comptage": 2},
+            {"date": "2024-10-27T02:30:00+0100", "comptage": 10}
+        ])
+
+    def test_sum_is_missing_if_any_count_is_missing(self):
+        data1 = [
+            {"date": "2024-01-01 01:00:00", "comptage": 1},
+            {"date": "2024-01-01 02:00:00", "comptage": None}
+        ]
+        data2 = [
+            {"date": "2024-01-01 01:00:00", "comptage": None},
+            {"date": "2024-01-01 02:00:00", "comptage": 2},
+            {"date": "2024-01-01 03:00:00", "comptage": None}
+        ]
+        merged = _merge(data1, data2)
+        self.assertEqual(merged, [
+            {"date": "2024-01-01 01:00:00", "comptage": None},
+            {"date": "2024-01-01 02:00:00", "comptage": None},
+            {"date": "2024-01-01 03:00:00", "comptage": None}
+        ])
+
+    def test_windows_of_different_length_are_merged(self):
+        channel1 = [TimeSeries.from_samples(_hours(0, 3)), TimeSeries(),
+                    TimeSeries.from_samples(_hours(3, 12))]
+        channel2 = [TimeSeries.from_samples(_hours(begin, begin + 2, 10))
+                    for begin in range(1, 11, 2)]
+        merged = TimeSeries()
+        for chunk in fetchcounts._merge_windows(channel1, channel2):
+            merged.extend(chunk)
+        self.assertEqual(merged.to_samples(),
+                         _hours(0, 1) + _hours(1, 11, 11) + _hours(11, 12))
+
+    def test_repeated_dates_are_merged_across_windows(self):
+        channel1 = [TimeSeries.from_samples(_hours(0, 2) + _hours(1, 2)),
+                    TimeSeries.from_samples(_hours(2, 3))]
+        channel2 = [TimeSeries.from_samples(_hours(0, 2)),
+                    TimeSeries.from_samples(_hours(1, 3))]
+        merged = TimeSeries()
+        for chunk in fetchcounts._merge_windows(channel1, channel2):
+            merged.extend(chunk)
+        self.assertEqual(merged.to_samples(),
+                         _hours(0, 2, 2) + _hours(1, 3, 2))
+
+    def test_new_samples_hold_back_uncounted_samples_across_windows(self):
+        windows = [
+            TimeSeries.from_samples(_hours(0, 3)),
+            TimeSeries.from_samples(_hours(3, 5, None)),
+            TimeSeries.from_samples(_hours(5, 6) + _hours(6, 8, None)),
+        ]
+        new_marks = {}
+        samples = TimeSeries()
+        for chunk in fetchcounts._new_samples([(1, "2024-01-01 00:00:00", windows)], new_marks):
+            samples.extend(chunk)
+        self.assertEqual(samples.to_samples(),
+                         _hours(1, 3) + _hours(3, 5, None) + _hours(5, 6))
+        self.assertEqual(new_marks, {1: "2024-01-01 05:00:00"})
+
+    def test_shard_chunks_are_written_per_window(self):
+        windows = [TimeSeries.from_samples(_hours(0, 2)), TimeSeries.from_samples(_hours(2, 3, None))]
+        series = {(MeansOfTransport.BIKE, Direction.IN): [(1, None, windows)]}
+        batch = fetchcounts._ChunkBatch()
+        fetchcounts._save_series(7, series, batch, None, StepSize.HOUR, [StepSize.HOUR], Metrics())
+        self.assertEqual([len(chunk.timestamps) for chunk in batch.chunks], [2, 1])
+        text = io.StringIO()
+        with open_writer(OutputFormat.CSV, text, fetchcounts.output_columns([StepSize.HOUR]),
+                         fetchcounts.COLUMN_TYPES, True) as writer:
+            fetchcounts._write_chunks(writer, batch.chunks, Metrics())
+        self.assertEqual(text.getvalue(), (
+            '"counter_id","means_of_transport","direction","timestamp","count"\n'
+            '"7","bike","in","2024-01-01 00:00:00","1"\n'
+            '"7","bike","in","2024-01-01 01:00:00","1"\n'
+            '"7","bike","in","2024-01-01 02:00:00",""\n'))
+
+
+
+class FakeApiClient:
+    def __init__(self, **kwargs):
+        self.statistics = RequestStatistics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def fetch_site(self, site_id):
+        return {
+            "domaine": 1,
+            "token": "token",
+            "channels": [
+                {"id": site_id * 10 + 1, "sens": Direction.OUT.value, "userType": MeansOfTransport.BIKE.value},
+                {"id": site_id * 10 + 2, "sens": Direction.IN.value, "userType": MeansOfTransport.FOOT.value},
+                {"id": site_id * 10 + 3, "sens": Direction.IN.value, "userType": MeansOfTransport.BIKE.value},
+            ]
+        }
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        # Later channels answer faster to shuffle the completion order:
+        time.sleep(0.002 * (40 - channel_id % 40))
+        return [{"date": "2024-01-01 01:00:00", "comptage": channel_id}]
+
+
+class GrowingApiClient(FakeApiClient):
+    """
+    Returns a channel whose samples after the first `available` samples
+    have no counts yet.
+    """
+    available = 0
+    requested_begins = []
+    requested_step_sizes = []
+
+    def fetch_site(self, site_id):
+        return {
+            "domaine": 1,
+            "token": "token",
+            "channels": [{"id": 1, "sens": Direction.IN.value, "userType": MeansOfTransport.BIKE.value}]
+        }
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        GrowingApiClient.requested_begins.append(begin)
+        GrowingApiClient.requested_step_sizes.append(step_size)
+        if begin is not None and begin > date(2024, 1, 1):
+            return []
+        return [{"date": f"2024-01-01 {hour:02d}:00:00",
+                 "comptage": hour if hour < self.available else None}
+                for hour in range(6)]
+
+
+class LaggingApiClient(GrowingApiClient):
+    """
+    Returns two channels counting the same means of transport in the same
+    direction, whose second channel delivers its counts an hour later.
+    """
+
+    def fetch_site(self, site_id):
+        return {
+            "domaine": 1,
+            "token": "token",
+            "channels": [{"id": channel_id, "sens": Direction.IN.value, "userType": MeansOfTransport.BIKE.value}
+                         for channel_id in (1, 2)]
+        }
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        if begin is not None and begin > date(2024, 1, 1):
+            return []
+        available = self.available - channel_id + 1
+        return [{"date": f"2024-01-01 {hour:02d}:00:00",
+                 "comptage": hour if hour < available else None}
+                for hour in range(6)]
+
+
+class DomainApiClient(FakeApiClient):
+    """
+    Returns a domain with a site counting bikes, a site counting cars, a
+    site without known means of transport and a site which is not public.
+    """
+    requested_sites = []
+
+    def fetch_sites_in_domain(self, domain_id):
+        return [
+            {"lienPublic": 1, "pratique": [{"pratique": MeansOfTransport.BIKE.value}]},
+            {"lienPublic": 2, "pratique": [{"pratique": MeansOfTransport.CAR.value}],
+             "mainPratique": MeansOfTransport.CAR.value},
+            {"lienPublic": 3, "pratique": []},
+            {"lienPublic": None, "pratique": [{"pratique": MeansOfTransport.BIKE.value}]},
+        ]
+
+    def fetch_site(self, site_id):
+        DomainApiClient.requested_sites.append(site_id)
+        return super().fetch_site(site_id)
+
+
+class FetchDataTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "counts.csv")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _fetch(self, concurrency=1, api_client=FakeApiClient, site_ids=(3, 1, 2),
+               incremental=False, step_sizes=(StepSize.HOUR,), domain_id=None,
+               means_of_transport=tuple(MeansOfTransport), processes=1, partition_by=None):
+        with patch.object(fetchcounts, "ApiClient", api_client):
+            fetchcounts.fetch_data(domain_id=domain_id, site_ids=None if domain_id else list(site_ids),
+                                   step_sizes=list(step_sizes), file=self.file,
+                                   output_format=OutputFormat.CSV,
+                                   begin=None, end=None,
+                                   direction=list(Direction),
+                                   means_of_transport=list(means_of_transport),
+                                   concurrency=concurrency,
+                                   incremental=incremental, state_file=None,
+                                   cache_dir=None, no_cache=True, rate=1000,
+                                   max_attempts=1, store=None, engine=Engine.THREADS, metrics_file=None,
+                                   processes=processes, partition_by=partition_by)
+        if partition_by:
+            return _read_partitions(self.file)
+        return _read(self.file)
+
+    def test_concurrent_fetch_writes_rows_in_site_and_series_order(self):
+        self.assertEqual(self._fetch(4), (
+            '"counter_id","means_of_transport","direction","timestamp","count"\n'
+            '"3","foot","in","2024-01-01 01:00:00","32"\n'
+            '"3","bike","in","2024-01-01 01:00:00","33"\n'
+            '"3","bike","out","2024-01-01 01:00:00","31"\n'
+            '"1","foot","in","2024-01-01 01:00:00","12"\n'
+            '"1","bike","in","2024-01-01 01:00:00","13"\n'
+            '"1","bike","out","2024-01-01 01:00:00","11"\n'
+            '"2","foot","in","2024-01-01 01:00:00","22"\n'
+            '"2","bike","in","2024-01-01 01:00:00","23"\n'
+            '"2","bike","out","2024-01-01 01:00:00","21"\n'))
+
+    def test_concurrent_fetch_matches_sequential_fetch(self):
+        self.assertEqual(self._fetch(1), self._fetch(8))
+
+    def test_sharded_fetch_matches_sequential_fetch(self):
+        self.assertEqual(self._fetch(2, processes=2, site_ids=range(1, 8)), self._fetch(1, site_ids=range(1, 8)))
+
+    def test_sharded_fetch_advances_the_marks(self):
+        first = self._fetch(processes=2, incremental=True)
+        self.assertEqual(self._fetch(processes=2, incremental=True), first)
+
+    def test_incremental_fetch_appends_only_new_samples(self):
+        GrowingApiClient.requested_begins = []
+        GrowingApiClient.available = 2
+        self._fetch(api_client=GrowingApiClient, site_ids=[1], incremental=True)
+        GrowingApiClient.available = 4
+        self.assertEqual(self._fetch(api_client=GrowingApiClient, site_ids=[1], incremental=True), (
+            '"counter_id","means_of_transport","direction","timestamp","count"\n'
+            '"1","bike","in","2024-01-01 00:00:00","0"\n'
+            '"1","bike","in","2024-01-01 01:00:00","1"\n'
+            '"1","bike","in","2024-01-01 02:00:00","2"\n'
+            '"1","bike","in","2024-01-01 03:00:00","3"\n'))
+        self.assertEqual(GrowingApiClient.requested_begins[:2], [None, date(2024, 1, 1)])
+
+    def test_incremental_fetch_waits_for_the_counts_of_all_channels(self):
+        LaggingApiClient.available = 3
+        self._fetch(api_client=LaggingApiClient, site_ids=[1], incremental=True)
+        LaggingApiClient.available = 5
+        self.assertEqual(self._fetch(api_client=LaggingApiClient, site_ids=[1], incremental=True), (
+            '"counter_id","means_of_transport","direction","timestamp","count"\n'
+            '"1","bike","in","2024-01-01 00:00:00","0"\n'
+            '"1","bike","in","2024-01-01 01:00:00","2"\n'
+            '"1","bike","in","2024-01-01 02:00:00","4"\n'
+            '"1","bike","in","2024-01-01 03:00:00","6"\n'))
+
+    def test_incremental_fetch_appends_to_compressed_files(self):
+        def fetch_twice():
+            GrowingApiClient.available = 2
+            self._fetch(api_client=GrowingApiClient, site_ids=[1], incremental=True)
+            GrowingApiClient.available = 4
+            return self._fetch(api_client=GrowingApiClient, site_ids=[1], incremental=True)
+
+        expected = fetch_twice()
+        self.file += ".gz"
+        self.assertEqual(fetch_twice(), expected)
+
+    def test_rows_are_written_into_a_file_per_partition(self):
+        header = '"counter_id","means_of_transport","direction","timestamp","count"\n'
+        self.file = os.path.join(self.directory.name, "counts")
+        with redirect_stderr(io.StringIO()):
+            partitions = self._fetch(site_ids=[3, 1], partition_by=[Partition.MONTH, Partition.SITE])
+            sharded_partitions = self._fetch(site_ids=[3, 1], partition_by=[Partition.MONTH, Partition.SITE],
+                                             processes=2)
+        self.assertEqual(partitions, {
+            os.path.join("month=2024-01", "site=3", "counts.csv"): header + (
+                '"3","foot","in","2024-01-01 01:00:00","32"\n'
+                '"3","bike","in","2024-01-01 01:00:00","33"\n'
+                '"3","bike","out","2024-01-01 01:00:00","31"\n'),
+            os.path.join("month=2024-01", "site=1", "counts.csv"): header + (
+                '"1","foot","in","2024-01-01 01:00:00","12"\n'
+                '"1","bike","in","2024-01-01 01:00:00","13"\n'
+                '"1","bike","out","2024-01-01 01:00:00","11"\n'),
+        })
+        self.assertEqual(sharded_partitions, partitions)
+
+    def test_coarser_step_sizes_are_summed_up_from_finest(self):
+        GrowingApiClient.requested_step_sizes = []
+        GrowingApiClient.available = 6
+        self.assertEqual(self._fetch(api_client=GrowingApiClient, site_ids=[1],
+                                     step_sizes=[StepSize.DAY, StepSize.HOUR]), (
+            '"counter_id","means_of_transport","direction","step_size","timestamp","count"\n'
+            '"1","bike","in","hour","2024-01-01 00:00:00","0"\n'
+            '"1","bike","in","hour","2024-01-01 01:00:00","1"\n'
+            '"1","bike","in","hour","2024-01-01 02:00:00","2"\n'
+            '"1","bike","in","hour","2024-01-01 03:00:00","3"\n'
+            '"1","bike","in","hour","2024-01-01 04:00:00","4"\n'
+            '"1","bike","in","hour","2024-01-01 05:00:00","5"\n'
+            '"1","bike","in","day","2024-01-01 00:00:00","15"\n'))
+        self.assertEqual(GrowingApiClient.requested_step_sizes, [StepSize.HOUR])
+
+    def test_sites_counting_none_of_the_means_of_transport_are_not_requested(self):
+        DomainApiClient.requested_sites = []
+        with redirect_stderr(io.StringIO()) as stderr:
+            self.assertEqual(self._fetch(api_client=DomainApiClient, domain_id=1,
+                                         means_of_transport=[MeansOfTransport.BIKE]), (
+                '"counter_id","means_of_transport","direction","timestamp","count"\n'
+                '"1","bike","in","2024-01-01 01:00:00","13"\n'
+                '"1","bike","out","2024-01-01 01:00:00","11"\n'
+                '"3","bike","in","2024-01-01 01:00:00","33"\n'
+                '"3","bike","out","2024-01-01 01:00:00","31"\n'))
+        self.assertEqual(DomainApiClient.requested_sites, [1, 3])
+        self.assertIn("pruning: 1 of 3 public sites count none of the selected means of transport and are "
+                      "skipped, 2 sites are fetched", stderr.getvalue())
+
+
+class FlakyApiClient(FakeApiClient):
+    """
+    Fails the first request for each window in 2024.
+    """
+    requested_windows = []
+
+    def fetch_site(self, site_id):
+        return {
+            "domaine": 1,
+            "token": "token",
+            "date": "2023-11-01",
+            "channels": [{"id": 1, "sens": Direction.IN.value, "userType": MeansOfTransport.BIKE.value}]
+        }
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        window = (begin, end)
+        FlakyApiClient.requested_windows.append(window)
+        if begin.year == 2024 and FlakyApiClient.requested_windows.count(window) == 1:
+            raise ApiError("Service unavailable")
+        return [{"date": f"{begin} 00:00:00", "comptage": 1}]
+
+
+class FetchWindowsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "counts.csv")
+        FlakyApiClient.requested_windows = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_failed_windows_are_retried_on_their_own(self):
+        with patch.object(fetchcounts, "ApiClient", FlakyApiClient), \
+                patch.object(fetchcounts, "WINDOW_RETRY_DELAY", 0):
+            fetchcounts.fetch_data(domain_id=None, site_ids=[1],
+                                   step_sizes=[StepSize.QUARTER_OF_AN_HOUR],
+                                   file=self.file,
+                                   output_format=OutputFormat.CSV, begin=None,
+                                   end=date(2024, 2, 1),
+                                   direction=list(Direction),
+                                   means_of_transport=list(MeansOfTransport),
+                                   concurrency=4, incremental=False,
+                                   state_file=None, cache_dir=None,
+                                   no_cache=True, rate=1000, max_attempts=1, store=None,
+                                   engine=Engine.THREADS, metrics_file=None)
+        self.assertEqual(sorted(FlakyApiClient.requested_windows), [
+            (date(2023, 11, 1), date(2023, 12, 1)),
+            (date(2023, 12, 1), date(2024, 1, 1)),
+            (date(2024, 1, 1), date(2024, 2, 1)),
+            (date(2024, 1, 1), date(2024, 2, 1)),
+        ])
+        with open(self.file, encoding="UTF-8") as file:
+            self.assertEqual(file.read(), (
+                '"counter_id","means_of_transport","direction","timestamp","count"\n'
+                '"1","bike","in","2023-11-01 00:00:00","1"\n'
+                '"1","bike","in","2023-12-01 00:00:00","1"\n'
+                '"1","bike","in","2024-01-01 00:00:00","1"\n'))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,100 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import time
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+from trafficdatafetcher.apiclient import MeansOfTransport
+from trafficdatafetcher.commands import listsites
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.ratelimit import RequestStatistics
+
+
+class FakeApiClient:
+    fetched_site_ids = []
+
+    def __init__(self, **kwargs):
+        self.statistics = RequestStatistics()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def fetch_sites_in_domain(self, domain_id):
+        # Every third site is not public:
+        return [{
+            "idPdc": site_id,
+            "nom": f"Site {site_id}",
+            "lat": 50.0,
+            "lon": 7.0,
+            "lienPublic": None if site_id % 3 == 0 else site_id + 100,
+            "pratique": [{"pratique": MeansOfTransport.BIKE.value}],
+            "mainPratique": MeansOfTransport.BIKE.value,
+            "publicMessage": None,
+        } for site_id in range(1, 10)]
+
+    def fetch_site(self, site_id, with_token=True):
+        FakeApiClient.fetched_site_ids.append(site_id)
+        # Later sites answer faster to shuffle the completion order:
+        time.sleep(0.002 * (120 - site_id))
+        return {
+            "idPdc": site_id,
+            "domaine": 1,
+            "titre": f"Public site {site_id}",
+            "latitude": 50.0,
+            "longitude": 7.0,
+            "directionIn": "North",
+            "directionOut": "South",
+            "nbPratiques": 1,
+            "pratique": MeansOfTransport.BIKE.value,
+            "date": "2020-01-01 00:00:00",
+            "message": None,
+        }
+
+
+class ListSitesTest(TestCase):
+    def _list_sites(self, concurrency, domain_id=None, site_ids=None):
+        FakeApiClient.fetched_site_ids = []
+        file = io.StringIO()
+        with patch.object(listsites, "ApiClient", FakeApiClient):
+            listsites.list_sites(domain_id=domain_id, site_ids=site_ids, file=file,
+                                 concurrency=concurrency, cache_dir=None,
+                                 no_cache=True, rate=1000, max_attempts=1, engine=Engine.THREADS, metrics_file=None)
+        return [line.split(",")[2] for line in file.getvalue().splitlines()[1:]]
+
+    def test_sites_in_domain_are_listed_in_domain_order(self):
+        self.assertEqual(self._list_sites(concurrency=4, domain_id=1), [
+            '"Public site 101"', '"Public site 102"', '"Site 3"',
+            '"Public site 104"', '"Public site 105"', '"Site 6"',
+            '"Public site 107"', '"Public site 108"', '"Site 9"'])
+
+    def test_only_public_sites_are_fetched(self):
+        self._list_sites(concurrency=4, domain_id=1)
+        self.assertEqual(sorted(FakeApiClient.fetched_site_ids),
+                         [101, 102, 104, 105, 107, 108])
+
+    def test_sites_are_listed_in_the_given_order(self):
+        self.assertEqual(self._list_sites(concurrency=3, site_ids=[3, 1, 2]), [
+            '"Public site 3"', '"Public site 1"', '"Public site 2"'])
+
+
+if __name__ == '__main__':
+    unittest.main()
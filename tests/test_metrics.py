@@ -0,0 +1,135 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher import apiclient
+from trafficdatafetcher.apiclient import ApiClient
+from trafficdatafetcher.metrics import Metrics, percentile
+
+
+class FakeClock:
+    def __init__(self, *times):
+        self.times = iter(times)
+
+    def __call__(self):
+        return next(self.times)
+
+
+class MetricsTest(TestCase):
+    def test_percentiles_use_the_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([3], 0.99), 3)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_stages_are_summed_up_per_site(self):
+        metrics = Metrics(clock=FakeClock(0, 1, 10, 12, 20, 24))
+        with metrics.timed("write", site_id=1):
+            pass
+        with metrics.timed("write", site_id=1):
+            pass
+        with metrics.timed("write", site_id=2):
+            pass
+        metrics.record_stage("decode", 0.5)
+        metrics.record_stage("decode", 0.25)
+        self.assertEqual([tuple(record) for record in metrics.stages()],
+                         [("decode", None, 0.5), ("decode", None, 0.25), ("write", 1, 3), ("write", 2, 4)])
+
+    def test_records_are_moved_to_other_metrics(self):
+        worker = Metrics()
+        worker.record_request("site", 200, 100, 0, 0.1)
+        worker.record_stage("write", 1.0, site_id=1)
+        worker.record_stage("decode", 0.5)
+        metrics = Metrics()
+        metrics.record_stage("write", 2.0, site_id=1)
+        metrics.add(*worker.take())
+        self.assertEqual(worker.requests, [])
+        self.assertEqual(worker.stages(), [])
+        self.assertEqual(len(metrics.requests), 1)
+        self.assertEqual([tuple(record) for record in metrics.stages()], [("decode", None, 0.5), ("write", 1, 3.0)])
+
+    def test_summary_has_a_row_per_endpoint_and_stage(self):
+        metrics = Metrics()
+        metrics.record_request("site", 200, 100, 0, 0.1)
+        metrics.record_request("site", 200, 100, 2, 0.3)
+        metrics.record_request("channel", 503, 0, 4, 0.2)
+        metrics.record_stage("parse", 1.5, site_id=1)
+        summary = {row.name: row for row in metrics.summary()}
+        self.assertEqual(list(summary), ["request site", "request channel", "parse"])
+        self.assertEqual(summary["request site"].count, 2)
+        self.assertAlmostEqual(summary["request site"].total, 0.4)
+        self.assertEqual(summary["request site"].quantiles, {0.5: 0.1, 0.95: 0.3, 0.99: 0.3})
+
+    def test_metrics_are_saved_as_prometheus_text(self):
+        metrics = Metrics()
+        metrics.record_request("site", 200, 100, 1, 0.5)
+        metrics.record_request("site", None, 0, 4, 2.0)
+        metrics.record_stage("write", 0.25, site_id=1)
+        text = metrics.to_prometheus()
+        self.assertIn('trafficdatafetcher_request_seconds{endpoint="site",quantile="0.5"} 0.5\n', text)
+        self.assertIn('trafficdatafetcher_request_seconds_count{endpoint="site"} 2\n', text)
+        self.assertIn('trafficdatafetcher_response_bytes_total{endpoint="site"} 100\n', text)
+        self.assertIn('trafficdatafetcher_request_retries_total{endpoint="site"} 5\n', text)
+        self.assertIn('trafficdatafetcher_responses_total{endpoint="site",status="none"} 1\n', text)
+        self.assertIn('trafficdatafetcher_stage_seconds_sum{stage="write"} 0.25\n', text)
+
+    def test_file_format_depends_on_the_suffix(self):
+        metrics = Metrics()
+        metrics.record_request("site", 200, 100, 0, 0.5)
+        with tempfile.TemporaryDirectory() as directory:
+            json_file = os.path.join(directory, "metrics.json")
+            prometheus_file = os.path.join(directory, "metrics.prom")
+            metrics.save(json_file)
+            metrics.save(prometheus_file)
+            with open(json_file, encoding="UTF-8") as file:
+                saved = json.load(file)
+            with open(prometheus_file, encoding="UTF-8") as file:
+                text = file.read()
+        self.assertEqual(saved["requests"], [
+            {"endpoint": "site", "status": 200, "size": 100, "retries": 0, "seconds": 0.5}])
+        self.assertEqual(saved["summary"][0]["p99"], 0.5)
+        self.assertTrue(text.startswith("# HELP trafficdatafetcher_request_seconds"))
+
+
+@patch.object(apiclient, "backoff_delay", lambda attempt: 0)
+class ApiClientMetricsTest(TestCase):
+    def setUp(self):
+        self.server = start_stub_server(StubConfig(fail_every=2))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_requests_are_recorded_with_their_retries(self):
+        metrics = Metrics()
+        with ApiClient(api_url=self.server.api_url, metrics=metrics) as client:
+            client.fetch_site(1000)
+            client.fetch_sites_in_domain(1)
+        self.assertEqual([(request.endpoint, request.status, request.retries) for request in metrics.requests],
+                         [("site", 200, 0), ("sites_in_domain", 200, 1)])
+        self.assertTrue(all(request.size > 0 and request.seconds > 0 for request in metrics.requests))
+        self.assertEqual(len([record for record in metrics.stages() if record.stage == "decode"]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from trafficdatafetcher.arrowutils import ColumnType
+from trafficdatafetcher.partitions import Partition, PartitionedWriter, partitions
+from trafficdatafetcher.writers import Compression, OutputFormat
+
+try:
+    import pyarrow.dataset
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ["site_id", "timestamp", "count"]
+
+COLUMN_TYPES = {
+    "site_id": ColumnType.INT64,
+    "timestamp": ColumnType.TIMESTAMP,
+    "count": ColumnType.INT32,
+}
+
+HEADER = '"site_id","timestamp","count"\n'
+
+# 2024-01-31 23:00:00 UTC, which is in February at an offset of one hour:
+END_OF_JANUARY = 1706742000
+
+
+class PartitionedWriterTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _open(self, partition_by, output_format=OutputFormat.CSV, **kwargs):
+        return PartitionedWriter(self.directory, partition_by, output_format, COLUMNS, COLUMN_TYPES, "site_id",
+                                 **kwargs)
+
+    def _read(self, *path):
+        with gzip.open(os.path.join(self.directory, *path), "rt", encoding="UTF-8") as file:
+            return file.read()
+
+    def test_series_are_split_by_the_months_of_their_local_dates(self):
+        with self._open([Partition.SITE, Partition.MONTH], compression=Compression.GZIP) as writer:
+            writer.writeseries({"site_id": 1}, [END_OF_JANUARY - 3600, END_OF_JANUARY], [3600, 3600], [1, None])
+            writer.writerow({"site_id": 2, "timestamp": (END_OF_JANUARY, 0), "count": 3})
+        self.assertEqual(self._read("site=1", "month=2024-01", "counts.csv.gz"),
+                         HEADER + '"1","2024-01-31T23:00:00+0100","1"\n')
+        self.assertEqual(self._read("site=1", "month=2024-02", "counts.csv.gz"),
+                         HEADER + '"1","2024-02-01T00:00:00+0100",""\n')
+        self.assertEqual(self._read("site=2", "month=2024-01", "counts.csv.gz"),
+                         HEADER + '"2","2024-01-31T23:00:00+0000","3"\n')
+
+    def test_csv_files_opened_again_are_appended_to(self):
+        with self._open([Partition.SITE], compression=Compression.GZIP, max_open_partitions=1) as writer:
+            for site_id, count in [(1, 1), (2, 2), (1, 3)]:
+                writer.writeseries({"site_id": site_id}, [0], [0], [count])
+        self.assertEqual(self._read("site=1", "counts.csv.gz"),
+                         HEADER + '"1","1970-01-01T00:00:00+0000","1"\n"1","1970-01-01T00:00:00+0000","3"\n')
+        with self._open([Partition.SITE], compression=Compression.GZIP, append=True) as writer:
+            writer.writeseries({"site_id": 2}, [0], [0], [4])
+            self.assertEqual(writer.files, 1)
+        self.assertEqual(self._read("site=2", "counts.csv.gz"),
+                         HEADER + '"2","1970-01-01T00:00:00+0000","2"\n"2","1970-01-01T00:00:00+0000","4"\n')
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet_files_opened_again_are_continued_in_new_files(self):
+        def write():
+            with self._open([Partition.SITE], OutputFormat.PARQUET, max_open_partitions=1) as writer:
+                for site_id, count in [(1, 1), (2, 2), (1, 3)]:
+                    writer.writeseries({"site_id": site_id}, [0], [0], [count])
+            return sorted(os.listdir(os.path.join(self.directory, "site=1")))
+
+        self.assertEqual(write(), ["counts-1.parquet", "counts.parquet"])
+        # Continuations of an earlier run are replaced:
+        self.assertEqual(write(), ["counts-1.parquet", "counts.parquet"])
+        table = pyarrow.dataset.dataset(self.directory, format="parquet", partitioning="hive").to_table()
+        self.assertEqual(sorted(zip(table.column("site").to_pylist(), table.column("count").to_pylist())),
+                         [(1, 1), (1, 3), (2, 2)])
+
+    def test_partitions_are_parsed_from_a_comma_separated_list(self):
+        self.assertEqual(partitions("month, site,month"), [Partition.MONTH, Partition.SITE])
+        with self.assertRaises(ValueError):
+            partitions("site,year")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr
+from datetime import date
+from functools import partial
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, ApiError, StepSize
+from trafficdatafetcher.commands import run
+from trafficdatafetcher.planner import RequestPlanner
+from trafficdatafetcher.ratelimit import RequestStatistics
+
+
+class CountingClient:
+    def __init__(self, fail=0):
+        self.statistics = RequestStatistics()
+        self.calls = []
+        self.fail = fail
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch_site(self, site_id):
+        self.calls.append(("site", site_id))
+        self.release.wait()
+        if self.fail:
+            self.fail -= 1
+            raise ApiError("failed")
+        return {"idPdc": site_id}
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        self.calls.append(("channel", channel_id, token))
+        return [{"date": "2024-01-01 00:00:00", "comptage": channel_id}]
+
+
+class RequestPlannerTest(TestCase):
+    def test_sites_are_fetched_once(self):
+        client = CountingClient()
+        planner = RequestPlanner(client)
+        self.assertEqual(planner.fetch_site(1), planner.fetch_site(1))
+        self.assertEqual(client.calls, [("site", 1)])
+        self.assertEqual((planner.requested, planner.fetched), (2, 1))
+
+    def test_concurrent_requests_wait_for_a_single_request(self):
+        client = CountingClient()
+        client.release.clear()
+        planner = RequestPlanner(client)
+        threads = [threading.Thread(target=planner.fetch_site, args=(1,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        client.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(client.calls, [("site", 1)])
+
+    def test_channel_data_is_only_kept_while_uses_are_planned(self):
+        client = CountingClient()
+        planner = RequestPlanner(client)
+        window = (date(2024, 1, 1), date(2024, 2, 1), StepSize.HOUR)
+        planner.plan_channel(1, 100, *window)
+        planner.plan_channel(1, 100, *window)
+        for token in ("a", "b", "c"):
+            planner.fetch_channel(1, 100, *window, token)
+        self.assertEqual(client.calls, [("channel", 100, "a"), ("channel", 100, "c")])
+
+    def test_failed_requests_are_sent_again(self):
+        client = CountingClient(fail=1)
+        planner = RequestPlanner(client)
+        with self.assertRaises(ApiError):
+            planner.fetch_site(1)
+        self.assertEqual(planner.fetch_site(1), {"idPdc": 1})
+        self.assertEqual(len(client.calls), 2)
+
+
+class RunTest(TestCase):
+    def setUp(self):
+        self.server = start_stub_server(StubConfig(domains=1, sites_per_domain=4, channels_per_site=2))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _run(self, *steps):
+        self._run_spec({"steps": [[str(argument) for argument in step] for step in steps]})
+
+    def _run_spec(self, steps):
+        spec = os.path.join(self.directory, "spec.json")
+        with open(spec, "w", encoding="UTF-8") as file:
+            json.dump(steps, file)
+        client = partial(ApiClient, api_url=self.server.api_url, domains_url=self.server.domains_url)
+        with patch.object(run, "ApiClient", client), redirect_stderr(io.StringIO()):
+            run.run(spec=spec, concurrency=4, cache_dir=None, no_cache=True, rate=1000, max_attempts=1,
+                    metrics_file=None)
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), encoding="UTF-8") as file:
+            return file.read()
+
+    def test_overlapping_steps_fetch_each_resource_once(self):
+        counts = ["-B", "2024-01-01", "-E", "2024-01-03", "-S", "day"]
+        self._run(["list-sites", "-d", 1, "-f", os.path.join(self.directory, "sites.csv")],
+                  ["list-sites", "-s", 1000, 1001, "-f", os.path.join(self.directory, "some-sites.csv")],
+                  ["fetch-counts", "-d", 1, "-f", os.path.join(self.directory, "domain.csv"), *counts],
+                  ["fetch-counts", "-s", 1002, 1002, "-f", os.path.join(self.directory, "site.csv"), *counts])
+        # One request for the domain, the sites and each of their channels:
+        self.assertEqual(self.server.requests, 1 + 4 + 4 * 2)
+        self.assertEqual(len(self._read("sites.csv").splitlines()), 1 + 4)
+        self.assertEqual(len(self._read("some-sites.csv").splitlines()), 1 + 2)
+        self.assertEqual(len(self._read("domain.csv").splitlines()), 1 + 4 * 2 * 2)
+        self.assertEqual(len(self._read("site.csv").splitlines()), 1 + 2 * 2 * 2)
+
+    def test_steps_must_be_lists_of_arguments(self):
+        with self.assertRaises(SystemExit) as context:
+            self._run_spec({"steps": ["list-sites -d 1"]})
+        self.assertIn("must be lists of arguments", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
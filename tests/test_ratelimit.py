@@ -0,0 +1,152 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pickle
+import socket
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher import apiclient
+from trafficdatafetcher.apiclient import ApiClient, ApiError
+from trafficdatafetcher.ratelimit import RateLimiter, RequestStatistics, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _limiter(self, rate, burst=None):
+        return RateLimiter(rate, burst, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_requests_wait_once_the_burst_is_used_up(self):
+        limiter = self._limiter(2, burst=2)
+        waits = [limiter.acquire() for _ in range(4)]
+        self.assertEqual(waits, [0, 0, 0.5, 0.5])
+
+    def test_rate_is_halved_when_slowing_down_and_recovers_slowly(self):
+        limiter = self._limiter(10)
+        limiter.slow_down()
+        limiter.slow_down()
+        self.assertEqual(limiter.rate, 2.5)
+        limiter.speed_up()
+        self.assertAlmostEqual(limiter.rate, 2.55)
+        for _ in range(100):
+            limiter.speed_up()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_rate_does_not_drop_to_zero(self):
+        limiter = self._limiter(32)
+        for _ in range(100):
+            limiter.slow_down()
+        self.assertEqual(limiter.rate, 1)
+
+    def test_pause_delays_all_requests(self):
+        limiter = self._limiter(10)
+        limiter.pause(3)
+        self.assertEqual(limiter.acquire(), 3)
+        self.assertEqual(limiter.acquire(), 0)
+
+
+class RequestStatisticsTest(TestCase):
+    def test_statistics_of_other_processes_are_merged(self):
+        other = RequestStatistics()
+        other.count_request(0.5)
+        other.count_retry(2.0, throttled=True)
+        other.count_backoff_of_request(2.0)
+        statistics = RequestStatistics()
+        statistics.count_request(0.25)
+        statistics.merge(pickle.loads(pickle.dumps(other)))
+        self.assertEqual((statistics.requests, statistics.retries, statistics.throttled, statistics.waited,
+                          statistics.backoff, statistics.max_backoff), (2, 1, 1, 0.75, 2.0, 2.0))
+
+
+class RetryAfterTest(TestCase):
+    def test_seconds_are_parsed(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+
+    def test_http_dates_are_parsed(self):
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+        self.assertAlmostEqual(parse_retry_after(format_datetime(retry_at)), 30, delta=2)
+
+    def test_invalid_values_are_ignored(self):
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+
+@patch.object(apiclient, "backoff_delay", lambda attempt: 0)
+class RetryingApiClientTest(TestCase):
+    def _start_server(self, **kwargs):
+        self.server = start_stub_server(StubConfig(**kwargs))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_failed_requests_are_retried(self):
+        self._start_server(fail_every=2)
+        with ApiClient(api_url=self.server.api_url) as client:
+            sites = [client.fetch_site(site_id) for site_id in (1000, 1001, 1002)]
+        self.assertEqual([site["idPdc"] for site in sites], [1000, 1001, 1002])
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual((client.statistics.requests, client.statistics.retries,
+                          client.statistics.throttled), (5, 2, 2))
+
+    def test_retry_after_is_honoured_and_slows_down(self):
+        self._start_server(fail_every=2, retry_after=0.05)
+        limiter = RateLimiter(1000)
+        with ApiClient(api_url=self.server.api_url, rate_limiter=limiter) as client:
+            client.fetch_site(1000)
+            client.fetch_site(1001)
+        self.assertAlmostEqual(client.statistics.backoff, 0.05)
+        self.assertAlmostEqual(client.statistics.max_backoff, 0.05)
+        self.assertLess(limiter.rate, 1000)
+
+    def test_requests_failing_too_often_raise_an_api_error(self):
+        self._start_server(fail_every=1)
+        with ApiClient(api_url=self.server.api_url, max_attempts=3) as client:
+            with self.assertRaises(ApiError):
+                client.fetch_site(1000)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_backoff_of_requests_failing_to_connect_is_counted(self):
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+        with patch.object(apiclient, "backoff_delay", lambda attempt: 0.01), \
+                ApiClient(api_url=f"http://127.0.0.1:{port}", max_attempts=3) as client:
+            with self.assertRaises(ApiError):
+                client.fetch_site(1000)
+        self.assertEqual(client.statistics.retries, 2)
+        self.assertAlmostEqual(client.statistics.max_backoff, 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from unittest import TestCase
+
+from trafficdatafetcher.apiclient import StepSize
+from trafficdatafetcher.resample import Resampler, fetched_step_size, resample
+from trafficdatafetcher.timeseries import TimeSeries
+
+
+def _quarters(days, first_day=1):
+    return TimeSeries.from_samples([
+        {"date": f"2024-01-{day:02d} {minute // 60:02d}:{minute % 60:02d}:00", "comptage": 1}
+        for day in range(first_day, first_day + days) for minute in range(0, 24 * 60, 15)])
+
+
+class ResampleTest(TestCase):
+    def test_quarters_are_summed_up_to_hours_and_days(self):
+        series = _quarters(2)
+        self.assertEqual(resample(series, StepSize.HOUR).to_samples()[:2], [
+            {"date": "2024-01-01 00:00:00", "comptage": 4},
+            {"date": "2024-01-01 01:00:00", "comptage": 4},
+        ])
+        self.assertEqual(resample(series, StepSize.DAY).to_samples(), [
+            {"date": "2024-01-01 00:00:00", "comptage": 96},
+            {"date": "2024-01-02 00:00:00", "comptage": 96},
+        ])
+
+    def test_weeks_begin_on_monday(self):
+        # January 1, 2024 is a Monday:
+        series = resample(_quarters(30), StepSize.DAY)
+        self.assertEqual(resample(series, StepSize.WEEK).to_samples(), [
+            {"date": "2024-01-01 00:00:00", "comptage": 7 * 96},
+            {"date": "2024-01-08 00:00:00", "comptage": 7 * 96},
+            {"date": "2024-01-15 00:00:00", "comptage": 7 * 96},
+            {"date": "2024-01-22 00:00:00", "comptage": 7 * 96},
+            {"date": "2024-01-29 00:00:00", "comptage": 2 * 96},
+        ])
+
+    def test_months_begin_on_first_day(self):
+        series = TimeSeries.from_samples([
+            {"date": "2024-01-31 00:00:00", "comptage": 1},
+            {"date": "2024-02-01 00:00:00", "comptage": 2},
+            {"date": "2024-02-29 00:00:00", "comptage": 3},
+            {"date": "2024-03-01 00:00:00", "comptage": 4},
+        ])
+        self.assertEqual(resample(series, StepSize.MONTH).to_samples(), [
+            {"date": "2024-01-01 00:00:00", "comptage": 1},
+            {"date": "2024-02-01 00:00:00", "comptage": 5},
+            {"date": "2024-03-01 00:00:00", "comptage": 4},
+        ])
+
+    def test_buckets_are_in_local_time(self):
+        series = TimeSeries.from_samples([
+            {"date": "2024-03-30T23:00:00+0100", "comptage": 1},
+            {"date": "2024-03-31T00:00:00+0100", "comptage": 2},
+            {"date": "2024-03-31T23:00:00+0200", "comptage": 3},
+            {"date": "2024-04-01T00:00:00+0200", "comptage": 4},
+        ])
+        self.assertEqual(resample(series, StepSize.DAY).to_samples(), [
+            {"date": "2024-03-30T00:00:00+0100", "comptage": 1},
+            {"date": "2024-03-31T00:00:00+0100", "comptage": 5},
+            {"date": "2024-04-01T00:00:00+0200", "comptage": 4},
+        ])
+
+    def test_sum_is_missing_if_any_count_is_missing(self):
+        series = TimeSeries.from_samples([
+            {"date": "2024-01-01 00:00:00", "comptage": 1},
+            {"date": "2024-01-01 01:00:00", "comptage": None},
+            {"date": "2024-01-02 00:00:00", "comptage": 2},
+        ])
+        self.assertEqual(resample(series, StepSize.DAY).to_samples(), [
+            {"date": "2024-01-01 00:00:00", "comptage": None},
+            {"date": "2024-01-02 00:00:00", "comptage": 2},
+        ])
+
+    def test_resampler_completes_buckets_across_chunks(self):
+        series = _quarters(20)
+        resampler = Resampler(StepSize.WEEK)
+        resampled = TimeSeries()
+        for begin in range(0, len(series), 1000):
+            resampled.extend(resampler.add(series[begin:begin + 1000]))
+        resampled.extend(resampler.flush())
+        self.assertEqual(resampled, resample(series, StepSize.WEEK))
+
+    def test_finest_step_size_is_fetched(self):
+        self.assertEqual(fetched_step_size([StepSize.MONTH, StepSize.HOUR, StepSize.DAY]), StepSize.HOUR)
+        self.assertEqual(fetched_step_size([StepSize.WEEK]), StepSize.WEEK)
+        self.assertEqual(fetched_step_size([StepSize.MONTH, StepSize.WEEK]), StepSize.DAY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr
+from datetime import date
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import ApiClient, ApiError, Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.service import ChannelBuffer, Poller, start_server
+from trafficdatafetcher.timeseries import TimeSeries
+from trafficdatafetcher.timestamps import parse_timestamp
+
+def _hours(begin, end, uncounted=0):
+    return [{"date": f"2024-01-01T{hour:02d}:00:00+0000", "comptage": None if hour >= end - uncounted else hour}
+            for hour in range(begin, end)]
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class PollingClient:
+    def __init__(self):
+        self.samples = []
+        self.tokens = iter(range(1000))
+        self.fail = False
+        self.requests = []
+
+    def fetch_site(self, site_id):
+        return {"domaine": 1, "token": next(self.tokens), "channels": [
+            {"id": 11, "sens": Direction.IN.value, "userType": MeansOfTransport.BIKE.value},
+            {"id": 12, "sens": Direction.OUT.value, "userType": MeansOfTransport.FOOT.value},
+        ]}
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        self.requests.append((channel_id, begin, end, token))
+        if self.fail:
+            raise ApiError("failed")
+        return self.samples
+
+
+class ChannelBufferTest(TestCase):
+    def test_polled_samples_replace_the_buffered_tail(self):
+        buffer = ChannelBuffer(4)
+        self.assertEqual(buffer.update(TimeSeries.from_samples(_hours(0, 3, uncounted=1))), 2)
+        self.assertEqual(buffer.update(TimeSeries.from_samples(_hours(1, 5))), 3)
+        self.assertEqual(buffer.samples().to_samples(), _hours(1, 5))
+        self.assertEqual(buffer.last_counted(), (parse_timestamp("2024-01-01T04:00:00+0000"), 0))
+
+    def test_samples_are_limited(self):
+        buffer = ChannelBuffer(10)
+        buffer.update(TimeSeries.from_samples(_hours(0, 6)))
+        self.assertEqual(buffer.samples(limit=2).to_samples(), _hours(4, 6))
+        self.assertEqual(buffer.samples(since=parse_timestamp("2024-01-01T03:00:00+0000")).to_samples(),
+                         _hours(4, 6))
+        self.assertEqual(buffer.samples(limit=0).to_samples(), [])
+
+
+class PollerTest(TestCase):
+    def setUp(self):
+        self.client = PollingClient()
+        self.clock = FakeClock(parse_timestamp("2024-01-01T06:10:00+0000"))
+        self.poller = Poller(self.client, [1], None, [StepSize.HOUR], list(Direction), [MeansOfTransport.BIKE],
+                             buffer_size=48, retry_interval=30, clock=self.clock, today=lambda: date(2024, 1, 1))
+        self.poller.refresh_sites()
+        self.channel = self.poller._channels[(11, StepSize.HOUR)]
+
+    def test_only_selected_channels_are_polled(self):
+        self.assertEqual([channel["channel_id"] for channel in self.poller.channels()], [11])
+
+    def test_channels_are_polled_when_their_next_sample_is_complete(self):
+        self.client.samples = _hours(0, 6)
+        self.poller.poll(self.channel)
+        self.assertEqual(self.client.requests, [(11, date(2023, 12, 30), date(2024, 1, 2), 0)])
+        # The sample of 06:00 is complete at 07:00:
+        self.assertEqual(self.channel.next_poll, parse_timestamp("2024-01-01T07:00:00+0000"))
+        self.clock.now = self.channel.next_poll
+        self.client.samples = _hours(5, 7)
+        self.poller.poll(self.channel)
+        self.assertEqual(self.client.requests[-1][1], date(2024, 1, 1))
+        self.assertEqual(self.channel.next_poll, parse_timestamp("2024-01-01T08:00:00+0000"))
+        self.assertEqual(len(self.channel.buffer), 7)
+
+    def test_overdue_channels_are_polled_with_growing_intervals(self):
+        self.client.samples = _hours(0, 4)
+        delays = []
+        for _ in range(7):
+            self.poller.poll(self.channel)
+            delays.append(self.channel.next_poll - self.clock.now)
+        # The interval is capped at a quarter of an hour:
+        self.assertEqual(delays, [30, 60, 120, 240, 480, 900, 900])
+        self.client.samples = _hours(3, 5)
+        self.poller.poll(self.channel)
+        self.assertEqual(self.channel.next_poll - self.clock.now, 30)
+
+    def test_sites_are_fetched_again_after_a_failed_poll(self):
+        self.client.fail = True
+        with redirect_stderr(io.StringIO()):
+            self.poller.poll(self.channel)
+        self.client.fail = False
+        self.poller.poll(self.channel)
+        self.assertEqual([request[3] for request in self.client.requests], [0, 1])
+        self.assertEqual(self.channel.next_poll - self.clock.now, 60)
+
+
+    def test_polls_failing_with_other_errors_are_retried_later(self):
+        self.client.samples = [{"date": "yesterday", "comptage": 1}]
+        with redirect_stderr(io.StringIO()) as stderr:
+            self.poller.poll(self.channel)
+        self.assertIn("polling channel 11 failed", stderr.getvalue())
+        self.assertEqual(self.channel.next_poll - self.clock.now, 30)
+
+
+class ServiceTest(TestCase):
+    def setUp(self):
+        self.stub = start_stub_server(StubConfig(sites_per_domain=2, channels_per_site=2))
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        self.client = ApiClient(api_url=self.stub.api_url)
+        self.addCleanup(self.client.close)
+        self.poller = Poller(self.client, None, 1, [StepSize.HOUR, StepSize.DAY], list(Direction),
+                             list(MeansOfTransport), buffer_size=24)
+        self.server = start_server(self.poller, "127.0.0.1", 0)
+        self.addCleanup(self.server.server_close)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+
+    def _get(self, path):
+        with urlopen(f"http://127.0.0.1:{self.server.server_address[1]}{path}") as response:
+            return json.load(response)
+
+    def _run_until_polled(self):
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            scheduler = threading.Thread(target=self.poller.run, args=(executor, stop))
+            scheduler.start()
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                channels = self.poller.channels()
+                if channels and all(channel["polled"] is not None for channel in channels):
+                    break
+                time.sleep(0.01)
+            stop.set()
+            self.poller.wake_up()
+            scheduler.join()
+
+    def test_latest_counts_are_served(self):
+        self._run_until_polled()
+        channels = self._get("/channels")
+        self.assertEqual(len(channels), 8)
+        self.assertTrue(all(channel["samples"] == 24 for channel in channels))
+        channel = self._get("/channels/100000/hour?limit=2")
+        self.assertEqual((channel["site_id"], channel["step_size"], len(channel["counts"])), (1000, "hour", 2))
+        self.assertEqual(channel["counts"][-1]["date"], channel["last_counted"])
+        self.assertNotIn("token", self._get("/sites/1000"))
+
+    def test_unknown_resources_are_not_found(self):
+        for path, status in [("/channels/1/hour", 404), ("/sites/1", 404), ("/channels/1/year", 400),
+                             ("/channels/100000/hour?limit=x", 400)]:
+            with self.assertRaises(HTTPError) as context:
+                self._get(path)
+            self.assertEqual(context.exception.code, status, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+
+from trafficdatafetcher.apiclient import StepSize, Direction, MeansOfTransport
+from trafficdatafetcher.commands import export, fetchcounts
+from trafficdatafetcher.commands.common import Engine
+from trafficdatafetcher.commands.listsites import Columns as SiteColumns
+from trafficdatafetcher.store import SampleStore
+from trafficdatafetcher.timeseries import TimeSeries
+from trafficdatafetcher.timestamps import DateFormat
+from trafficdatafetcher.writers import OutputFormat
+from tests.test_fetchcounts import FakeApiClient
+
+
+def _series(counts, begin=0):
+    return TimeSeries.from_samples([{"date": f"2024-01-01 {hour:02d}:00:00", "comptage": count}
+                                    for hour, count in enumerate(counts, begin)])
+
+
+class SampleStoreTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SampleStore(os.path.join(self.directory.name, "store.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def _upsert(self, counter_id, channel_id, series, direction=Direction.IN,
+                means_of_transport=MeansOfTransport.BIKE, step_size=StepSize.HOUR):
+        self.store.upsert_channel(step_size, counter_id, channel_id, means_of_transport,
+                                  direction, series)
+
+    def _counts(self, **kwargs):
+        return [row[5] for row in self.store.query_counts(StepSize.HOUR, **kwargs)]
+
+    def test_stored_samples_are_replaced(self):
+        self._upsert(1, 11, _series([1, 2, None]))
+        self._upsert(1, 11, _series([3, 4], begin=1))
+        self.assertEqual(self._counts(), [1, 3, 4])
+
+    def test_channels_with_same_direction_are_summed(self):
+        self._upsert(1, 11, _series([1, 2, 3]))
+        self._upsert(1, 12, _series([10, None, 30]))
+        self._upsert(1, 13, _series([100, 200, 300]), direction=Direction.OUT)
+        self.assertEqual(list(self.store.query_counts(StepSize.HOUR)), [
+            (1, MeansOfTransport.BIKE.value, Direction.IN.value, 1704067200, -2 ** 31, 11, None),
+            (1, MeansOfTransport.BIKE.value, Direction.IN.value, 1704070800, -2 ** 31, None, None),
+            (1, MeansOfTransport.BIKE.value, Direction.IN.value, 1704074400, -2 ** 31, 33, None),
+            (1, MeansOfTransport.BIKE.value, Direction.OUT.value, 1704067200, -2 ** 31, 100, None),
+            (1, MeansOfTransport.BIKE.value, Direction.OUT.value, 1704070800, -2 ** 31, 200, None),
+            (1, MeansOfTransport.BIKE.value, Direction.OUT.value, 1704074400, -2 ** 31, 300, None),
+        ])
+
+    def test_query_is_filtered(self):
+        self._upsert(1, 11, TimeSeries.from_samples([
+            {"date": "2023-12-31T23:00:00+0100", "comptage": 1},
+            {"date": "2024-01-01T00:00:00+0100", "comptage": 2},
+            {"date": "2024-01-01T23:00:00+0100", "comptage": 3},
+            {"date": "2024-01-02T00:00:00+0100", "comptage": 4},
+        ]))
+        self._upsert(1, 12, _series([5]), means_of_transport=MeansOfTransport.FOOT)
+        self._upsert(1, 11, _series([6]), step_size=StepSize.DAY)
+        self._upsert(2, 21, _series([7]), direction=Direction.OUT)
+        self.store.upsert_site({SiteColumns.ID: 2, SiteColumns.DOMAIN_ID: 20})
+
+        self.assertEqual(self._counts(counter_ids=[1], begin=date(2024, 1, 1), end=date(2024, 1, 2),
+                                      means_of_transport=[MeansOfTransport.BIKE]), [2, 3])
+        self.assertEqual(self._counts(counter_ids=[1], directions=[Direction.IN]), [5, 1, 2, 3, 4])
+        self.assertEqual(self._counts(domain_id=20), [7])
+        self.assertEqual(self._counts(domain_id=10), [])
+
+    def test_repeated_dates_without_offset_are_kept(self):
+        dates = ["2024-10-27 01:00:00", "2024-10-27 02:00:00", "2024-10-27 02:00:00", "2024-10-27 03:00:00"]
+        for channel_id in (11, 12):
+            self._upsert(1, channel_id, TimeSeries.from_samples([{"date": value, "comptage": count}
+                                                                 for count, value in enumerate(dates, 1)]))
+        self.assertEqual(self._counts(), [2, 4, 6, 8])
+
+    def test_stores_without_occurrence_are_migrated(self):
+        path = os.path.join(self.directory.name, "old.sqlite")
+        with sqlite3.connect(path) as connection:
+            connection.execute("""
+                CREATE TABLE samples (
+                    counter_id INTEGER NOT NULL, channel_id INTEGER NOT NULL, step_size INTEGER NOT NULL,
+                    timestamp INTEGER NOT NULL, utc_offset INTEGER NOT NULL, count INTEGER,
+                    PRIMARY KEY (counter_id, channel_id, step_size, timestamp)
+                ) WITHOUT ROWID""")
+            connection.execute("INSERT INTO samples VALUES (1, 11, ?, 1704067200, ?, 5)",
+                               (StepSize.HOUR.value, -2 ** 31))
+        connection.close()
+        with SampleStore(path) as store:
+            store.upsert_channel(StepSize.HOUR, 1, 11, MeansOfTransport.BIKE, Direction.IN, _series([1], begin=1))
+        with SampleStore(path, read_only=True) as store:
+            self.assertEqual([row[5] for row in store.query_counts(StepSize.HOUR)], [5, 1])
+
+    def test_date_format_of_channels_is_stored(self):
+        self._upsert(1, 11, TimeSeries.from_samples([{"date": "2024-01-01T01:00:00.000+01:00", "comptage": 1}]))
+        self._upsert(1, 11, TimeSeries())
+        self.assertEqual([row[6] for row in self.store.query_counts(StepSize.HOUR)],
+                         [DateFormat("T", ".000", "+HH:MM")])
+
+    def test_stores_without_date_format_are_migrated(self):
+        path = os.path.join(self.directory.name, "old.sqlite")
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE channels (channel_id INTEGER PRIMARY KEY, counter_id INTEGER NOT NULL, "
+                               "means_of_transport INTEGER NOT NULL, direction INTEGER NOT NULL)")
+            connection.execute("INSERT INTO channels VALUES (11, 1, ?, ?)",
+                               (MeansOfTransport.BIKE.value, Direction.IN.value))
+        connection.close()
+        with SampleStore(path) as store:
+            store.upsert_channel(StepSize.HOUR, 1, 11, MeansOfTransport.BIKE, Direction.IN, _series([1]))
+        with SampleStore(path, read_only=True) as store:
+            self.assertEqual([row[5:] for row in store.query_counts(StepSize.HOUR)], [(1, None)])
+
+    def test_read_only_store_is_not_created(self):
+        path = os.path.join(self.directory.name, "missing.sqlite")
+        with self.assertRaises(sqlite3.OperationalError):
+            SampleStore(path, read_only=True)
+        self.assertFalse(os.path.exists(path))
+
+
+class SiteApiClient(FakeApiClient):
+    def fetch_site(self, site_id, with_token=True):
+        site = super().fetch_site(site_id)
+        site.update({
+            "idPdc": site_id,
+            "titre": f"Site {site_id}",
+            "latitude": 50.7,
+            "longitude": 7.1,
+            "directionIn": "Nord",
+            "directionOut": "Süd",
+            "nbPratiques": 2,
+            "pratique": MeansOfTransport.BIKE.value,
+            "date": "2020-01-01 00:00:00",
+            "message": "",
+        })
+        return site
+
+
+class FormattedApiClient(SiteApiClient):
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        return [{"date": "2024-01-01T01:00:00.000+01:00", "comptage": channel_id}]
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _read(self, name):
+        with open(os.path.join(self.directory.name, name), encoding="UTF-8") as file:
+            return file.read()
+
+    def _fetch(self, store, step_sizes, file=None, api_client=SiteApiClient):
+        with patch.object(fetchcounts, "ApiClient", api_client):
+            fetchcounts.fetch_data(domain_id=None, site_ids=[1, 2],
+                                   step_sizes=step_sizes, file=file,
+                                   output_format=OutputFormat.CSV,
+                                   begin=date(2024, 1, 1), end=date(2025, 1, 1),
+                                   direction=list(Direction),
+                                   means_of_transport=list(MeansOfTransport),
+                                   concurrency=1, incremental=False, state_file=None,
+                                   cache_dir=None, no_cache=True, rate=1000,
+                                   max_attempts=1, store=store, engine=Engine.THREADS, metrics_file=None)
+
+    def _export(self, store, step_size):
+        export.export(store=store, domain_id=1, site_ids=None,
+                      file=os.path.join(self.directory.name, "exported.csv"),
+                      output_format=OutputFormat.CSV, step_size=step_size,
+                      begin=None, end=None, direction=None, means_of_transport=None)
+        return self._read("exported.csv")
+
+    def test_export_matches_fetched_counts(self):
+        store = os.path.join(self.directory.name, "store.sqlite")
+        self._fetch(store, [StepSize.HOUR], os.path.join(self.directory.name, "fetched.csv"))
+        self.assertEqual(self._export(store, StepSize.HOUR), self._read("fetched.csv"))
+
+    def test_export_keeps_the_date_format_of_the_api(self):
+        store = os.path.join(self.directory.name, "store.sqlite")
+        self._fetch(store, [StepSize.HOUR], os.path.join(self.directory.name, "fetched.csv"), FormattedApiClient)
+        self.assertIn('"2024-01-01T01:00:00.000+01:00"', self._read("fetched.csv"))
+        self.assertEqual(self._export(store, StepSize.HOUR), self._read("fetched.csv"))
+
+    def test_coarser_step_sizes_are_stored(self):
+        store = os.path.join(self.directory.name, "store.sqlite")
+        self._fetch(store, [StepSize.HOUR, StepSize.WEEK])
+        self.assertEqual(self._export(store, StepSize.WEEK), (
+            '"counter_id","means_of_transport","direction","timestamp","count"\n'
+            '"1","foot","in","2024-01-01 00:00:00","12"\n'
+            '"1","bike","in","2024-01-01 00:00:00","13"\n'
+            '"1","bike","out","2024-01-01 00:00:00","11"\n'
+            '"2","foot","in","2024-01-01 00:00:00","22"\n'
+            '"2","bike","in","2024-01-01 00:00:00","23"\n'
+            '"2","bike","out","2024-01-01 00:00:00","21"\n'))
+        self.assertEqual(self._export(store, StepSize.DAY).count("\n"), 1)
+
+    def test_missing_store_is_not_exported(self):
+        store = os.path.join(self.directory.name, "store.sqlite")
+        with self.assertRaises(SystemExit):
+            self._export(store, StepSize.HOUR)
+        self.assertFalse(os.path.exists(store))
+
+
+if __name__ == '__main__':
+    unittest.main()
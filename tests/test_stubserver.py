@@ -0,0 +1,68 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import tempfile
+import unittest
+from datetime import date
+from unittest import TestCase
+
+from benchmarks.stubserver import StubConfig, start_stub_server
+from trafficdatafetcher.apiclient import API_URL, DOMAINS_URL, ApiClient, ApiError, StepSize, cache_key, \
+    channel_params
+from trafficdatafetcher.cache import ResponseCache
+
+
+class RecordedFixturesTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A cache written by a run against the real API:
+        recording = ResponseCache(directory.name)
+        recording.store(cache_key(DOMAINS_URL, None), [{"id": 7, "name": "Recorded"}], None)
+        recording.store(cache_key(f"{API_URL}/publicwebpage/7001", {"withNull": "true"}),
+                        {"idPdc": 7001, "titre": "Recorded site"}, None)
+        recording.store(cache_key(f"{API_URL}/publicwebpage/data/700101",
+                                  channel_params(7, date(2024, 1, 1), date(2024, 1, 2), StepSize.DAY)),
+                        [{"date": "2024-01-01 00:00:00", "comptage": 42}], None)
+        self.server = start_stub_server(StubConfig(fixtures=directory.name))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _client(self):
+        return ApiClient(api_url=self.server.api_url, domains_url=self.server.domains_url)
+
+    def test_recorded_payloads_are_replayed(self):
+        with self._client() as client:
+            self.assertEqual(client.fetch_domains(), [{"id": 7, "name": "Recorded"}])
+            site = client.fetch_site(7001)
+            self.assertEqual(site["titre"], "Recorded site")
+            # Sites are recorded without the token needed to fetch their
+            # channels:
+            self.assertEqual(site["token"], "recorded")
+            self.assertEqual(client.fetch_channel(7, 700101, date(2024, 1, 1), date(2024, 1, 2),
+                                                  StepSize.DAY, "token"),
+                             [{"date": "2024-01-01 00:00:00", "comptage": 42}])
+
+    def test_requests_which_were_not_recorded_fail(self):
+        with self._client() as client:
+            with self.assertRaises(ApiError):
+                client.fetch_site(1000)
+            with self.assertRaises(ApiError):
+                client.fetch_channel(7, 700101, date(2024, 1, 1), date(2024, 1, 3), StepSize.DAY, "token")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from datetime import datetime
+from unittest import TestCase
+
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries
+from trafficdatafetcher.timestamps import NO_OFFSET, DateFormat, date_format, format_date, format_dates, format_months, \
+    parse_date, parse_dates, _strptime_date
+
+
+class TimeSeriesTest(TestCase):
+    def test_samples_are_stored_in_arrays(self):
+        series = TimeSeries.from_samples([
+            {"date": "2024-01-01 01:00:00", "comptage": 1},
+            {"date": "2024-01-01T02:00:00+0100", "comptage": None},
+        ])
+        self.assertEqual(list(series.timestamps), [1704070800, 1704070800])
+        self.assertEqual(list(series.offsets), [NO_OFFSET, 3600])
+        self.assertEqual(list(series.counts), [1, NO_COUNT])
+
+    def test_samples_are_returned_in_the_format_of_the_api(self):
+        samples = [
+            {"date": "2024-10-27T02:30:00+0200", "comptage": 1},
+            {"date": "2024-10-27T02:30:00+0100", "comptage": None},
+            {"date": "2024-10-27T00:30:00-0330", "comptage": 3},
+            {"date": "2024-10-27 02:30:00", "comptage": 4},
+        ]
+        self.assertEqual(TimeSeries.from_samples(samples).to_samples(), samples)
+
+    def test_dates_are_returned_in_their_original_format(self):
+        for dates in (["2024-10-27T02:30:00+02:00", "2024-10-27T02:30:00+01:00"],
+                      ["2024-10-27T00:30:00Z", "2024-10-27T01:30:00Z"],
+                      ["2024-10-27T02:30:00.000+0200", "2024-10-27T02:30:00.000+0100"],
+                      ["2024-10-27T02:30:00", "2024-10-27T03:30:00"]):
+            with self.subTest(dates=dates):
+                samples = [{"date": value, "comptage": count} for count, value in enumerate(dates)]
+                series = TimeSeries.from_samples(samples)
+                self.assertEqual(series.to_samples(), samples)
+                self.assertEqual(series[1:].to_samples(), samples[1:])
+
+    def test_slices_are_timeseries(self):
+        series = TimeSeries.from_samples([
+            {"date": f"2024-01-01 0{hour}:00:00", "comptage": hour} for hour in range(4)
+        ])
+        self.assertEqual(series[1:3].to_samples(), [
+            {"date": "2024-01-01 01:00:00", "comptage": 1},
+            {"date": "2024-01-01 02:00:00", "comptage": 2},
+        ])
+
+
+class TimestampsTest(TestCase):
+    def test_dates_with_offset_without_colon_are_parsed(self):
+        self.assertEqual(parse_date("2024-01-01T01:00:00+0100"), (1704067200, 3600))
+
+    def test_dates_are_parsed_without_fromisoformat(self):
+        # Older versions of Python parse these dates with strptime:
+        for value in ("2024-01-01T01:00:00Z", "2024-01-01 01:00:00+0100", "2024-01-01 01:00:00.5+01:00",
+                      "2024-01-01T01:00:00.123+0100", "2024-01-01 01:00:00.12"):
+            with self.subTest(value=value):
+                self.assertEqual(_strptime_date(value), datetime.fromisoformat(value))
+        with self.assertRaises(ValueError):
+            _strptime_date("2024-01-01 25:00:00")
+
+    def test_dates_parsed_together_match_dates_parsed_on_their_own(self):
+        dates = [
+            "2024-10-27T02:30:00+0200",
+            "2024-10-27T02:30:00+0100",
+            "2024-10-27T00:30:00-03:30",
+            "2024-10-27T02:45:00Z",
+            "2024-10-27 02:30:00",
+            "2024-10-28 02:30:00",
+            "2024-10-27T02:30:00.750+0100",
+            "2024-10-27",
+        ]
+        timestamps, offsets = parse_dates(dates)
+        self.assertEqual(list(zip(timestamps, offsets)), [parse_date(value) for value in dates])
+
+    def test_invalid_dates_are_not_parsed_together(self):
+        with self.assertRaises(ValueError):
+            parse_dates(["2024-01-01 01:00:00", "2024-02-30 01:00:00"])
+        with self.assertRaises(ValueError):
+            parse_dates(["2024-01-01 25:00:00"])
+
+    def test_dates_are_formatted_with_their_offset(self):
+        self.assertEqual(format_date(1704067200, 3600), "2024-01-01T01:00:00+0100")
+        self.assertEqual(format_date(1704067200, NO_OFFSET), "2024-01-01 00:00:00")
+
+    def test_dates_formatted_together_match_dates_formatted_on_their_own(self):
+        dates = [(1729989000, 7200), (1729992600, 3600), (1729981800, -12600), (1729997100, 0),
+                 (1729996200, NO_OFFSET), (1730082600, NO_OFFSET), (-86399, 3600), (1704067200, 3600)]
+        timestamps, offsets = zip(*dates)
+        self.assertEqual(format_dates(timestamps, offsets), [format_date(*value) for value in dates])
+
+    def test_dates_in_the_format_of_the_api_have_no_format(self):
+        self.assertIsNone(date_format("2024-01-01T01:00:00+0100"))
+        self.assertIsNone(date_format("2024-01-01 01:00:00"))
+        self.assertEqual(date_format("2024-01-01T01:00:00+01:00"), DateFormat("T", "", "+HH:MM"))
+        self.assertEqual(date_format("2024-01-01T01:00:00.000Z"), DateFormat("T", ".000", "Z"))
+
+    def test_dates_are_formatted_in_their_format(self):
+        dates = ["2024-01-01T01:00:00+01:00", "2023-12-31T23:30:00-00:30", "2024-01-01T00:00:00Z",
+                 "2024-01-01T01:00:00.000+0100", "2024-01-01T00:00:00"]
+        for value in dates:
+            with self.subTest(date=value):
+                self.assertEqual(format_date(*parse_date(value), date_format(value)), value)
+                self.assertEqual(format_dates(*zip(parse_date(value)), date_format(value)), [value])
+
+    def test_months_are_the_months_of_the_local_dates(self):
+        self.assertEqual(format_months([1706745599, 1706745599, 1706745600], [0, 3600, NO_OFFSET]),
+                         ["2024-01", "2024-02", "2024-02"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from trafficdatafetcher.writers import Compression, open_output
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class CompressionTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _append(self, file, compression, text):
+        with open_output(file, True, False, compression) as (output, write_header):
+            if write_header:
+                output.write("header\n")
+            output.write(text)
+
+    def test_compression_is_taken_from_the_file_name(self):
+        self.assertEqual(Compression.from_file_name("counts.csv.gz"), Compression.GZIP)
+        self.assertEqual(Compression.from_file_name("counts.csv.zst"), Compression.ZSTD)
+        self.assertEqual(Compression.from_file_name("counts.csv"), Compression.NONE)
+
+    def test_appended_gzip_members_are_read_as_one_file(self):
+        file = os.path.join(self.directory, "counts.csv.gz")
+        self._append(file, Compression.GZIP, "1\n")
+        self._append(file, Compression.GZIP, "2\n")
+        with gzip.open(file, "rt", encoding="UTF-8") as compressed:
+            self.assertEqual(compressed.read(), "header\n1\n2\n")
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_appended_zstd_frames_are_read_as_one_file(self):
+        file = os.path.join(self.directory, "counts.csv.zst")
+        self._append(file, Compression.ZSTD, "1\n")
+        self._append(file, Compression.ZSTD, "2\n")
+        with zstandard.open(file, "rt", encoding="UTF-8") as compressed:
+            self.assertEqual(compressed.read(), "header\n1\n2\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
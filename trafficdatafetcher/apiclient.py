@@ -14,10 +14,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import time
 from datetime import date
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from trafficdatafetcher.jsonutils import loads
+from trafficdatafetcher.ratelimit import RequestStatistics, backoff_delay, parse_retry_after
 from trafficdatafetcher.types import EnumWithLowerCaseNames
 
 # Faking headers is only for "obscurity":
@@ -27,6 +31,16 @@ HEADERS = {
 
 DATE_FORMAT="%Y%m%d"
 
+API_URL = "https://www.eco-visio.net/api/aladdin/1.0.0/pbl"
+MAX_ATTEMPTS = 5
+REQUEST_TIMEOUT = 60
+# Responses which are worth retrying. The API throttles clients with 429
+# and 503 responses:
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+DOMAINS_URL = "https://gist.githubusercontent.com/cboehme/33d03f2de5add333c0217106cca35478/raw/6083f7519daa693c5e1a538cf7d7dead3533110c/domains.json"
+
 
 class StepSize(EnumWithLowerCaseNames):
     QUARTER_OF_AN_HOUR = 2
@@ -56,62 +70,246 @@ class MeansOfTransport(EnumWithLowerCaseNames):
     TRUCK = 14
 
 
-def fetch_domains():
+class ApiError(Exception):
+    pass
+
+
+def channel_params(domain_id, begin, end, step_size):
     """
-    Retrieves a list of all known domains.
+    Returns the query parameters for fetching the data of a channel.
     """
-    url = "https://gist.githubusercontent.com/cboehme/33d03f2de5add333c0217106cca35478/raw/6083f7519daa693c5e1a538cf7d7dead3533110c/domains.json"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"An error occurred while fetching domains: {e}")
-        return []
+    params = {"step": step_size.value, "domain": domain_id}
+    if begin is not None:
+        params["begin"] = begin.strftime(DATE_FORMAT)
+    if end is not None:
+        params["end"] = end.strftime(DATE_FORMAT)
+    params["withNull"] = "true"
+    return params
 
 
-def fetch_sites_in_domain(domain_id: int):
+def cache_key(url, params):
     """
-    Retrieves a list of all available counter sites in the given domain.
-    This list includes public counter sites as well as non-public sites.
-    Only data from public sites can be retrieved via the API.
+    Returns the key of a response in the cache: the url of the request.
     """
-    url = f"https://www.eco-visio.net/api/aladdin/1.0.0/pbl/publicwebpageplus/{domain_id}?withNull=true"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return []
+    return requests.Request("GET", url, params=params).prepare().url
 
 
-def fetch_site(site_id: int):
+def cached_payload(payload):
     """
-    Gets basic information about a counter site such as its position,
-    starting date of the collection, etc.
+    Returns the payload as it is stored in the cache or None if it is not
+    stored. Empty payloads, which the API returns for unknown sites, are
+    not stored. Session tokens are dropped as they change between sessions.
     """
-    url = f"https://www.eco-visio.net/api/aladdin/1.0.0/pbl/publicwebpage/{site_id}?withNull=true"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return {}
+    if not payload:
+        return None
+    if isinstance(payload, dict) and "token" in payload:
+        return {name: value for name, value in payload.items() if name != "token"}
+    return payload
 
 
-def fetch_channel(domain_id: int, channel_id: int, begin: date, end: date, step_size: StepSize, token: str):
+class ApiClient:
     """
-    Gets the data collected in a channel at counter site in a given time range.
+    Client for Eco Counter's API.
+
+    All requests are sent through a single session which keeps a pool of
+    connections alive per host. Connections are reused between requests so
+    that TCP and TLS handshakes are only paid once per pooled connection.
+    The pool blocks when all of its connections are in use, thus `pool_size`
+    also limits the number of concurrent requests per host.
+
+    Responses are stored in `cache` if one is provided.
+
+    Requests are paced by `rate_limiter` if one is provided. Requests which
+    fail with a server error, are throttled or cannot connect are retried
+    up to `max_attempts` times with exponential backoff. Throttled requests
+    wait at least as long as the Retry-After header asks for and slow down
+    the rate limiter. Requests which still fail raise an ApiError.
+
+    Requests and the time spent decoding their responses are recorded in
+    `metrics` if one is provided.
     """
-    begin_param = f"&begin={begin.strftime(DATE_FORMAT)}" if begin is not None else ""
-    end_param = f"&end={end.strftime(DATE_FORMAT)}" if end is not None else ""
-    url = f"https://www.eco-visio.net/api/aladdin/1.0.0/pbl/publicwebpage/data/{channel_id}?step={step_size.value}&domain={domain_id}{begin_param}{end_param}&withNull=true&t={token}"
-    try:
-        response = requests.get(url, headers=HEADERS)
+
+    def __init__(self, pool_size=1, keep_alive=True, cache=None,
+                 rate_limiter=None, max_attempts=MAX_ATTEMPTS,
+                 api_url=API_URL, domains_url=DOMAINS_URL, metrics=None):
+        self._api_url = api_url
+        self._domains_url = domains_url
+        self._cache = cache
+        self._rate_limiter = rate_limiter
+        self._max_attempts = max_attempts
+        self._metrics = metrics
+        self.statistics = RequestStatistics()
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive" if keep_alive else "close",
+        })
+        adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def fetch_domains(self):
+        """
+        Retrieves a list of all known domains.
+        """
+        try:
+            return self._get_json("domains", self._domains_url, ttl=self._metadata_ttl())
+        except (requests.RequestException, ValueError) as e:
+            raise ApiError(f"Fetching domains failed: {e}") from e
+
+    def fetch_sites_in_domain(self, domain_id: int):
+        """
+        Retrieves a list of all available counter sites in the given domain.
+        This list includes public counter sites as well as non-public sites.
+        Only data from public sites can be retrieved via the API.
+        """
+        url = f"{self._api_url}/publicwebpageplus/{domain_id}"
+        try:
+            return self._get_json("sites_in_domain", url, {"withNull": "true"}, HEADERS,
+                                  self._metadata_ttl())
+        except (requests.RequestException, ValueError) as e:
+            raise ApiError(f"Fetching sites in domain {domain_id} failed: {e}") from e
+
+    def fetch_site(self, site_id: int, with_token=True):
+        """
+        Gets basic information about a counter site such as its position,
+        starting date of the collection, etc. Raises an ApiError if the site
+        does not exist.
+
+        The site includes the token of the session which is needed to fetch
+        its channels. As tokens are not cached, sites are only taken from the
+        cache if with_token is false.
+        """
+        url = f"{self._api_url}/publicwebpage/{site_id}"
+        try:
+            site = self._get_json("site", url, {"withNull": "true"}, HEADERS,
+                                  self._metadata_ttl(), lookup=not with_token)
+        except (requests.RequestException, ValueError) as e:
+            raise ApiError(f"Fetching site {site_id} failed: {e}") from e
+        # The API answers with an empty response for unknown sites:
+        if not site:
+            raise ApiError(f"Site {site_id} does not exist")
+        # Sites without token are the same whether they are cached or not:
+        return site if with_token else cached_payload(site)
+
+    def fetch_channel(self, domain_id: int, channel_id: int, begin: date,
+                      end: date, step_size: StepSize, token: str):
+        """
+        Gets the data collected in a channel at counter site in a given time range.
+        Raises an ApiError if the data cannot be retrieved.
+        """
+        url = f"{self._api_url}/publicwebpage/data/{channel_id}"
+        params = channel_params(domain_id, begin, end, step_size)
+        try:
+            return self._get_json("channel", url, params, HEADERS,
+                                  self._counts_ttl(end), token)
+        except (requests.RequestException, ValueError) as e:
+            raise ApiError(f"Fetching channel {channel_id} failed: {e}") from e
+
+    def _metadata_ttl(self):
+        return self._cache.metadata_ttl if self._cache is not None else None
+
+    def _counts_ttl(self, end):
+        return self._cache.ttl_for_counts(end) if self._cache is not None else None
+
+    def _get_json(self, endpoint, url, params=None, headers=None, ttl=None, token=None, lookup=True):
+        """
+        Sends a GET request to the endpoint and decodes the JSON response.
+        The token is sent along with the parameters but is not part of the
+        cache key as it changes between sessions. Without lookup, the
+        response is stored in the cache but not taken from it.
+        """
+        key = cache_key(url, params)
+        entry = None
+        request_headers = dict(headers or {})
+        if self._cache is not None and lookup:
+            entry = self._cache.lookup(key)
+            if entry is not None and entry.is_fresh():
+                self._cache.count_hit()
+                return entry.payload
+            if entry is not None and entry.etag is not None:
+                request_headers["If-None-Match"] = entry.etag
+            if entry is not None and entry.last_modified is not None:
+                request_headers["If-Modified-Since"] = entry.last_modified
+
+        request_params = dict(params or {})
+        if token is not None:
+            request_params["t"] = token
+        response = self._send(endpoint, url, request_params, request_headers)
+
+        if entry is not None and response.status_code == 304:
+            self._cache.count_revalidated()
+            self._cache.store(key, entry.payload, ttl,
+                              response.headers.get("ETag", entry.etag),
+                              response.headers.get("Last-Modified", entry.last_modified))
+            return entry.payload
+
         response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return []
+        start = time.perf_counter()
+        payload = loads(response.content)
+        if self._metrics is not None:
+            self._metrics.record_stage("decode", time.perf_counter() - start)
+        if self._cache is not None:
+            self._cache.count_miss()
+            cached = cached_payload(payload)
+            if cached is not None:
+                self._cache.store(key, cached, ttl, response.headers.get("ETag"),
+                                  response.headers.get("Last-Modified"))
+        return payload
+
+    def _send(self, endpoint, url, params, headers):
+        """
+        Sends a GET request and retries it if it fails with a temporary
+        error. Returns the last response.
+        """
+        backoff = 0.0
+        attempt = 1
+        while True:
+            waited = self._rate_limiter.acquire() if self._rate_limiter is not None else 0.0
+            self.statistics.count_request(waited)
+            start = time.perf_counter()
+            try:
+                response = self._session.get(url, params=params, headers=headers,
+                                             timeout=REQUEST_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self._max_attempts:
+                    self._record_request(endpoint, None, 0, attempt, time.perf_counter() - start)
+                    self.statistics.count_backoff_of_request(backoff)
+                    raise
+                delay = backoff_delay(attempt)
+                throttled = False
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self._max_attempts:
+                    self._record_request(endpoint, response.status_code, len(response.content),
+                                         attempt, time.perf_counter() - start)
+                    self.statistics.count_backoff_of_request(backoff)
+                    if response.ok and self._rate_limiter is not None:
+                        self._rate_limiter.speed_up()
+                    return response
+                throttled = response.status_code in THROTTLE_STATUSES
+                delay = backoff_delay(attempt)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                    if self._rate_limiter is not None:
+                        # Other threads need to hold back as well:
+                        self._rate_limiter.pause(retry_after)
+            if self._rate_limiter is not None:
+                self._rate_limiter.slow_down()
+            self.statistics.count_retry(delay, throttled)
+            backoff += delay
+            time.sleep(delay)
+            attempt += 1
+
+    def _record_request(self, endpoint, status, size, attempts, seconds):
+        if self._metrics is not None:
+            self._metrics.record_request(endpoint, status, size, attempts - 1, seconds)
@@ -0,0 +1,186 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from enum import Enum, auto
+from itertools import islice, repeat
+
+ROW_GROUP_SIZE = 65536
+
+
+class ColumnType(Enum):
+    """
+    Types of columns in Parquet and Arrow files. Columns holding the members
+    of an enum are typed with the enum class instead. They are dictionary
+    encoded with the lower case names of the members as dictionary. Values
+    of timestamp columns are (timestamp, offset) pairs as returned by
+    `timestamps.parse_date`. The offset and date format are dropped.
+    """
+    INT32 = auto()
+    INT64 = auto()
+    FLOAT64 = auto()
+    BOOL = auto()
+    STRING = auto()
+    TIMESTAMP = auto()
+
+
+def open_parquet(file, columns, column_types, compression=None):
+    """
+    Opens a Parquet writer whose columns are compressed with the named
+    codec, or with the default codec of pyarrow if none is given.
+    """
+    pa = _import_pyarrow()
+    import pyarrow.parquet as pq
+    schema = _schema(pa, columns, column_types)
+    options = {} if compression is None else {"compression": compression}
+    return ArrowWriter(pq.ParquetWriter(file, schema, **options), schema,
+                       columns, column_types)
+
+
+def open_arrow(file, columns, column_types, compression=None):
+    """
+    Opens an Arrow writer whose record batches are compressed with the
+    named codec. Arrow files only support `zstd` and `lz4`.
+    """
+    pa = _import_pyarrow()
+    schema = _schema(pa, columns, column_types)
+    if compression == "none":
+        compression = None
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    return ArrowWriter(pa.ipc.new_file(file, schema, options=options),
+                       schema, columns, column_types)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        sys.exit("error: writing parquet or arrow files requires pyarrow. "
+                 "Install it with `pip install traffic-data-fetcher[arrow]`")
+    return pyarrow
+
+
+class ArrowWriter:
+    """
+    Collects rows and writes them as record batches of `row_group_size` rows
+    to a Parquet or Arrow writer. Each batch becomes a row group in Parquet
+    files.
+    """
+
+    def __init__(self, writer, schema, columns, column_types,
+                 row_group_size=ROW_GROUP_SIZE):
+        self._pa = _import_pyarrow()
+        self._writer = writer
+        self._schema = schema
+        self._columns = list(columns)
+        self._column_types = column_types
+        self._converters = [_converter(self._pa, column_types[column])
+                            for column in self._columns]
+        self._row_group_size = row_group_size
+        self._values = [[] for _ in self._columns]
+
+    def writerow(self, row):
+        for column, values in zip(self._columns, self._values):
+            values.append(row.get(column))
+        if len(self._values[0]) >= self._row_group_size:
+            self.flush()
+
+    def writeseries(self, values, timestamps, offsets, counts, date_format=None):
+        """
+        Writes a row for each sample of a series. The values of the columns
+        which are the same for all samples are given as dict. The remaining
+        timestamp column and count column take the timestamps, offsets and
+        counts of the samples. Counts are None if missing. Timestamps are
+        stored without their date format.
+        """
+        series = _series_columns(self._columns, self._column_types, values, timestamps, offsets, counts)
+        remaining = len(counts)
+        while remaining:
+            size = min(remaining, self._row_group_size - len(self._values[0]))
+            for column_values, column in zip(self._values, series):
+                column_values.extend(islice(column, size))
+            remaining -= size
+            if len(self._values[0]) >= self._row_group_size:
+                self.flush()
+
+    def flush(self):
+        if not self._values[0]:
+            return
+        arrays = [convert(values)
+                  for convert, values in zip(self._converters, self._values)]
+        table = self._pa.Table.from_arrays(arrays, schema=self._schema)
+        self._writer.write_table(table)
+        self._values = [[] for _ in self._columns]
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def _series_columns(columns, column_types, values, timestamps, offsets, counts):
+    """
+    Returns iterators over the values of each column for the samples of a
+    series.
+    """
+    variable = [column for column in columns if column not in values]
+    timestamp_columns = [column for column in variable if column_types[column] == ColumnType.TIMESTAMP]
+    if len(variable) != 2 or len(timestamp_columns) != 1:
+        raise ValueError("series need values for all but a timestamp column and a count column")
+    series = []
+    for column in columns:
+        if column in values:
+            series.append(repeat(values[column]))
+        elif column in timestamp_columns:
+            series.append(zip(timestamps, offsets))
+        else:
+            series.append(iter(counts))
+    return series
+
+
+def _schema(pa, columns, column_types):
+    return pa.schema([(str(column), _arrow_type(pa, column_types[column]))
+                      for column in columns])
+
+
+def _arrow_type(pa, column_type):
+    if isinstance(column_type, type) and issubclass(column_type, Enum):
+        return pa.dictionary(pa.int8(), pa.string())
+    return {
+        ColumnType.INT32: pa.int32(),
+        ColumnType.INT64: pa.int64(),
+        ColumnType.FLOAT64: pa.float64(),
+        ColumnType.BOOL: pa.bool_(),
+        ColumnType.STRING: pa.string(),
+        ColumnType.TIMESTAMP: pa.timestamp("s"),
+    }[column_type]
+
+
+def _converter(pa, column_type):
+    if isinstance(column_type, type) and issubclass(column_type, Enum):
+        # A fixed dictionary keeps the record batches compatible with each
+        # other, which the Arrow file format requires:
+        members = list(column_type)
+        dictionary = pa.array([str(member) for member in members], pa.string())
+        indices = {member: index for index, member in enumerate(members)}
+        return lambda values: pa.DictionaryArray.from_arrays(
+            pa.array([None if value is None else indices[value] for value in values], pa.int8()),
+            dictionary)
+    if column_type == ColumnType.TIMESTAMP:
+        return lambda values: pa.array(
+            [None if value is None else value[0] for value in values],
+            pa.timestamp("s"))
+    arrow_type = _arrow_type(pa, column_type)
+    return lambda values: pa.array(values, arrow_type)
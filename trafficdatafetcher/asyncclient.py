@@ -0,0 +1,292 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from trafficdatafetcher.apiclient import API_URL, DOMAINS_URL, HEADERS, MAX_ATTEMPTS, REQUEST_TIMEOUT, \
+    RETRY_STATUSES, THROTTLE_STATUSES, ApiError, cache_key, cached_payload, channel_params
+from trafficdatafetcher.jsonutils import loads
+from trafficdatafetcher.ratelimit import RequestStatistics, backoff_delay, parse_retry_after
+
+_Response = namedtuple("_Response", ["status", "headers", "body", "seconds"])
+
+
+class _StatusError(Exception):
+    pass
+
+
+class AsyncApiClient:
+    """
+    Asyncio variant of `apiclient.ApiClient`. The fetch methods are
+    coroutines which take the same arguments and return the same payloads.
+
+    All requests share one aiohttp session. At most `pool_size` requests
+    are sent at the same time, which allows to fan out over thousands of
+    requests without a thread per request. Caching, rate limiting and
+    retries work as in ApiClient, as does recording `metrics`. The cache
+    files are read and written in the default executor of the event loop
+    so that they do not block other requests.
+
+    The session is opened with the first request. The client must be used
+    and closed within the same event loop.
+    """
+
+    def __init__(self, pool_size=1, keep_alive=True, cache=None,
+                 rate_limiter=None, max_attempts=MAX_ATTEMPTS,
+                 api_url=API_URL, domains_url=DOMAINS_URL, metrics=None):
+        self._aiohttp = _import_aiohttp()
+        self._errors = (self._aiohttp.ClientError, asyncio.TimeoutError, ValueError, _StatusError)
+        self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        self._api_url = api_url
+        self._domains_url = domains_url
+        self._cache = cache
+        self._rate_limiter = rate_limiter
+        self._max_attempts = max_attempts
+        self._metrics = metrics
+        self.statistics = RequestStatistics()
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch_domains(self):
+        """
+        Retrieves a list of all known domains.
+        """
+        try:
+            return await self._get_json("domains", self._domains_url, ttl=self._metadata_ttl())
+        except self._errors as e:
+            raise ApiError(f"Fetching domains failed: {e}") from e
+
+    async def fetch_sites_in_domain(self, domain_id: int):
+        """
+        Retrieves a list of all available counter sites in the given domain.
+        """
+        url = f"{self._api_url}/publicwebpageplus/{domain_id}"
+        try:
+            return await self._get_json("sites_in_domain", url, {"withNull": "true"}, HEADERS,
+                                        self._metadata_ttl())
+        except self._errors as e:
+            raise ApiError(f"Fetching sites in domain {domain_id} failed: {e}") from e
+
+    async def fetch_site(self, site_id: int, with_token=True):
+        """
+        Gets basic information about a counter site. Raises an ApiError if
+        the site does not exist. Sites are only taken from the cache if
+        with_token is false.
+        """
+        url = f"{self._api_url}/publicwebpage/{site_id}"
+        try:
+            site = await self._get_json("site", url, {"withNull": "true"}, HEADERS,
+                                        self._metadata_ttl(), lookup=not with_token)
+        except self._errors as e:
+            raise ApiError(f"Fetching site {site_id} failed: {e}") from e
+        # The API answers with an empty response for unknown sites:
+        if not site:
+            raise ApiError(f"Site {site_id} does not exist")
+        # Sites without token are the same whether they are cached or not:
+        return site if with_token else cached_payload(site)
+
+    async def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        """
+        Gets the data collected in a channel at counter site in a given time range.
+        Raises an ApiError if the data cannot be retrieved.
+        """
+        url = f"{self._api_url}/publicwebpage/data/{channel_id}"
+        params = channel_params(domain_id, begin, end, step_size)
+        try:
+            return await self._get_json("channel", url, params, HEADERS,
+                                        self._counts_ttl(end), token)
+        except self._errors as e:
+            raise ApiError(f"Fetching channel {channel_id} failed: {e}") from e
+
+    def _metadata_ttl(self):
+        return self._cache.metadata_ttl if self._cache is not None else None
+
+    def _counts_ttl(self, end):
+        return self._cache.ttl_for_counts(end) if self._cache is not None else None
+
+    async def _get_json(self, endpoint, url, params=None, headers=None, ttl=None, token=None, lookup=True):
+        key = cache_key(url, params)
+        entry = None
+        request_headers = dict(headers or {})
+        if self._cache is not None and lookup:
+            entry = await self._run_in_executor(self._cache.lookup, key)
+            if entry is not None and entry.is_fresh():
+                self._cache.count_hit()
+                return entry.payload
+            if entry is not None and entry.etag is not None:
+                request_headers["If-None-Match"] = entry.etag
+            if entry is not None and entry.last_modified is not None:
+                request_headers["If-Modified-Since"] = entry.last_modified
+
+        request_params = {name: str(value) for name, value in (params or {}).items()}
+        if token is not None:
+            request_params["t"] = token
+        response = await self._send(endpoint, url, request_params, request_headers)
+
+        if entry is not None and response.status == 304:
+            self._cache.count_revalidated()
+            await self._run_in_executor(self._cache.store, key, entry.payload, ttl,
+                                        response.headers.get("ETag", entry.etag),
+                                        response.headers.get("Last-Modified", entry.last_modified))
+            return entry.payload
+
+        if response.status >= 400:
+            raise _StatusError(f"{response.status} Error for url: {url}")
+        start = time.perf_counter()
+        payload = loads(response.body)
+        if self._metrics is not None:
+            self._metrics.record_stage("decode", time.perf_counter() - start)
+        if self._cache is not None:
+            self._cache.count_miss()
+            cached = cached_payload(payload)
+            if cached is not None:
+                await self._run_in_executor(self._cache.store, key, cached, ttl, response.headers.get("ETag"),
+                                            response.headers.get("Last-Modified"))
+        return payload
+
+    @staticmethod
+    async def _run_in_executor(function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _send(self, endpoint, url, params, headers):
+        """
+        Sends a GET request and retries it if it fails with a temporary
+        error. Returns the last response.
+        """
+        backoff = 0.0
+        attempt = 1
+        while True:
+            waited = self._rate_limiter.reserve() if self._rate_limiter is not None else 0.0
+            if waited > 0:
+                await asyncio.sleep(waited)
+            self.statistics.count_request(waited)
+            start = time.perf_counter()
+            try:
+                response = await self._get(url, params, headers)
+            except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self._max_attempts:
+                    self._record_request(endpoint, None, 0, attempt, time.perf_counter() - start)
+                    self.statistics.count_backoff_of_request(backoff)
+                    raise
+                delay = backoff_delay(attempt)
+                throttled = False
+            else:
+                if response.status not in RETRY_STATUSES or attempt == self._max_attempts:
+                    self._record_request(endpoint, response.status, len(response.body), attempt,
+                                         response.seconds)
+                    self.statistics.count_backoff_of_request(backoff)
+                    if response.status < 400 and self._rate_limiter is not None:
+                        self._rate_limiter.speed_up()
+                    return response
+                throttled = response.status in THROTTLE_STATUSES
+                delay = backoff_delay(attempt)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                    if self._rate_limiter is not None:
+                        self._rate_limiter.pause(retry_after)
+            if self._rate_limiter is not None:
+                self._rate_limiter.slow_down()
+            self.statistics.count_retry(delay, throttled)
+            backoff += delay
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _record_request(self, endpoint, status, size, attempts, seconds):
+        if self._metrics is not None:
+            self._metrics.record_request(endpoint, status, size, attempts - 1, seconds)
+
+    async def _get(self, url, params, headers):
+        if self._session is None:
+            aiohttp = self._aiohttp
+            self._semaphore = asyncio.Semaphore(self._pool_size)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size,
+                                               force_close=not self._keep_alive),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        # Only the time after the semaphore is acquired counts as latency:
+        async with self._semaphore:
+            start = time.perf_counter()
+            async with self._session.get(url, params=params, headers=headers) as response:
+                body = await response.read()
+                return _Response(response.status, response.headers, body, time.perf_counter() - start)
+
+
+class EventLoopThread:
+    """
+    Runs an event loop in a background thread. Coroutine functions are
+    submitted like functions to an executor and return concurrent futures,
+    so that synchronous code such as a `Prefetcher` can drive coroutines.
+    Coroutines still running on shutdown are cancelled.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def submit(self, function, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(function(*args, **kwargs), self._loop)
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine in the event loop and waits for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def shutdown(self):
+        self.run(_cancel_tasks())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+async def _cancel_tasks():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        sys.exit("error: the async engine requires aiohttp. "
+                 "Install it with `pip install traffic-data-fetcher[async]`")
+    return aiohttp
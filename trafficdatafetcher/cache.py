@@ -0,0 +1,129 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from threading import Lock
+
+from trafficdatafetcher.jsonutils import loads
+
+METADATA_TTL = timedelta(days=1)
+COUNTS_TTL = timedelta(minutes=15)
+# Counters upload their data with some delay. Time ranges which ended
+# longer ago than this are considered final:
+COUNTS_FINAL_AFTER = timedelta(days=3)
+
+
+def default_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "traffic-data-fetcher"
+
+
+class CacheEntry:
+    def __init__(self, payload, expires, etag=None, last_modified=None):
+        self.payload = payload
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self):
+        return self.expires is None or self.expires > time.time()
+
+
+class ResponseCache:
+    """
+    Stores decoded API responses as gzip compressed JSON files in a
+    directory. Entries are keyed on the endpoint and its parameters.
+
+    Entries expire after a time-to-live. Entries stored without a
+    time-to-live never expire. Expired entries are kept so that they can be
+    revalidated with the ETag or Last-Modified validators of the response
+    they were created from.
+    """
+
+    def __init__(self, directory, metadata_ttl=METADATA_TTL, counts_ttl=COUNTS_TTL):
+        self.directory = Path(directory)
+        self.metadata_ttl = metadata_ttl
+        self.counts_ttl = counts_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = Lock()
+
+    def lookup(self, key):
+        """
+        Returns the entry stored for key or None if there is no such entry.
+        The entry may have expired.
+        """
+        try:
+            with gzip.open(self._path(key), "rb") as file:
+                entry = loads(file.read())
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(entry["payload"], entry["expires"], entry["etag"],
+                          entry["last_modified"])
+
+    def store(self, key, payload, ttl, etag=None, last_modified=None):
+        entry = {
+            "payload": payload,
+            "expires": None if ttl is None else time.time() + ttl.total_seconds(),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never
+        # see a partially written entry:
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw_file, \
+                    gzip.open(raw_file, "wt", encoding="UTF-8") as file:
+                json.dump(entry, file)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def ttl_for_counts(self, end):
+        """
+        Returns the time-to-live for counts in a time range ending at end.
+        Counts of time ranges which cannot change anymore never expire.
+        """
+        if end is not None and end + COUNTS_FINAL_AFTER <= date.today():
+            return None
+        return self.counts_ttl
+
+    def count_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def count_revalidated(self):
+        with self._lock:
+            self.revalidated += 1
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("UTF-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json.gz"
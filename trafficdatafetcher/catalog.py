@@ -0,0 +1,272 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import namedtuple
+
+from trafficdatafetcher.apiclient import MeansOfTransport
+from trafficdatafetcher.cache import default_cache_dir
+
+CATALOG_FILE = "catalog.sqlite3"
+EARTH_RADIUS_KM = 6371.0
+# Kilometres per degree of latitude:
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Sorts after any character, so that prefixes can be looked up as ranges:
+_MAX_CHARACTER = "\U0010ffff"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS domains (
+        domain_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS sites (
+        site_id INTEGER PRIMARY KEY,
+        domain_id INTEGER NOT NULL,
+        public_id INTEGER,
+        name TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        means_of_transport INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS sites_by_domain ON sites (domain_id)",
+    "CREATE INDEX IF NOT EXISTS sites_by_position ON sites (latitude, longitude)",
+    """
+    CREATE TABLE IF NOT EXISTS words (
+        word TEXT NOT NULL,
+        site_id INTEGER NOT NULL,
+        PRIMARY KEY (word, site_id)
+    ) WITHOUT ROWID""",
+    """
+    CREATE TABLE IF NOT EXISTS properties (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    )""",
+]
+
+CatalogSite = namedtuple("CatalogSite", ["site_id", "public_id", "domain_id", "domain_name", "name",
+                                         "latitude", "longitude", "means_of_transport", "distance"])
+
+
+def default_catalog_file():
+    return default_cache_dir() / CATALOG_FILE
+
+
+class Catalog:
+    """
+    Stores the domains and their sites in an SQLite database, so that sites
+    can be found without requests to the API.
+
+    The words of the names of a site and its domain are indexed for prefix
+    searches regardless of case and accents, the positions of the sites for
+    searches within a bounding box or around a point. The means of transport
+    of a site are stored as bit mask of their values.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def replace_domain(self, domain_id, name, sites):
+        """
+        Replaces the sites of a domain with the sites given as returned by
+        `ApiClient.fetch_sites_in_domain`.
+        """
+        with self._connection:
+            self._delete_sites(domain_id)
+            self._connection.execute("INSERT OR REPLACE INTO domains VALUES (?, ?)", (domain_id, name))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO sites VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(site["idPdc"], domain_id, site["lienPublic"], site["nom"], site["lat"], site["lon"],
+                  _means_of_transport_mask(site)) for site in sites])
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO words VALUES (?, ?)",
+                [(word, site["idPdc"]) for site in sites
+                 for word in {*_words(site["nom"]), *_words(name)}])
+
+    def remove_domains(self, keep):
+        """
+        Removes all domains but the ones whose ids are in keep.
+        """
+        with self._connection:
+            for (domain_id,) in self._connection.execute("SELECT domain_id FROM domains").fetchall():
+                if domain_id not in keep:
+                    self._delete_sites(domain_id)
+                    self._connection.execute("DELETE FROM domains WHERE domain_id = ?", (domain_id,))
+
+    def mark_refreshed(self, now=None):
+        self._set_property("refreshed", time.time() if now is None else now)
+
+    def refreshed(self):
+        """
+        Returns when all domains were last refreshed as seconds since the
+        epoch or None if they never were.
+        """
+        row = self._connection.execute("SELECT value FROM properties WHERE name = 'refreshed'").fetchone()
+        return None if row is None else row[0]
+
+    def claim_refresh(self, timeout, now=None):
+        """
+        Returns whether a refresh may be started, which is the case unless
+        another one was started less than timeout seconds ago. A refresh
+        started here blocks further ones for timeout seconds.
+        """
+        now = time.time() if now is None else now
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM properties WHERE name = 'refresh_started'").fetchone()
+            if row is not None and row[0] > now - timeout:
+                return False
+            self._set_property("refresh_started", now)
+        return True
+
+    def find_sites(self, words=(), domain_id=None, box=None, near=None, means_of_transport=None):
+        """
+        Returns the sites which match all given conditions ordered by their
+        distance if near is given and else by domain and name:
+         - each word is the prefix of a word in the name of the site or its domain
+         - the site is in the domain
+         - the site is within the box given as (south, west, north, east)
+         - the site is within the radius in km around near given as
+           (latitude, longitude, radius)
+         - the site counts any of the means of transport
+        """
+        conditions = []
+        parameters = []
+        for word in (normalized for word in words for normalized in _words(word)):
+            conditions.append("sites.site_id IN (SELECT site_id FROM words WHERE word >= ? AND word < ?)")
+            parameters.extend([word, word + _MAX_CHARACTER])
+        if domain_id is not None:
+            conditions.append("sites.domain_id = ?")
+            parameters.append(domain_id)
+        if near is not None:
+            box = _intersection(box, _bounding_box(*near))
+        if box is not None:
+            south, west, north, east = box
+            conditions.append("sites.latitude BETWEEN ? AND ?")
+            parameters.extend([south, north])
+            # Boxes crossing the antimeridian are split in two:
+            if west <= east:
+                conditions.append("sites.longitude BETWEEN ? AND ?")
+                parameters.extend([west, east])
+            else:
+                conditions.append("(sites.longitude >= ? OR sites.longitude <= ?)")
+                parameters.extend([west, east])
+        if means_of_transport is not None:
+            conditions.append("sites.means_of_transport & ? != 0")
+            parameters.append(_mask(value.value for value in means_of_transport))
+        rows = self._connection.execute(
+            f"""
+            SELECT sites.site_id, sites.public_id, sites.domain_id, domains.name, sites.name,
+                   sites.latitude, sites.longitude, sites.means_of_transport
+            FROM sites JOIN domains ON domains.domain_id = sites.domain_id
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY sites.domain_id, sites.name, sites.site_id
+            """, parameters)
+        sites = [CatalogSite(*row[:7], _means_of_transport(row[7]), None) for row in rows]
+        if near is None:
+            return sites
+        latitude, longitude, radius = near
+        sites = [site._replace(distance=distance(latitude, longitude, site.latitude, site.longitude))
+                 for site in sites]
+        return sorted((site for site in sites if site.distance <= radius), key=lambda site: site.distance)
+
+    def _delete_sites(self, domain_id):
+        self._connection.execute(
+            "DELETE FROM words WHERE site_id IN (SELECT site_id FROM sites WHERE domain_id = ?)", (domain_id,))
+        self._connection.execute("DELETE FROM sites WHERE domain_id = ?", (domain_id,))
+
+    def _set_property(self, name, value):
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO properties VALUES (?, ?)", (name, value))
+
+
+def distance(latitude1, longitude1, latitude2, longitude2):
+    """
+    Returns the great-circle distance between two points in km.
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _bounding_box(latitude, longitude, radius):
+    delta_latitude = radius / _KM_PER_DEGREE
+    south, north = latitude - delta_latitude, latitude + delta_latitude
+    # Near the poles, the circle covers all longitudes:
+    if south <= -90 or north >= 90:
+        return max(south, -90), -180, min(north, 90), 180
+    delta_longitude = delta_latitude / min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+    if delta_longitude >= 180:
+        return south, -180, north, 180
+    west = (longitude - delta_longitude + 180) % 360 - 180
+    east = (longitude + delta_longitude + 180) % 360 - 180
+    return south, west, north, east
+
+
+def _intersection(box, other):
+    if box is None:
+        return other
+    # The longitudes are only intersected if neither box crosses the antimeridian:
+    if box[1] <= box[3] and other[1] <= other[3]:
+        return max(box[0], other[0]), max(box[1], other[1]), min(box[2], other[2]), min(box[3], other[3])
+    return max(box[0], other[0]), box[1], min(box[2], other[2]), box[3]
+
+
+def _words(name):
+    if not name:
+        return []
+    # Accents are dropped, so that "Universite" finds "Université":
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return re.findall(r"\w+", "".join(character for character in decomposed
+                                      if not unicodedata.combining(character)))
+
+
+def _means_of_transport_mask(site):
+    values = {counter["pratique"] for counter in site.get("pratique") or []}
+    if not values and site.get("mainPratique") is not None:
+        values = {site["mainPratique"]}
+    return _mask(values)
+
+
+def _mask(values):
+    mask = 0
+    for value in values:
+        mask |= 1 << value
+    return mask
+
+
+def _means_of_transport(mask):
+    return [means for means in MeansOfTransport if mask & 1 << means.value]
@@ -0,0 +1,157 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from contextlib import contextmanager
+from enum import auto
+
+from trafficdatafetcher.apiclient import MAX_ATTEMPTS
+from trafficdatafetcher.cache import ResponseCache, default_cache_dir
+from trafficdatafetcher.metrics import QUANTILES, quantile_name
+from trafficdatafetcher.partitions import PartitionedWriter, partitions
+from trafficdatafetcher.ratelimit import DEFAULT_RATE
+from trafficdatafetcher.types import EnumWithLowerCaseNames, positive_float, positive_int
+from trafficdatafetcher.writers import Compression, OutputFormat, open_output, open_writer
+
+
+# Appended to the help of the concurrency options, whose requests are
+# still paced by the rate limiter:
+RATE_CAP = f"Requests are capped at --rate per second ({DEFAULT_RATE:g} by default) regardless of the concurrency"
+
+
+class Engine(EnumWithLowerCaseNames):
+    THREADS = auto()
+    ASYNC = auto()
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache-dir",
+                        help=f"directory for caching responses. Defaults to `{default_cache_dir()}`",
+                        default=default_cache_dir(),
+                        dest="cache_dir")
+    parser.add_argument("--no-cache",
+                        help="do not cache responses",
+                        action="store_true",
+                        dest="no_cache")
+
+
+def open_cache(cache_dir, no_cache):
+    if no_cache:
+        return None
+    return ResponseCache(cache_dir)
+
+
+def print_cache_statistics(cache):
+    if cache is None:
+        return
+    print(f"cache: {cache.hits} hits, {cache.misses} misses, "
+          f"{cache.revalidated} revalidated", file=sys.stderr)
+
+
+def add_rate_limit_arguments(parser):
+    parser.add_argument("--rate",
+                        help=f"maximum number of requests per second, which also caps the throughput of "
+                             f"--concurrency. The rate is lowered automatically while the API throttles requests. "
+                             f"Defaults to {DEFAULT_RATE:g}",
+                        default=DEFAULT_RATE,
+                        dest="rate",
+                        type=positive_float)
+    parser.add_argument("--max-attempts",
+                        help=f"number of times a request is sent before giving up. Defaults to {MAX_ATTEMPTS}",
+                        default=MAX_ATTEMPTS,
+                        dest="max_attempts",
+                        type=positive_int)
+
+
+def print_request_statistics(statistics):
+    print(f"requests: {statistics.requests} sent, {statistics.retries} retried "
+          f"({statistics.throttled} throttled), {statistics.waited:.1f}s rate limited, "
+          f"{statistics.backoff:.1f}s backoff (at most {statistics.max_backoff:.1f}s per request)",
+          file=sys.stderr)
+
+
+def add_engine_arguments(parser):
+    parser.add_argument("--engine",
+                        help="send requests from a pool of threads or from an asyncio event loop. The async engine "
+                             "requires aiohttp. Defaults to `threads`",
+                        choices=list(Engine),
+                        default=Engine.THREADS,
+                        dest="engine",
+                        type=Engine.from_string)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-file",
+                        help="store the latency, size, status and retries of each request and the time spent in "
+                             "each stage per site in a file. Files ending with `.prom` are written in the "
+                             "Prometheus text format, all other files as JSON",
+                        dest="metrics_file")
+
+
+def save_metrics(metrics, metrics_file):
+    if metrics_file is not None:
+        metrics.save(metrics_file)
+    rows = metrics.summary()
+    if not rows:
+        return
+    width = max(len(row.name) for row in rows)
+    quantiles = "".join(f" {quantile_name(quantile):>8}" for quantile in QUANTILES)
+    print(f"{'metric':<{width}} {'count':>7} {'total s':>9}{quantiles}", file=sys.stderr)
+    for row in rows:
+        quantiles = "".join(f" {row.quantiles[quantile]:8.3f}" for quantile in QUANTILES)
+        print(f"{row.name:<{width}} {row.count:7d} {row.total:9.3f}{quantiles}", file=sys.stderr)
+
+
+def add_output_arguments(parser):
+    parser.add_argument("-C", "--compression",
+                        help="compress CSV files as they are written, or the columns of Parquet and Arrow files. "
+                             "Arrow files only support `zstd`. By default, CSV files ending with `.gz` or `.zst` "
+                             "are compressed, partitions are not",
+                        choices=list(Compression),
+                        dest="compression",
+                        type=Compression.from_string)
+    parser.add_argument("--partition-by",
+                        help="write a file per site and/or month, e.g. `site,month`, into the directory given by "
+                             "--file. The directories are named `site=SITE_ID` and `month=YYYY-MM`",
+                        dest="partition_by",
+                        type=partitions)
+
+
+@contextmanager
+def open_output_writer(file, output_format, columns, column_types, append, compression, partition_by, site_column):
+    """
+    Opens a writer for the rows of a command, which writes to a file or,
+    if partition_by is given, to a file per partition in the directory
+    file. Yields the output, which writes all rows so far when flushed,
+    and the writer.
+    """
+    if output_format == OutputFormat.ARROW and compression == Compression.GZIP:
+        sys.exit("error: arrow files only support zstd compression")
+    if partition_by:
+        if file in (None, "-"):
+            sys.exit("error: --partition-by requires --file")
+        with PartitionedWriter(file, partition_by, output_format, columns, column_types, site_column,
+                               compression, append) as writer:
+            yield writer, writer
+        print(f"partitions: {writer.files} files written to {file}", file=sys.stderr)
+        return
+    if output_format.is_binary:
+        file_compression, codec = Compression.NONE, compression
+    else:
+        file_compression, codec = compression or Compression.from_file_name(file), None
+    with open_output(file, append, output_format.is_binary, file_compression) as (output, write_header), \
+            open_writer(output_format, output, columns, column_types, write_header, codec) as writer:
+        yield output, writer
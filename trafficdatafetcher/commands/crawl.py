@@ -0,0 +1,291 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from enum import auto
+from pathlib import Path
+from threading import Event, Lock
+
+from trafficdatafetcher.apiclient import ApiClient, ApiError, StepSize, Direction, MeansOfTransport
+from trafficdatafetcher.arrowutils import ColumnType
+from trafficdatafetcher.commands.common import RATE_CAP, add_cache_arguments, add_rate_limit_arguments, \
+    open_cache, print_cache_statistics, print_request_statistics
+from trafficdatafetcher.daterange import split_date_range, start_of_collection
+from trafficdatafetcher.jobqueue import DONE, FAILED, PENDING, RUNNING, JobQueue
+from trafficdatafetcher.ratelimit import RateLimiter
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries
+from trafficdatafetcher.types import EnumWithLowerCaseNames, positive_int
+from trafficdatafetcher.writers import OutputFormat, open_writer
+
+QUEUE_FILE = "queue.sqlite3"
+# Time idle workers wait for other workers to queue new tasks:
+POLL_INTERVAL = 0.1
+
+
+class Columns(EnumWithLowerCaseNames):
+    COUNTER_ID = auto()
+    CHANNEL_ID = auto()
+    MEANS_OF_TRANSPORT = auto()
+    DIRECTION = auto()
+    TIMESTAMP = auto()
+    COUNT = auto()
+
+
+COLUMN_TYPES = {
+    Columns.COUNTER_ID: ColumnType.INT64,
+    Columns.CHANNEL_ID: ColumnType.INT64,
+    Columns.MEANS_OF_TRANSPORT: MeansOfTransport,
+    Columns.DIRECTION: Direction,
+    Columns.TIMESTAMP: ColumnType.TIMESTAMP,
+    Columns.COUNT: ColumnType.INT32,
+}
+
+
+def register_argparser(subparsers):
+    parser = subparsers.add_parser("crawl", help="fetch counts of whole domains into a directory")
+    parser.set_defaults(func=crawl)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-d", "--domains",
+                       help="ids of the domains to crawl",
+                       dest="domain_ids",
+                       type=int,
+                       nargs="+")
+    group.add_argument("--all-domains",
+                       help="crawl all known domains",
+                       action="store_true",
+                       dest="all_domains")
+    parser.add_argument("-o", "--output-dir",
+                        help="directory for the fetched data and the task queue. A crawl is resumed if the directory "
+                             "contains the queue of an earlier crawl",
+                        required=True,
+                        dest="output_dir")
+    parser.add_argument("-F", "--format",
+                        help="format of the stored data. Defaults to `csv`",
+                        choices=list(OutputFormat),
+                        default=OutputFormat.CSV,
+                        dest="output_format",
+                        type=OutputFormat.from_string)
+    parser.add_argument("-S", "--step-size",
+                        help="step size of the data to fetch. Defaults to `hour`",
+                        choices=list(StepSize),
+                        default=StepSize.HOUR,
+                        dest="step_size",
+                        type=StepSize.from_string)
+    parser.add_argument("-B", "--begin",
+                        help="fetch data starting at date. Date must be ISO 8610 formatted (YYYY-MM-DD)",
+                        dest="begin",
+                        type=date.fromisoformat)
+    parser.add_argument("-E", "--end",
+                        help="fetch data until date (exclusively). Date must be ISO 8610 formatted (YYYY-MM-DD)",
+                        dest="end",
+                        type=date.fromisoformat)
+    parser.add_argument("-c", "--concurrency",
+                        help=f"number of tasks to run in parallel. {RATE_CAP}. Defaults to 4",
+                        default=4,
+                        dest="concurrency",
+                        type=positive_int)
+    parser.add_argument("--refresh",
+                        help="start a new crawl in the output directory instead of resuming the earlier one, "
+                             "fetching all windows again",
+                        action="store_true",
+                        dest="refresh")
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+
+
+def crawl(domain_ids, all_domains, output_dir, output_format, step_size, begin, end, concurrency,
+          cache_dir, no_cache, rate, max_attempts, refresh=False, **kwargs):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache = open_cache(cache_dir, no_cache)
+    with ApiClient(pool_size=concurrency, cache=cache, rate_limiter=RateLimiter(rate),
+                   max_attempts=max_attempts) as client, \
+            JobQueue(output_dir / QUEUE_FILE) as queue:
+        if refresh:
+            queue.clear()
+        # The windows and files of the tasks depend on the parameters:
+        parameters = {
+            "output_format": str(output_format),
+            "step_size": str(step_size),
+            "begin": _format_date(begin),
+            "end": _format_date(end),
+        }
+        crawled = queue.parameters(parameters)
+        if crawled != parameters:
+            described = ", ".join(f"{name} {value}" for name, value in crawled.items())
+            sys.exit(f"error: {output_dir} contains a crawl with other parameters ({described}). "
+                     "Run it with the same parameters to resume it or pass --refresh to start a new crawl")
+        queue.resume()
+        if all_domains:
+            domain_ids = [domain["id"] for domain in client.fetch_domains()]
+        for domain_id in domain_ids:
+            queue.put("domain", {"domain_id": domain_id})
+
+        crawler = _Crawler(client, output_dir, output_format, step_size, begin, end)
+        stop = Event()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            workers = [executor.submit(_work, queue, crawler, stop) for _ in range(concurrency)]
+            try:
+                for worker in workers:
+                    worker.result()
+            except KeyboardInterrupt:
+                print("crawl interrupted. Run it again to resume", file=sys.stderr)
+                raise
+            finally:
+                # Workers finish their running tasks so that these need not
+                # be repeated when the crawl is resumed:
+                stop.set()
+        counts = queue.counts()
+        failures = queue.failures()
+    print_cache_statistics(cache)
+    print_request_statistics(client.statistics)
+    print(f"crawl: {counts[DONE]} tasks done, {counts[FAILED]} failed, {counts[PENDING]} pending",
+          file=sys.stderr)
+    for kind, payload, error in failures:
+        print(f"failed {kind} {payload}: {error}", file=sys.stderr)
+    if failures:
+        sys.exit("error: some tasks failed. Run the crawl again to retry them")
+
+
+def _work(queue, crawler, stop):
+    while not stop.is_set():
+        task = queue.claim()
+        if task is None:
+            counts = queue.counts()
+            # Running tasks may still queue further tasks:
+            if counts[PENDING] == 0 and counts[RUNNING] == 0:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        try:
+            follow_ups = crawler.run(task)
+        except ApiError as e:
+            queue.fail(task, str(e))
+        except Exception as e:
+            # Other errors, e.g. of writing the files, only fail the task so
+            # that it is retried when the crawl is resumed:
+            queue.fail(task, f"{type(e).__name__}: {e}")
+        else:
+            queue.complete(task, follow_ups)
+
+
+class _Crawler:
+    """
+    Runs the tasks of a crawl. A domain is split into its sites, a site into
+    its channels and a channel into windows. Windows are fetched and stored
+    in a file each.
+    """
+
+    def __init__(self, client, output_dir, output_format, step_size, begin, end):
+        self._client = client
+        self._output_dir = output_dir
+        self._output_format = output_format
+        self._step_size = step_size
+        self._begin = begin
+        self._end = end
+        self._tokens = {}
+        self._lock = Lock()
+
+    def run(self, task):
+        """
+        Runs the task and returns its follow-up tasks.
+        """
+        return getattr(self, f"_run_{task.kind}")(**task.payload)
+
+    def _run_domain(self, domain_id):
+        sites = self._client.fetch_sites_in_domain(domain_id)
+        return [("site", {"site_id": site["lienPublic"]})
+                for site in sites if site["lienPublic"] is not None]
+
+    def _run_site(self, site_id):
+        site = self._fetch_site(site_id)
+        first_day = start_of_collection(site)
+        return [("channel", {
+            "domain_id": site["domaine"],
+            "site_id": site_id,
+            "channel_id": channel["id"],
+            "means_of_transport": channel["userType"],
+            "direction": channel["sens"],
+            "first_day": _format_date(first_day),
+        }) for channel in site["channels"]]
+
+    def _run_channel(self, first_day, **channel):
+        windows = split_date_range(self._begin, self._end, self._step_size,
+                                   _parse_date(first_day))
+        return [("window", dict(channel, begin=_format_date(begin), end=_format_date(end)))
+                for begin, end in windows]
+
+    def _run_window(self, domain_id, site_id, channel_id, means_of_transport, direction, begin, end):
+        token = self._token(site_id)
+        samples = self._client.fetch_channel(domain_id, channel_id, _parse_date(begin),
+                                             _parse_date(end), self._step_size, token)
+        series = TimeSeries.from_samples(samples)
+        path = (self._output_dir / str(domain_id) / str(site_id) / str(channel_id)
+                / f"{begin or 'start'}_{end or 'end'}.{self._output_format}")
+        self._write(path, site_id, channel_id, MeansOfTransport(means_of_transport),
+                    Direction(direction), series)
+        return []
+
+    def _fetch_site(self, site_id):
+        site = self._client.fetch_site(site_id)
+        with self._lock:
+            self._tokens[site_id] = site["token"]
+        return site
+
+    def _token(self, site_id):
+        # Tokens are not stored in the queue as they change between
+        # sessions. Resumed crawls fetch the site again:
+        with self._lock:
+            token = self._tokens.get(site_id)
+        if token is None:
+            token = self._fetch_site(site_id)["token"]
+        return token
+
+    def _write(self, path, site_id, channel_id, means_of_transport, direction, series):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Files are written under a temporary name first so that an
+        # interrupted crawl does not leave partial files behind:
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            mode = "wb" if self._output_format.is_binary else "wt"
+            encoding = None if self._output_format.is_binary else "UTF-8"
+            with os.fdopen(fd, mode, encoding=encoding) as file, \
+                    open_writer(self._output_format, file, Columns, COLUMN_TYPES) as writer:
+                values = {
+                    Columns.COUNTER_ID: site_id,
+                    Columns.CHANNEL_ID: channel_id,
+                    Columns.MEANS_OF_TRANSPORT: means_of_transport,
+                    Columns.DIRECTION: direction,
+                }
+                counts = [None if count == NO_COUNT else count for count in series.counts]
+                writer.writeseries(values, series.timestamps, series.offsets, counts, series.date_format)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _format_date(day):
+    return None if day is None else day.isoformat()
+
+
+def _parse_date(value):
+    return None if value is None else date.fromisoformat(value)
@@ -0,0 +1,112 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from array import array
+from datetime import date
+from itertools import groupby, islice
+from operator import itemgetter
+from pathlib import Path
+
+from trafficdatafetcher.apiclient import StepSize, Direction, MeansOfTransport
+from trafficdatafetcher.commands.common import add_output_arguments, open_output_writer
+from trafficdatafetcher.commands.fetchcounts import COLUMN_TYPES, Columns, output_columns
+from trafficdatafetcher.store import SampleStore
+from trafficdatafetcher.writers import OutputFormat
+
+# Number of samples of a series which are written at a time:
+CHUNK_SIZE = 1 << 14
+
+
+def register_argparser(subparsers):
+    parser = subparsers.add_parser("export", help="export counts stored by fetch-counts --store")
+    parser.set_defaults(func=export)
+    parser.add_argument("store",
+                        help="SQLite database written by fetch-counts --store")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-d", "--domain",
+                       help="id of the domain whose counter sites should be exported",
+                       dest="domain_id",
+                       type=int)
+    group.add_argument("-s", "--sites",
+                       help="ids of the counter sites to export",
+                       dest="site_ids",
+                       type=int,
+                       nargs="+")
+    parser.add_argument("-f", "--file",
+                        help="store data in a file, or in a directory with --partition-by. Existing files are "
+                             "overwritten",
+                        default="-",
+                        dest="file")
+    parser.add_argument("-F", "--format",
+                        help="format of the exported data. Defaults to `csv`",
+                        choices=list(OutputFormat),
+                        default=OutputFormat.CSV,
+                        dest="output_format",
+                        type=OutputFormat.from_string)
+    add_output_arguments(parser)
+    parser.add_argument("-S", "--step-size",
+                        help="step size of the data to export. Defaults to `hour`",
+                        choices=list(StepSize),
+                        default=StepSize.HOUR,
+                        dest="step_size",
+                        type=StepSize.from_string)
+    parser.add_argument("-B", "--begin",
+                        help="export data starting at date. Date must be ISO 8610 formatted (YYYY-MM-DD)",
+                        dest="begin",
+                        type=date.fromisoformat)
+    parser.add_argument("-E", "--end",
+                        help="export data until date (exclusively). Date must be ISO 8610 formatted (YYYY-MM-DD)",
+                        dest="end",
+                        type=date.fromisoformat)
+    parser.add_argument("-D", "--direction",
+                        help="select directions to export. By default, data for all directions is exported",
+                        choices=list(Direction),
+                        dest="direction",
+                        type=Direction.from_string,
+                        nargs="+")
+    parser.add_argument("-M", "--means-of-transport",
+                        help="select means of transport to export. By default, data for all means of transport is exported",
+                        choices=list(MeansOfTransport),
+                        dest="means_of_transport",
+                        type=MeansOfTransport.from_string,
+                        nargs="+")
+
+
+def export(store, domain_id, site_ids, file, output_format, step_size, begin, end, direction,
+           means_of_transport, compression=None, partition_by=None, **kwargs):
+    if not Path(store).exists():
+        sys.exit(f"error: there is no store at {store}. Fill it with fetch-counts --store")
+    with SampleStore(store, read_only=True) as sample_store, \
+            open_output_writer(file, output_format, output_columns([step_size]), COLUMN_TYPES, False, compression,
+                               partition_by, Columns.COUNTER_ID) as (_, writer):
+        counts = sample_store.query_counts(step_size, site_ids, domain_id, begin, end,
+                                           direction, means_of_transport)
+        # The counts of a series are written in chunks:
+        for key, rows in groupby(counts, key=itemgetter(0, 1, 2, 6)):
+            counter_id, means_of_transport_value, direction_value, date_format = key
+            values = {
+                Columns.COUNTER_ID: counter_id,
+                Columns.MEANS_OF_TRANSPORT: MeansOfTransport(means_of_transport_value),
+                Columns.DIRECTION: Direction(direction_value),
+            }
+            while True:
+                chunk = list(islice(rows, CHUNK_SIZE))
+                if not chunk:
+                    break
+                _, _, _, timestamps, offsets, chunk_counts, _ = zip(*chunk)
+                writer.writeseries(values, array("q", timestamps), array("i", offsets), chunk_counts,
+                                   date_format)
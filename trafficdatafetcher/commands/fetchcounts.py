@@ -14,24 +14,63 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import date
 from enum import auto
+from functools import partial
+from itertools import islice, repeat
+from operator import lt
 
-from trafficdatafetcher import apiclient
-from trafficdatafetcher.apiclient import StepSize, Direction, MeansOfTransport
-from trafficdatafetcher.csvutils import open_csv
-from trafficdatafetcher.types import EnumWithLowerCaseNames
+from trafficdatafetcher.apiclient import ApiClient, ApiError, StepSize, Direction, MeansOfTransport
+from trafficdatafetcher.arrowutils import ColumnType
+from trafficdatafetcher.asyncclient import AsyncApiClient, EventLoopThread
+from trafficdatafetcher.commands.common import RATE_CAP, Engine, add_cache_arguments, add_engine_arguments, \
+    add_metrics_arguments, add_output_arguments, add_rate_limit_arguments, open_cache, open_output_writer, \
+    print_cache_statistics, print_request_statistics, save_metrics
+from trafficdatafetcher.commands.listsites import map_public_site_to_row
+from trafficdatafetcher.daterange import split_date_range, start_of_collection
+from trafficdatafetcher.highwatermarks import HighWaterMarks
+from trafficdatafetcher.metrics import Metrics
+from trafficdatafetcher.prefetcher import Prefetcher
+from trafficdatafetcher.ratelimit import RateLimiter, RequestStatistics
+from trafficdatafetcher.resample import Resampler, fetched_step_size
+from trafficdatafetcher.store import SampleStore
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries, occurrences
+from trafficdatafetcher.timestamps import parse_timestamp
+from trafficdatafetcher.types import EnumWithLowerCaseNames, positive_int
+from trafficdatafetcher.writers import OutputFormat
+
+WINDOW_ATTEMPTS = 3
+WINDOW_RETRY_DELAY = 1
 
 
 class Columns(EnumWithLowerCaseNames):
     COUNTER_ID = auto()
     MEANS_OF_TRANSPORT = auto()
     DIRECTION = auto()
+    STEP_SIZE = auto()
     TIMESTAMP = auto()
     COUNT = auto()
 
 
+COLUMN_TYPES = {
+    Columns.COUNTER_ID: ColumnType.INT64,
+    Columns.MEANS_OF_TRANSPORT: MeansOfTransport,
+    Columns.DIRECTION: Direction,
+    Columns.STEP_SIZE: StepSize,
+    Columns.TIMESTAMP: ColumnType.TIMESTAMP,
+    Columns.COUNT: ColumnType.INT32,
+}
+
+
 def register_argparser(subparsers):
     parser = subparsers.add_parser("fetch-counts", help='fetch counts')
     parser.set_defaults(func=fetch_data)
@@ -46,16 +85,25 @@ def register_argparser(subparsers):
                        type=int,
                        nargs="+")
     parser.add_argument("-f", "--file",
-                        help="store data in a csv-file. Existing files are overwritten",
-                        default="-",
-                        dest="file",
-                        type=argparse.FileType('wt', encoding='UTF-8'))
+                        help="store data in a file, or in a directory with --partition-by. Existing files are "
+                             "overwritten unless --incremental is given. Data is written to standard output unless "
+                             "--file or --store is given",
+                        dest="file")
+    parser.add_argument("-F", "--format",
+                        help="format of the stored data. Defaults to `csv`",
+                        choices=list(OutputFormat),
+                        default=OutputFormat.CSV,
+                        dest="output_format",
+                        type=OutputFormat.from_string)
+    add_output_arguments(parser)
     parser.add_argument("-S", "--step-size",
-                        help="step size of the data to fetch. Defaults to `hour`",
+                        help="step sizes of the data to fetch. Only the finest step size is fetched, coarser step "
+                             "sizes are summed up locally. Defaults to `hour`",
                         choices=list(StepSize),
-                        default=StepSize.HOUR,
-                        dest="step_size",
-                        type=StepSize.from_string)
+                        default=[StepSize.HOUR],
+                        dest="step_sizes",
+                        type=StepSize.from_string,
+                        nargs="+")
     parser.add_argument("-B", "--begin",
                         help="fetch data starting at date. Date must be ISO 8610 formatted (YYYY-MM-DD)",
                         dest="begin",
@@ -78,98 +126,619 @@ def register_argparser(subparsers):
                         dest="means_of_transport",
                         type=MeansOfTransport.from_string,
                         nargs="+")
+    parser.add_argument("-c", "--concurrency",
+                        help="number of requests to run in parallel. Sites and their channels are fetched concurrently. "
+                             f"{RATE_CAP}. Defaults to 1",
+                        default=1,
+                        dest="concurrency",
+                        type=positive_int)
+    parser.add_argument("-P", "--processes",
+                        help="number of processes fetching sites in parallel. Each process fetches, decodes and merges "
+                             "the counts of its sites with --concurrency requests in parallel and shares the rate "
+                             "limit. Defaults to 1",
+                        default=1,
+                        dest="processes",
+                        type=positive_int)
+    parser.add_argument("-I", "--incremental",
+                        help="only fetch samples newer than the last sample fetched in a previous run and append them to the file",
+                        action="store_true",
+                        dest="incremental")
+    parser.add_argument("--state-file",
+                        help="file storing the last sample fetched from each channel in incremental mode. Defaults to FILE.state.json",
+                        dest="state_file")
+    parser.add_argument("--store",
+                        help="store the samples and the details of their sites in an SQLite database. Stored samples "
+                             "are replaced",
+                        dest="store")
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_engine_arguments(parser)
+    add_metrics_arguments(parser)
+
+
+def output_columns(step_sizes):
+    """
+    Returns the columns of the output. The step size is only written if
+    data of several step sizes is written.
+    """
+    return [column for column in Columns
+            if column != Columns.STEP_SIZE or len(set(step_sizes)) > 1]
+
+
+def fetch_data(domain_id, site_ids, step_sizes, file, output_format, begin, end, direction, means_of_transport,
+               concurrency, incremental, state_file, cache_dir, no_cache, rate, max_attempts, store, engine,
+               metrics_file, processes=1, compression=None, partition_by=None, client=None, metrics=None,
+               **kwargs):
+    """
+    Fetches the counts of the sites. The steps of the run command pass the
+    client and the metrics of the run, which then reports the requests.
+    """
+    if file is None and store is None:
+        file = "-"
+    shared_client = client is not None
+    sharded = processes > 1 and not shared_client
+    if sharded and store is not None:
+        sys.exit("error: --processes does not support --store")
+    if sharded and engine == Engine.ASYNC:
+        sys.exit("error: --processes only supports the threads engine")
+    step_size = fetched_step_size(step_sizes)
+    marks = None
+    if incremental:
+        if len(set(step_sizes)) > 1:
+            sys.exit("error: --incremental only supports a single step size")
+        if output_format != OutputFormat.CSV:
+            sys.exit("error: --incremental only supports the csv format")
+        if state_file is None and file in (None, "-"):
+            sys.exit("error: --incremental requires --file or --state-file")
+        marks = HighWaterMarks(state_file or f"{file}.state.json")
+
+    cache = None if shared_client else open_cache(cache_dir, no_cache)
+    metrics = Metrics() if metrics is None else metrics
+    with ExitStack() as stack:
+        client_options = dict(pool_size=concurrency, cache=cache, rate_limiter=RateLimiter(rate),
+                              max_attempts=max_attempts, metrics=metrics)
+        # The fetch methods of the async client are coroutines which are
+        # run by an event loop instead of thread pools:
+        if engine == Engine.ASYNC and not shared_client:
+            site_executor = channel_executor = stack.enter_context(EventLoopThread())
+            client = AsyncApiClient(**client_options)
+            stack.callback(site_executor.run, client.close())
+            open_site, fetch_window = _open_site_async, _fetch_window_async
+        else:
+            if not shared_client:
+                client = stack.enter_context(ApiClient(**client_options))
+            site_executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+            channel_executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+            open_site, fetch_window = _open_site, _fetch_window
+        output = writer = sample_store = None
+        if file is not None:
+            output, writer = stack.enter_context(open_output_writer(file, output_format, output_columns(step_sizes),
+                                                                    COLUMN_TYPES, incremental, compression,
+                                                                    partition_by, Columns.COUNTER_ID))
+        if store is not None:
+            sample_store = stack.enter_context(SampleStore(store))
 
+        if domain_id is not None:
+            sites = site_executor.submit(client.fetch_sites_in_domain, domain_id).result()
+            # Sites counting none of the selected means of transport have
+            # no channel to fetch, so their details are not requested:
+            site_ids, pruned = public_sites_with_means_of_transport(sites, means_of_transport)
+            if pruned:
+                print(f"pruning: {pruned} of {pruned + len(site_ids)} public sites count none of the selected means "
+                      f"of transport and are skipped, {len(site_ids)} sites are fetched", file=sys.stderr)
+
+        if sharded:
+            shard_options = dict(step_size=step_size, step_sizes=step_sizes, begin=begin, end=end,
+                                 direction=direction, means_of_transport=means_of_transport, marks=marks)
+            # The processes share the rate limit:
+            shard_client_options = dict(pool_size=concurrency, cache_dir=cache_dir, no_cache=no_cache,
+                                        rate=rate / processes, max_attempts=max_attempts)
+            shard_executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context("spawn"), initializer=_init_shard,
+                initargs=(ApiClient, shard_client_options, concurrency, shard_options)))
+            # Each process works on a site at a time. The chunks of the
+            # sites are written in the order of the site ids:
+            for result in Prefetcher(shard_executor, _fetch_shard, site_ids, 2 * processes):
+                client.statistics.merge(result.statistics)
+                _merge_cache_counts(cache, result.cache_counts)
+                metrics.add(result.requests, result.stages)
+                _write_chunks(writer, result.chunks, metrics)
+                _advance_marks(marks, output, step_size, result.new_marks)
+        else:
+            open_site = partial(open_site, client, channel_executor, partial(fetch_window, metrics=metrics),
+                                concurrency, step_size, begin=begin, end=end,
+                                direction=direction,
+                                means_of_transport=means_of_transport,
+                                marks=marks)
+            # Sites are opened ahead of time but their rows are written in
+            # the order of the site ids regardless of the completion order:
+            for site_id, (site, series) in zip(site_ids,
+                                               Prefetcher(site_executor, open_site, site_ids, concurrency)):
+                if sample_store is not None:
+                    sample_store.upsert_site(map_public_site_to_row(site))
+                    series = _store_series(site_id, series, sample_store, step_size, step_sizes)
+                new_marks = _save_series(site_id, series, writer, marks, step_size, step_sizes, metrics)
+                if sample_store is not None:
+                    sample_store.commit()
+                _advance_marks(marks, output, step_size, new_marks)
+    if not shared_client:
+        print_cache_statistics(cache)
+        print_request_statistics(client.statistics)
+        save_metrics(metrics, metrics_file)
+
+
+def _advance_marks(marks, output, step_size, new_marks):
+    # Only advance the marks once the samples are written so that an
+    # interrupted run does not lose samples:
+    if marks is None:
+        return
+    if output is not None:
+        output.flush()
+    marks.update(step_size, new_marks)
+    marks.save()
 
-def fetch_data(domain_id, site_ids, step_size, file, begin, end, direction, means_of_transport, **kwargs):
-    if domain_id is not None:
-        sites = apiclient.fetch_sites_in_domain(domain_id)
-        site_ids = [site["lienPublic"] for site in sites if site["lienPublic"] is not None]
 
-    csv_file = open_csv(file, Columns)
-    for site_id in site_ids:
-        data = _fetch_all_channels(step_size, site_id, begin, end, direction, means_of_transport)
-        _save_data(site_id, data, csv_file)
+def public_sites_with_means_of_transport(sites, means_of_transport):
+    """
+    Returns the ids of the public sites in a domain which count any of the
+    means of transport and the number of public sites which do not. Sites
+    are kept if the domain does not tell their means of transport.
+    """
+    selected = {means.value for means in means_of_transport}
+    site_ids = []
+    pruned = 0
+    for site in sites:
+        if site["lienPublic"] is None:
+            continue
+        counted = {counter["pratique"] for counter in site.get("pratique") or []}
+        if not counted and site.get("mainPratique") is not None:
+            counted = {site["mainPratique"]}
+        if counted and not counted & selected:
+            pruned += 1
+        else:
+            site_ids.append(site["lienPublic"])
+    return site_ids, pruned
+
+
+def _open_site(client, executor, fetch_window, lookahead, step_size, site_id, begin, end, direction,
+               means_of_transport, marks=None):
+    """
+    Fetches the site and starts fetching the windows of its channels with
+    fetch_window. Returns the site and its channels grouped by means of
+    transport and direction. Each channel is represented by its id, its
+    high-water mark and an iterable over the timeseries of its windows.
+    """
+    site = client.fetch_site(site_id)
+    return site, _open_channels(client, executor, fetch_window, lookahead, step_size, site_id, site, begin, end,
+                                direction, means_of_transport, marks)
 
 
-def _fetch_all_channels(step_size, site_id, begin, end, direction, means_of_transport):
+async def _open_site_async(client, executor, fetch_window, lookahead, step_size, site_id, begin, end, direction,
+                           means_of_transport, marks=None):
+    """
+    Coroutine variant of `_open_site` for the async client.
+    """
+    site = await client.fetch_site(site_id)
+    return site, _open_channels(client, executor, fetch_window, lookahead, step_size, site_id, site, begin, end,
+                                direction, means_of_transport, marks)
 
-    site = apiclient.fetch_site(site_id)
 
+def _open_channels(client, executor, fetch_window, lookahead, step_size, site_id, site, begin, end, direction,
+                   means_of_transport, marks):
     domain_id = site["domaine"]
     token = site["token"]
-    data = {}
+    series = {}
+    for channel, mark, windows in channel_windows(site, step_size, begin, end, direction, means_of_transport,
+                                                  marks):
+        fetch_channel_window = partial(fetch_window, client, domain_id, channel["id"],
+                                       step_size=step_size, token=token, site_id=site_id)
+        key = (MeansOfTransport(channel["userType"]), Direction(channel["sens"]))
+        series.setdefault(key, []).append(
+            (channel["id"], mark, Prefetcher(executor, fetch_channel_window, windows, lookahead)))
+    return series
+
+
+def channel_windows(site, step_size, begin, end, direction, means_of_transport, marks=None):
+    """
+    Yields the selected channels of the site with their high-water mark and
+    the windows in which their samples are fetched.
+    """
+    first_day = start_of_collection(site)
     for channel in site["channels"]:
-        _fetch_and_merge_channel(data, channel, domain_id, begin, end,
-                                 step_size, direction, means_of_transport,
-                                 token)
-    return data
+        if not is_channel_selected(channel, direction, means_of_transport):
+            continue
+        mark = marks.get(step_size, channel["id"]) if marks is not None else None
+        windows = split_date_range(_begin_after_mark(begin, mark), end,
+                                   step_size, first_day)
+        yield channel, mark, windows
 
 
-def _fetch_and_merge_channel(data, channel, domain_id, begin, end,
-                            step_size, directions, means_of_transports, token):
+def _begin_after_mark(begin, mark):
+    if mark is None:
+        return begin
+    mark_date = date.fromisoformat(mark[:10])
+    return mark_date if begin is None else max(begin, mark_date)
 
-    direction = Direction(channel["sens"])
-    means_of_transport = MeansOfTransport(channel["userType"])
-    channel_id = channel["id"]
 
-    if direction not in directions:
-        return
-    if means_of_transport not in means_of_transports:
+def _fetch_window(client, domain_id, channel_id, window, step_size, token, site_id, metrics):
+    """
+    Fetches a window of a channel. Failed windows are retried on their own
+    so that the other windows of the channel need not be fetched again. The
+    time spent parsing the samples is recorded in metrics.
+    """
+    begin, end = window
+    for attempt in range(1, WINDOW_ATTEMPTS + 1):
+        try:
+            samples = client.fetch_channel(domain_id, channel_id, begin, end,
+                                           step_size, token)
+            with metrics.timed("parse", site_id):
+                return TimeSeries.from_samples(samples)
+        except ApiError:
+            if attempt == WINDOW_ATTEMPTS:
+                raise
+            time.sleep(WINDOW_RETRY_DELAY * 2 ** (attempt - 1))
+
+
+async def _fetch_window_async(client, domain_id, channel_id, window, step_size, token, site_id, metrics):
+    """
+    Coroutine variant of `_fetch_window` for the async client.
+    """
+    begin, end = window
+    for attempt in range(1, WINDOW_ATTEMPTS + 1):
+        try:
+            samples = await client.fetch_channel(domain_id, channel_id, begin, end,
+                                                 step_size, token)
+            with metrics.timed("parse", site_id):
+                return TimeSeries.from_samples(samples)
+        except ApiError:
+            if attempt == WINDOW_ATTEMPTS:
+                raise
+            await asyncio.sleep(WINDOW_RETRY_DELAY * 2 ** (attempt - 1))
+
+
+def _new_samples(channels, new_marks):
+    """
+    Merges the samples of the channels after their high-water marks and
+    yields them in chunks. Trailing samples without a count are left out as
+    their counts may still be delivered in a later run. As the counts of a
+    channel may lag behind the other channels, the merged samples are cut
+    at the first trailing sample without a count of any channel. The date
+    of the last sample yielded is recorded in new_marks for each channel.
+    """
+    tails = [None] * len(channels)
+    windows = [_samples_after_mark(samples, mark, tails, index)
+               for index, (_, mark, samples) in enumerate(channels)]
+    held = TimeSeries()
+    last_date = None
+    for merged in _merge_windows(*windows):
+        held.extend(merged)
+        # The trailing samples without a count of a channel only start
+        # later once the channel delivers a count, so samples before the
+        # cut are complete:
+        cut = min((tail for tail in tails if tail is not None), default=None)
+        complete = len(held) if cut is None else bisect_left(held.timestamps, cut)
+        if complete:
+            last_date = held.date(complete - 1)
+            yield held[:complete]
+            held = held[complete:]
+    if last_date is not None:
+        new_marks.update((channel_id, last_date) for channel_id, _, _ in channels)
+
+
+def _samples_after_mark(windows, mark, tails, index):
+    """
+    Yields the samples of the windows after mark and records the timestamp
+    of the first of the trailing samples without a count in tails[index].
+    """
+    mark_timestamp = None if mark is None else parse_timestamp(mark)
+    for window in windows:
+        if mark_timestamp is not None:
+            window = window[bisect_right(window.timestamps, mark_timestamp):]
+        last = _last_counted(window)
+        if last >= 0:
+            tails[index] = window.timestamps[last + 1] if last + 1 < len(window) else None
+        elif window and tails[index] is None:
+            tails[index] = window.timestamps[0]
+        yield window
+
+
+def _last_counted(series):
+    counts = series.counts
+    index = len(counts) - 1
+    while index >= 0 and counts[index] == NO_COUNT:
+        index -= 1
+    return index
+
+
+def is_channel_selected(channel, directions, means_of_transports):
+    return (Direction(channel["sens"]) in directions
+            and MeansOfTransport(channel["userType"]) in means_of_transports)
+
+
+def _merge_windows(*channels):
+    """
+    Lazily merges channels given as iterables over the timeseries of their
+    windows. Yields the merged timeseries in chunks.
+    """
+    if len(channels) == 1:
+        yield from channels[0]
         return
+    windows = [iter(channel) for channel in channels]
+    pending = [TimeSeries() for _ in channels]
+    exhausted = [False] * len(channels)
+    needs_window = [True] * len(channels)
+    while True:
+        for index, channel_windows in enumerate(windows):
+            while needs_window[index] and not exhausted[index]:
+                window = next(channel_windows, None)
+                if window is None:
+                    exhausted[index] = True
+                elif window:
+                    pending[index].extend(window)
+                    needs_window[index] = False
+        ends = [series.timestamps[-1] for series, done in zip(pending, exhausted)
+                if not done]
+        if not ends:
+            merged = _merge_timeseries(*pending)
+            if merged:
+                yield merged
+            return
+        # No channel can have samples before the end of the channel whose
+        # pending samples end first. Samples at this end are held back as
+        # the next window of the channel may repeat the date:
+        end = min(ends)
+        heads = []
+        for index, series in enumerate(pending):
+            cut = bisect_left(series.timestamps, end)
+            heads.append(series[:cut])
+            pending[index] = series[cut:]
+            needs_window[index] = not pending[index] or pending[index].timestamps[-1] == end
+        merged = _merge_timeseries(*heads)
+        if merged:
+            yield merged
 
-    samples = apiclient.fetch_channel(domain_id, channel_id, begin, end,
-                                      step_size, token)
-
-    if not (means_of_transport, direction) in data:
-        data[(means_of_transport, direction)] = samples
-    else:
-        data[means_of_transport, direction] = \
-            _merge_timeseries(data[means_of_transport, direction], samples)
-
-
-def _merge_timeseries(data1, data2):
-    iter1 = iter(data1)
-    iter2 = iter(data2)
-    merged = []
-
-    sample1 = next(iter1, None)
-    sample2 = next(iter2, None)
-    while sample1 is not None and sample2 is not None:
-        if sample1["date"] == sample2["date"]:
-            sample1["comptage"] += sample2["comptage"]
-            merged.append(sample1)
-            sample1 = next(iter1, None)
-            sample2 = next(iter2, None)
-        elif sample1["date"] < sample2["date"]:
-            merged.append(sample1)
-            sample1 = next(iter1, None)
-        else:
-            merged.append(sample2)
-            sample2 = next(iter2, None)
 
-    if sample1 is not None:
-        merged.append(sample1)
-    if sample2 is not None:
-        merged.append(sample2)
+def _merge_timeseries(*timeseries):
+    """
+    Merges timeseries ordered by date. The counts of samples with the same
+    date are summed up. If a timeseries contains a date more than once, the
+    n-th samples with this date in each timeseries are summed up. The sum is
+    missing if the count of any of the samples is missing.
+    """
+    timeseries = [series for series in timeseries if series]
+    if not timeseries:
+        return TimeSeries()
+    first = timeseries[0]
+    if len(timeseries) == 1:
+        return first
+    # The channels of a site usually have samples for the same dates:
+    if all(series.timestamps == first.timestamps for series in timeseries[1:]):
+        return TimeSeries(first.timestamps, first.offsets,
+                          _sum_columns([series.counts for series in timeseries]), first.date_format)
+    if all(map(_is_strictly_increasing, (series.timestamps for series in timeseries))):
+        return _merge_unique_dates(timeseries)
+    return _merge_repeated_dates(timeseries)
+
 
-    merged.extend(iter1)
-    merged.extend(iter2)
+def _merge_unique_dates(timeseries):
+    # The work is left to set, dict and map, which do not run any Python
+    # code per sample:
+    timestamps = array("q", sorted(set().union(*(series.timestamps for series in timeseries))))
+    offsets = {}
+    for series in reversed(timeseries):
+        offsets.update(zip(series.timestamps, series.offsets))
+    counts = [array("q", map(dict(zip(series.timestamps, series.counts)).get, timestamps, repeat(0)))
+              for series in timeseries]
+    return TimeSeries(timestamps, array("i", map(offsets.__getitem__, timestamps)),
+                      _sum_columns(counts), timeseries[0].date_format)
+
+
+def _merge_repeated_dates(timeseries):
+    totals = {}
+    for series in timeseries:
+        for key, offset, count in zip(occurrences(series.timestamps), series.offsets, series.counts):
+            total = totals.get(key)
+            if total is None:
+                totals[key] = [offset, count]
+            else:
+                total[1] = _sum_counts(total[1], count)
+    merged = TimeSeries(date_format=timeseries[0].date_format)
+    for key in sorted(totals):
+        offset, count = totals[key]
+        merged.timestamps.append(key[0])
+        merged.offsets.append(offset)
+        merged.counts.append(count)
     return merged
 
 
-def _save_data(site_id, data, csv_file):
-    for (means_of_transport, direction), samples in data.items():
-        for sample in samples:
-            row = _map_sample_to_row(site_id, means_of_transport, direction,
-                                     sample)
-            csv_file.writerow(row)
+def _sum_columns(counts):
+    if any(NO_COUNT in column for column in counts):
+        return array("q", map(_sum_counts, *counts))
+    return array("q", map(sum, zip(*counts)))
+
+
+def _sum_counts(*counts):
+    return NO_COUNT if NO_COUNT in counts else sum(counts)
 
 
-def _map_sample_to_row(site_id, means_of_transport, direction, sample):
+def _is_strictly_increasing(timestamps):
+    return all(map(lt, timestamps, islice(timestamps, 1, None)))
+
+
+_ShardResult = namedtuple("_ShardResult", ["site_id", "chunks", "new_marks", "requests", "stages", "statistics",
+                                           "cache_counts"])
+
+# The client and options of a worker process of a sharded fetch:
+_shard = None
+
+
+def _init_shard(client_factory, client_options, concurrency, options):
+    global _shard
+    _shard = _Shard(client_factory, client_options, concurrency, options)
+
+
+def _fetch_shard(site_id):
+    return _shard.fetch(site_id)
+
+
+class _Shard:
+    """
+    Fetches, decodes and merges the counts of sites in a worker process.
+    The samples of a site are returned in chunks of a merged window or a
+    resampled series each, together with the requests, stages and
+    statistics recorded while fetching the site.
+    """
+
+    def __init__(self, client_factory, client_options, concurrency, options):
+        self._cache = open_cache(client_options["cache_dir"], client_options["no_cache"])
+        self._metrics = Metrics()
+        self._client = client_factory(pool_size=client_options["pool_size"], cache=self._cache,
+                                      rate_limiter=RateLimiter(client_options["rate"]),
+                                      max_attempts=client_options["max_attempts"], metrics=self._metrics)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._concurrency = concurrency
+        self._options = options
+
+    def fetch(self, site_id):
+        options = self._options
+        site, series = _open_site(self._client, self._executor, partial(_fetch_window, metrics=self._metrics),
+                                  self._concurrency, options["step_size"], site_id, begin=options["begin"],
+                                  end=options["end"], direction=options["direction"],
+                                  means_of_transport=options["means_of_transport"], marks=options["marks"])
+        batch = _ChunkBatch()
+        new_marks = _save_series(site_id, series, batch, options["marks"], options["step_size"],
+                                 options["step_sizes"], self._metrics)
+        requests, stages = self._metrics.take()
+        statistics, self._client.statistics = self._client.statistics, RequestStatistics()
+        return _ShardResult(site_id, batch.chunks, new_marks, requests, stages, statistics, self._take_cache_counts())
+
+    def _take_cache_counts(self):
+        cache = self._cache
+        if cache is None:
+            return None
+        counts = (cache.hits, cache.misses, cache.revalidated)
+        cache.hits = cache.misses = cache.revalidated = 0
+        return counts
+
+
+_SeriesChunk = namedtuple("_SeriesChunk", ["values", "timestamps", "offsets", "counts", "date_format"])
+
+
+class _ChunkBatch:
+    """
+    Collects the series written by `_save_series` as chunks whose samples
+    are kept in arrays, which are sent to the parent process without an
+    object per sample. Missing counts are stored as NO_COUNT.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writeseries(self, values, timestamps, offsets, counts, date_format=None):
+        counts = array("q", (NO_COUNT if count is None else count for count in counts))
+        self.chunks.append(_SeriesChunk(values, timestamps, offsets, counts, date_format))
+
+
+def _write_chunks(writer, chunks, metrics):
+    for chunk in chunks:
+        with metrics.timed("write", chunk.values[Columns.COUNTER_ID]):
+            counts = [None if count == NO_COUNT else count for count in chunk.counts]
+            writer.writeseries(chunk.values, chunk.timestamps, chunk.offsets, counts, chunk.date_format)
+
+
+def _merge_cache_counts(cache, counts):
+    if cache is None or counts is None:
+        return
+    hits, misses, revalidated = counts
+    cache.hits += hits
+    cache.misses += misses
+    cache.revalidated += revalidated
+
+
+def _store_series(site_id, series, sample_store, step_size, step_sizes):
+    """
+    Returns the series with channels whose windows are stored in the sample
+    store as they are fetched. The windows are fetched with step_size and
+    stored for each of the step sizes.
+    """
     return {
-        Columns.COUNTER_ID: site_id,
-        Columns.MEANS_OF_TRANSPORT: means_of_transport,
-        Columns.DIRECTION: direction,
-        Columns.TIMESTAMP: sample["date"],
-        Columns.COUNT: sample["comptage"]
+        key: [(channel_id, mark,
+               _store_windows(windows, sample_store, step_size, step_sizes, site_id, channel_id, *key))
+              for channel_id, mark, windows in channels]
+        for key, channels in series.items()
     }
+
+
+def _store_windows(windows, sample_store, step_size, step_sizes, site_id, channel_id, means_of_transport,
+                   direction):
+    upsert = partial(sample_store.upsert_channel, counter_id=site_id, channel_id=channel_id,
+                     means_of_transport=means_of_transport, direction=direction)
+    resamplers = _resamplers(step_size, step_sizes)
+    for window in windows:
+        if step_size in step_sizes:
+            upsert(step_size, series=window)
+        for resampler in resamplers:
+            upsert(resampler.step_size, series=resampler.add(window))
+        yield window
+    for resampler in resamplers:
+        upsert(resampler.step_size, series=resampler.flush())
+
+
+def _resamplers(step_size, step_sizes):
+    return [Resampler(resampled) for resampled in sorted(set(step_sizes), key=_step_size_order)
+            if resampled != step_size]
+
+
+def _step_size_order(step_size):
+    return step_size.value
+
+
+def _save_series(site_id, series, writer, marks, step_size, step_sizes, metrics):
+    """
+    Merges the channels of each series and writes the samples while they
+    are fetched with step_size. The samples of the coarser step sizes are
+    summed up locally and written after them. Without a writer, the
+    channels are only read. The time spent writing is recorded in metrics.
+    Returns the new high-water marks of the channels.
+    """
+    new_marks = {}
+    for key in sorted(series, key=_series_order):
+        channels = series[key]
+        if marks is not None:
+            timeseries = [_new_samples(channels, new_marks)]
+        else:
+            timeseries = [windows for _, _, windows in channels]
+        means_of_transport, direction = key
+        if writer is None:
+            for windows in timeseries:
+                deque(windows, maxlen=0)
+            continue
+        write = partial(_write_samples, writer, metrics, site_id, means_of_transport, direction)
+        resamplers = _resamplers(step_size, step_sizes)
+        resampled = [TimeSeries() for _ in resamplers]
+        for merged in _merge_windows(*timeseries):
+            if step_size in step_sizes:
+                write(step_size, merged)
+            for resampler, samples in zip(resamplers, resampled):
+                samples.extend(resampler.add(merged))
+        for resampler, samples in zip(resamplers, resampled):
+            samples.extend(resampler.flush())
+            write(resampler.step_size, samples)
+    return new_marks
+
+
+def _write_samples(writer, metrics, site_id, means_of_transport, direction, step_size, series):
+    with metrics.timed("write", site_id):
+        values = {
+            Columns.COUNTER_ID: site_id,
+            Columns.MEANS_OF_TRANSPORT: means_of_transport,
+            Columns.DIRECTION: direction,
+            Columns.STEP_SIZE: step_size,
+        }
+        counts = [None if count == NO_COUNT else count for count in series.counts]
+        writer.writeseries(values, series.timestamps, series.offsets, counts, series.date_format)
+
+
+def _series_order(key):
+    means_of_transport, direction = key
+    return means_of_transport.value, direction.value
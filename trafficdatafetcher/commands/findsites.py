@@ -0,0 +1,128 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from enum import auto
+from pathlib import Path
+
+from trafficdatafetcher.apiclient import MeansOfTransport
+from trafficdatafetcher.cache import METADATA_TTL
+from trafficdatafetcher.catalog import Catalog
+from trafficdatafetcher.commands.updatecatalog import add_catalog_arguments
+from trafficdatafetcher.csvutils import open_csv
+from trafficdatafetcher.types import EnumWithLowerCaseNames, positive_float
+
+# Time after which a refresh which did not finish may be started again:
+REFRESH_TIMEOUT = 10 * 60
+
+
+class Columns(EnumWithLowerCaseNames):
+    ID = auto()
+    PUBLIC_ID = auto()
+    DOMAIN_ID = auto()
+    DOMAIN_NAME = auto()
+    NAME = auto()
+    LATITUDE = auto()
+    LONGITUDE = auto()
+    MEANS_OF_TRANSPORT = auto()
+    DISTANCE = auto()
+
+
+def register_argparser(subparsers):
+    parser = subparsers.add_parser("find-sites", help="find counter sites in the catalog without requests")
+    parser.set_defaults(func=find_sites)
+    parser.add_argument("words",
+                        help="words which start a word of the name of each site or its domain",
+                        metavar="WORD",
+                        nargs="*")
+    parser.add_argument("-d", "--domain",
+                        help="id of the domain whose counter sites should be found",
+                        dest="domain_id",
+                        type=int)
+    parser.add_argument("--box",
+                        help="find counter sites within a bounding box",
+                        metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+                        dest="box",
+                        type=float,
+                        nargs=4)
+    parser.add_argument("--near",
+                        help="find counter sites within a radius in km around a point, ordered by distance",
+                        metavar=("LATITUDE", "LONGITUDE", "RADIUS"),
+                        dest="near",
+                        type=float,
+                        nargs=3)
+    parser.add_argument("-M", "--means-of-transport",
+                        help="find counter sites counting any of the means of transport",
+                        choices=list(MeansOfTransport),
+                        dest="means_of_transport",
+                        type=MeansOfTransport.from_string,
+                        nargs="+")
+    parser.add_argument("-f", "--file",
+                        help="store counter sites in a csv-file. Existing files are overwritten",
+                        default="-",
+                        dest="file",
+                        type=argparse.FileType('wt', encoding='UTF-8'))
+    add_catalog_arguments(parser)
+    parser.add_argument("--max-age",
+                        help=f"refresh the catalog in the background if it is older than the number of hours. "
+                             f"Defaults to {METADATA_TTL.total_seconds() / 3600:g}",
+                        default=METADATA_TTL.total_seconds() / 3600,
+                        dest="max_age",
+                        type=positive_float)
+    parser.add_argument("--no-refresh",
+                        help="do not refresh the catalog in the background",
+                        action="store_true",
+                        dest="no_refresh")
+
+
+def find_sites(words, domain_id, box, near, means_of_transport, file, catalog, max_age, no_refresh, **kwargs):
+    if not Path(catalog).exists():
+        sys.exit(f"error: there is no catalog at {catalog}. Create it with update-catalog")
+    with Catalog(catalog) as site_catalog:
+        refreshed = site_catalog.refreshed()
+        if not no_refresh and (refreshed is None or refreshed < time.time() - max_age * 3600) \
+                and site_catalog.claim_refresh(REFRESH_TIMEOUT):
+            _start_refresh(catalog)
+            print("catalog: refreshing in the background", file=sys.stderr)
+        sites = site_catalog.find_sites(words, domain_id, box, near, means_of_transport)
+    csv_file = open_csv(file, Columns)
+    for site in sites:
+        csv_file.writerow(_map_site_to_row(site))
+
+
+def _start_refresh(catalog):
+    # The refresh runs in a process of its own, which outlives this one:
+    subprocess.Popen([sys.executable, "-m", "trafficdatafetcher", "update-catalog", "--catalog", str(catalog)],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=os.name == "posix")
+
+
+def _map_site_to_row(site):
+    return {
+        Columns.ID: site.site_id,
+        Columns.PUBLIC_ID: site.public_id,
+        Columns.DOMAIN_ID: site.domain_id,
+        Columns.DOMAIN_NAME: site.domain_name,
+        Columns.NAME: site.name,
+        Columns.LATITUDE: site.latitude,
+        Columns.LONGITUDE: site.longitude,
+        Columns.MEANS_OF_TRANSPORT: " ".join(map(str, site.means_of_transport)),
+        Columns.DISTANCE: "" if site.distance is None else f"{site.distance:.3f}",
+    }
@@ -17,7 +17,10 @@
 import argparse
 from enum import auto
 
-from trafficdatafetcher import apiclient
+from trafficdatafetcher.apiclient import ApiClient
+from trafficdatafetcher.commands.common import add_cache_arguments, add_rate_limit_arguments, open_cache, \
+    print_cache_statistics, print_request_statistics
+from trafficdatafetcher.ratelimit import RateLimiter
 from trafficdatafetcher.types import EnumWithLowerCaseNames
 from trafficdatafetcher.csvutils import open_csv
 
@@ -35,13 +38,19 @@ def register_argparser(subparsers):
                         default="-",
                         dest="file",
                         type=argparse.FileType('wt', encoding='UTF-8'))
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
 
 
-def list_domains(file, **kwargs):
+def list_domains(file, cache_dir, no_cache, rate, max_attempts, **kwargs):
     csv_file = open_csv(file, Columns)
-    domains = apiclient.fetch_domains()
+    cache = open_cache(cache_dir, no_cache)
+    with ApiClient(cache=cache, rate_limiter=RateLimiter(rate), max_attempts=max_attempts) as client:
+        domains = client.fetch_domains()
     for domain in domains:
         csv_file.writerow(_map_site_list_to_row(domain))
+    print_cache_statistics(cache)
+    print_request_statistics(client.statistics)
 
 
 def _map_site_list_to_row(domain):
@@ -15,12 +15,21 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from enum import auto
+from functools import partial
 
-from trafficdatafetcher import apiclient
-from trafficdatafetcher.apiclient import MeansOfTransport
+from trafficdatafetcher.apiclient import ApiClient, MeansOfTransport
+from trafficdatafetcher.asyncclient import AsyncApiClient, EventLoopThread
+from trafficdatafetcher.commands.common import RATE_CAP, Engine, add_cache_arguments, add_engine_arguments, \
+    add_metrics_arguments, add_rate_limit_arguments, open_cache, print_cache_statistics, print_request_statistics, \
+    save_metrics
 from trafficdatafetcher.csvutils import open_csv
-from trafficdatafetcher.types import EnumWithLowerCaseNames
+from trafficdatafetcher.metrics import Metrics
+from trafficdatafetcher.prefetcher import Prefetcher
+from trafficdatafetcher.ratelimit import RateLimiter
+from trafficdatafetcher.types import EnumWithLowerCaseNames, positive_int
 
 
 class Columns(EnumWithLowerCaseNames):
@@ -56,34 +65,75 @@ def register_argparser(subparsers):
                         default="-",
                         dest="file",
                         type=argparse.FileType('wt', encoding='UTF-8'))
+    parser.add_argument("-c", "--concurrency",
+                        help=f"number of site details to fetch in parallel. {RATE_CAP}. Defaults to 1",
+                        default=1,
+                        dest="concurrency",
+                        type=positive_int)
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_engine_arguments(parser)
+    add_metrics_arguments(parser)
+
+
+def list_sites(domain_id, site_ids, file, concurrency, cache_dir, no_cache, rate, max_attempts, engine,
+               metrics_file, client=None, metrics=None, **kwargs):
+    """
+    Lists the sites. The steps of the run command pass the client and the
+    metrics of the run, which then reports the requests.
+    """
+    shared_client = client is not None
+    cache = None if shared_client else open_cache(cache_dir, no_cache)
+    metrics = Metrics() if metrics is None else metrics
+    with ExitStack() as stack:
+        client_options = dict(pool_size=concurrency, cache=cache, rate_limiter=RateLimiter(rate),
+                              max_attempts=max_attempts, metrics=metrics)
+        # The fetch methods of the async client are coroutines which are
+        # run by an event loop instead of a thread pool:
+        if engine == Engine.ASYNC and not shared_client:
+            executor = stack.enter_context(EventLoopThread())
+            client = AsyncApiClient(**client_options)
+            stack.callback(executor.run, client.close())
+        else:
+            if not shared_client:
+                client = stack.enter_context(ApiClient(**client_options))
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+        if domain_id is not None:
+            _fetch_and_save_all_sites_in_domain(client, executor, concurrency, domain_id, file, metrics)
+        else:
+            _fetch_and_save_sites(client, executor, concurrency, file, site_ids, metrics)
+    if not shared_client:
+        print_cache_statistics(cache)
+        print_request_statistics(client.statistics)
+        save_metrics(metrics, metrics_file)
 
 
-def list_sites(domain_id, site_ids, file, **kwargs):
-    if domain_id is not None:
-        _fetch_and_save_all_sites_in_domain(domain_id, file)
-    else:
-        _fetch_and_save_sites(file, site_ids)
-
-
-def _fetch_and_save_all_sites_in_domain(domain_id, file):
+def _fetch_and_save_all_sites_in_domain(client, executor, concurrency, domain_id, file, metrics):
     csv_file = open_csv(file, Columns)
-    sites = apiclient.fetch_sites_in_domain(domain_id)
+    sites = executor.submit(client.fetch_sites_in_domain, domain_id).result()
+    # Only public sites need to be fetched. Their details are fetched
+    # ahead of time while the rows are written in the order of the domain:
+    public_site_ids = [site["lienPublic"] for site in sites if site["lienPublic"] is not None]
+    # The sites are listed without their tokens and can therefore be taken
+    # from the cache:
+    fetch_site = partial(client.fetch_site, with_token=False)
+    public_sites = iter(Prefetcher(executor, fetch_site, public_site_ids, concurrency))
     for site in sites:
         if site["lienPublic"] is None:
             site_row = _map_site_to_row(domain_id, site)
         else:
-            public_site_id = site["lienPublic"]
-            public_site = apiclient.fetch_site(public_site_id)
-            site_row = _map_public_site_to_row(public_site)
-        csv_file.writerow(site_row)
+            site_row = map_public_site_to_row(next(public_sites))
+        with metrics.timed("write", site_row[Columns.ID]):
+            csv_file.writerow(site_row)
 
 
-def _fetch_and_save_sites(file, site_ids):
+def _fetch_and_save_sites(client, executor, concurrency, file, site_ids, metrics):
     csv_file = open_csv(file, Columns)
-    for site_id in site_ids:
-        site = apiclient.fetch_site(site_id)
-        site_row = _map_public_site_to_row(site)
-        csv_file.writerow(site_row)
+    fetch_site = partial(client.fetch_site, with_token=False)
+    for site in Prefetcher(executor, fetch_site, site_ids, concurrency):
+        site_row = map_public_site_to_row(site)
+        with metrics.timed("write", site_row[Columns.ID]):
+            csv_file.writerow(site_row)
 
 
 def _map_site_to_row(domain_id, site):
@@ -112,7 +162,7 @@ def _calculate_means_of_transport_count(counters):
     return len(means_of_transports)
 
 
-def _map_public_site_to_row(site):
+def map_public_site_to_row(site):
     return {
         Columns.ID: site["idPdc"],
         Columns.DOMAIN_ID: site["domaine"],
@@ -0,0 +1,138 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from trafficdatafetcher.apiclient import ApiClient, ApiError
+from trafficdatafetcher.commands import fetchcounts, listsites
+from trafficdatafetcher.commands.common import RATE_CAP, add_cache_arguments, add_metrics_arguments, \
+    add_rate_limit_arguments, open_cache, print_cache_statistics, print_request_statistics, save_metrics
+from trafficdatafetcher.metrics import Metrics
+from trafficdatafetcher.planner import RequestPlanner
+from trafficdatafetcher.ratelimit import RateLimiter
+from trafficdatafetcher.resample import fetched_step_size
+from trafficdatafetcher.types import positive_int
+
+STEP_COMMANDS = (listsites, fetchcounts)
+
+
+def register_argparser(subparsers):
+    parser = subparsers.add_parser("run", help="run several list-sites and fetch-counts steps sharing their requests")
+    parser.set_defaults(func=run)
+    parser.add_argument("spec",
+                        help="JSON file with the steps of the run. Each step is given as the arguments of a "
+                             "list-sites or fetch-counts command")
+    parser.add_argument("-c", "--concurrency",
+                        help=f"number of sites to fetch in parallel while planning the run. {RATE_CAP}. Defaults to 4",
+                        default=4,
+                        dest="concurrency",
+                        type=positive_int)
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+    add_metrics_arguments(parser)
+
+
+def run(spec, concurrency, cache_dir, no_cache, rate, max_attempts, metrics_file, **kwargs):
+    steps = [_parse_step(arguments) for arguments in _load_spec(spec)]
+    cache = open_cache(cache_dir, no_cache)
+    metrics = Metrics()
+    # The steps send their requests through the client of the run. Their
+    # own cache, rate limit, engine and metrics options are ignored:
+    pool_size = max([concurrency, *(step.concurrency for step in steps)])
+    with ApiClient(pool_size=pool_size, cache=cache, rate_limiter=RateLimiter(rate),
+                   max_attempts=max_attempts, metrics=metrics) as client:
+        planner = RequestPlanner(client)
+        _plan(planner, steps, concurrency)
+        for step in steps:
+            step.func(**vars(step), client=planner, metrics=metrics)
+            if hasattr(step.file, "close") and step.file is not sys.stdout:
+                step.file.close()
+    print_cache_statistics(cache)
+    print_request_statistics(client.statistics)
+    print(f"planner: {planner.requested} requests for {planner.fetched} resources, "
+          f"{planner.planned} channel requests planned", file=sys.stderr)
+    save_metrics(metrics, metrics_file)
+
+
+def _load_spec(spec):
+    """
+    Reads the steps of a run from a JSON file of the form
+    `{"steps": [["list-sites", "-d", "4701"], ["fetch-counts", ...]]}`.
+    """
+    try:
+        with open(spec, encoding="UTF-8") as file:
+            steps = json.load(file)["steps"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        sys.exit(f"error: cannot read run spec {spec}: {e}")
+    if not isinstance(steps, list) or not all(isinstance(step, list) for step in steps):
+        sys.exit(f"error: the steps in run spec {spec} must be lists of arguments")
+    return steps
+
+
+def _parse_step(arguments):
+    parser = argparse.ArgumentParser(prog="run step")
+    subparsers = parser.add_subparsers(required=True)
+    for command in STEP_COMMANDS:
+        command.register_argparser(subparsers)
+    return parser.parse_args([str(argument) for argument in arguments])
+
+
+def _plan(planner, steps, concurrency):
+    """
+    Collects the sites of all steps and fetches each of them once. Then
+    plans the channel requests of the fetch-counts steps so that channel
+    data needed by several steps is only fetched once.
+    """
+    step_site_ids = [_site_ids(planner, step) for step in steps]
+    site_ids = list(dict.fromkeys(site_id for site_ids in step_site_ids for site_id in site_ids))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        sites = dict(zip(site_ids, executor.map(partial(_fetch_site_or_none, planner), site_ids)))
+    for step, site_ids in zip(steps, step_site_ids):
+        # The windows of incremental steps depend on their state files:
+        if step.func != fetchcounts.fetch_data or step.incremental:
+            continue
+        step_size = fetched_step_size(step.step_sizes)
+        for site_id in site_ids:
+            site = sites[site_id]
+            if site is None:
+                continue
+            for channel, _, windows in fetchcounts.channel_windows(site, step_size, step.begin, step.end,
+                                                                   step.direction, step.means_of_transport):
+                for begin, end in windows:
+                    planner.plan_channel(site["domaine"], channel["id"], begin, end, step_size)
+
+
+def _site_ids(planner, step):
+    if step.domain_id is None:
+        return step.site_ids
+    sites = planner.fetch_sites_in_domain(step.domain_id)
+    if step.func == fetchcounts.fetch_data:
+        site_ids, _ = fetchcounts.public_sites_with_means_of_transport(sites, step.means_of_transport)
+        return site_ids
+    return [site["lienPublic"] for site in sites if site["lienPublic"] is not None]
+
+
+def _fetch_site_or_none(planner, site_id):
+    # Failing sites are left to the steps to report:
+    try:
+        return planner.fetch_site(site_id)
+    except ApiError:
+        return None
@@ -0,0 +1,116 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
+
+from trafficdatafetcher.apiclient import ApiClient, Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.commands.common import RATE_CAP, add_rate_limit_arguments, print_request_statistics
+from trafficdatafetcher.ratelimit import RateLimiter
+from trafficdatafetcher.service import RETRY_INTERVAL, Poller, start_server
+from trafficdatafetcher.types import positive_float, positive_int
+
+DEFAULT_PORT = 8080
+
+
+def register_argparser(subparsers):
+    parser = subparsers.add_parser("serve", help="poll counts continuously and serve the latest ones over HTTP")
+    parser.set_defaults(func=serve)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-d", "--domain",
+                       help="id of the domain whose counter sites should be polled",
+                       dest="domain_id",
+                       type=int)
+    group.add_argument("-s", "--sites",
+                       help="ids of the counter sites to poll",
+                       dest="site_ids",
+                       type=int,
+                       nargs="+")
+    parser.add_argument("-S", "--step-size",
+                        help="step sizes of the data to poll. Defaults to `quarter_of_an_hour`",
+                        choices=list(StepSize),
+                        default=[StepSize.QUARTER_OF_AN_HOUR],
+                        dest="step_sizes",
+                        type=StepSize.from_string,
+                        nargs="+")
+    parser.add_argument("-D", "--direction",
+                        help="select directions to poll. By default, data for all directions is polled",
+                        choices=list(Direction),
+                        default=list(Direction),
+                        dest="direction",
+                        type=Direction.from_string,
+                        nargs="+")
+    parser.add_argument("-M", "--means-of-transport",
+                        help="select means of transport to poll. By default, data for all means of transport is "
+                             "polled",
+                        choices=list(MeansOfTransport),
+                        default=list(MeansOfTransport),
+                        dest="means_of_transport",
+                        type=MeansOfTransport.from_string,
+                        nargs="+")
+    parser.add_argument("--buffer-size",
+                        help="number of samples kept in memory per channel and step size. Defaults to 672, a week of "
+                             "quarter hours",
+                        default=672,
+                        dest="buffer_size",
+                        type=positive_int)
+    parser.add_argument("--retry-interval",
+                        help=f"seconds until a channel whose next sample is overdue is polled again. Doubles with "
+                             f"each poll without new samples. Defaults to {RETRY_INTERVAL}",
+                        default=RETRY_INTERVAL,
+                        dest="retry_interval",
+                        type=positive_float)
+    parser.add_argument("--host",
+                        help="address to serve on. Defaults to `127.0.0.1`",
+                        default="127.0.0.1",
+                        dest="host")
+    parser.add_argument("--port",
+                        help=f"port to serve on. Defaults to {DEFAULT_PORT}",
+                        default=DEFAULT_PORT,
+                        dest="port",
+                        type=int)
+    parser.add_argument("-c", "--concurrency",
+                        help=f"number of requests to run in parallel. {RATE_CAP}. Defaults to 4",
+                        default=4,
+                        dest="concurrency",
+                        type=positive_int)
+    add_rate_limit_arguments(parser)
+
+
+def serve(domain_id, site_ids, step_sizes, direction, means_of_transport, buffer_size, retry_interval, host, port,
+          concurrency, rate, max_attempts, **kwargs):
+    # The response cache would hide new samples. The session and the sites
+    # are kept warm by the poller instead:
+    with ApiClient(pool_size=concurrency, rate_limiter=RateLimiter(rate), max_attempts=max_attempts) as client, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        poller = Poller(client, site_ids, domain_id, step_sizes, direction, means_of_transport, buffer_size,
+                        retry_interval)
+        server = start_server(poller, host, port)
+        stop = Event()
+        scheduler = Thread(target=poller.run, args=(executor, stop), daemon=True)
+        scheduler.start()
+        print(f"serve: serving on http://{host}:{server.server_address[1]}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            poller.wake_up()
+            scheduler.join()
+            server.server_close()
+    print_request_statistics(client.statistics)
@@ -0,0 +1,96 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from trafficdatafetcher.apiclient import ApiClient, ApiError
+from trafficdatafetcher.catalog import Catalog, default_catalog_file
+from trafficdatafetcher.commands.common import RATE_CAP, add_cache_arguments, add_rate_limit_arguments, \
+    open_cache, print_cache_statistics, print_request_statistics
+from trafficdatafetcher.prefetcher import Prefetcher
+from trafficdatafetcher.ratelimit import RateLimiter
+from trafficdatafetcher.types import positive_int
+
+
+def register_argparser(subparsers):
+    parser = subparsers.add_parser("update-catalog", help="store domains and their sites for find-sites")
+    parser.set_defaults(func=update_catalog)
+    parser.add_argument("-d", "--domains",
+                        help="ids of the domains to update. By default, all domains are updated and domains which "
+                             "no longer exist are removed",
+                        dest="domain_ids",
+                        type=int,
+                        nargs="+")
+    add_catalog_arguments(parser)
+    parser.add_argument("-c", "--concurrency",
+                        help=f"number of domains to fetch in parallel. {RATE_CAP}. Defaults to 4",
+                        default=4,
+                        dest="concurrency",
+                        type=positive_int)
+    add_cache_arguments(parser)
+    add_rate_limit_arguments(parser)
+
+
+def add_catalog_arguments(parser):
+    parser.add_argument("--catalog",
+                        help=f"SQLite database of the catalog. Defaults to `{default_catalog_file()}`",
+                        default=default_catalog_file(),
+                        dest="catalog")
+
+
+def update_catalog(domain_ids, catalog, concurrency, cache_dir, no_cache, rate, max_attempts, **kwargs):
+    Path(catalog).parent.mkdir(parents=True, exist_ok=True)
+    cache = open_cache(cache_dir, no_cache)
+    with ApiClient(pool_size=concurrency, cache=cache, rate_limiter=RateLimiter(rate),
+                   max_attempts=max_attempts) as client, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            Catalog(catalog) as site_catalog:
+        names = {domain["id"]: domain["name"] for domain in client.fetch_domains()}
+        refresh_all = domain_ids is None
+        if refresh_all:
+            domain_ids = list(names)
+        sites_in_domains = Prefetcher(executor, partial(_fetch_sites_or_error, client), domain_ids, concurrency)
+        site_count = 0
+        failed = 0
+        for domain_id, (sites, error) in zip(domain_ids, sites_in_domains):
+            # Domains which fail keep the sites of their last update:
+            if error is not None:
+                print(f"error: {error}", file=sys.stderr)
+                failed += 1
+                continue
+            site_catalog.replace_domain(domain_id, names.get(domain_id, ""), sites)
+            site_count += len(sites)
+        if refresh_all:
+            site_catalog.remove_domains(set(domain_ids))
+            if not failed:
+                site_catalog.mark_refreshed()
+    print_cache_statistics(cache)
+    print_request_statistics(client.statistics)
+    print(f"catalog: {len(domain_ids) - failed} domains with {site_count} sites updated, {failed} failed",
+          file=sys.stderr)
+    if failed:
+        sys.exit("error: some domains could not be updated. Run update-catalog again to retry them")
+
+
+def _fetch_sites_or_error(client, domain_id):
+    # The other domains are updated even if fetching a domain fails:
+    try:
+        return client.fetch_sites_in_domain(domain_id), None
+    except ApiError as e:
+        return None, e
@@ -15,10 +15,90 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import csv
+import io
 
+from trafficdatafetcher.timestamps import format_date, format_dates
 
-def open_csv(file, columns):
+DIALECT = "unix"
+
+
+def open_csv(file, columns, write_header=True, timestamp_columns=()):
+    """
+    Opens a CSV writer for rows given as dicts keyed by the columns. Values
+    of the timestamp columns are (timestamp, offset) pairs as returned by
+    `timestamps.parse_date`, optionally followed by their date format, and
+    are written in the format of the API. With timestamp columns, series of
+    samples can also be written at once with `writeseries`.
+    """
     csv_file = csv.DictWriter(file, columns, restval="",
-                              extrasaction="ignore", dialect="unix")
-    csv_file.writeheader()
+                              extrasaction="ignore", dialect=DIALECT)
+    if write_header:
+        csv_file.writeheader()
+    if timestamp_columns:
+        return _TimestampFormatter(file, csv_file, columns, timestamp_columns)
     return csv_file
+
+
+class _TimestampFormatter:
+    def __init__(self, file, writer, columns, timestamp_columns):
+        self._file = file
+        self._writer = writer
+        self._columns = list(columns)
+        self._timestamp_columns = list(timestamp_columns)
+
+    def writerow(self, row):
+        # The row of the caller is left unchanged:
+        formatted = dict(row)
+        for column in self._timestamp_columns:
+            value = row.get(column)
+            if value is not None:
+                formatted[column] = format_date(*value)
+        self._writer.writerow(formatted)
+
+    def writeseries(self, values, timestamps, offsets, counts, date_format=None):
+        """
+        Writes a row for each sample of a series. The values of the columns
+        which are the same for all samples are given as dict. The remaining
+        timestamp column and count column take the timestamps, offsets and
+        counts of the samples. Counts are None if missing. The dates are
+        written in date_format (see `timestamps.format_date`).
+
+        The rows are the same as written by writerow, but the values are
+        only rendered once for the whole series.
+        """
+        template, count_first = self._template(values)
+        dates = format_dates(timestamps, offsets, date_format)
+        counts = ["" if count is None else count for count in counts]
+        pairs = zip(counts, dates) if count_first else zip(dates, counts)
+        self._file.write("".join(map(template.__mod__, pairs)))
+
+    def _template(self, values):
+        """
+        Returns a %-format string of a row with the values and placeholders
+        for the date and count of a sample, and whether the count comes
+        first.
+        """
+        variable = [column for column in self._columns if column not in values]
+        timestamp_columns = [column for column in variable if column in self._timestamp_columns]
+        if len(variable) != 2 or len(timestamp_columns) != 1:
+            raise ValueError("series need values for all but a timestamp column and a count column")
+        dialect = csv.get_dialect(DIALECT)
+        fields = []
+        for column in self._columns:
+            if column in values:
+                fields.append(_render(values[column]).replace("%", "%%"))
+            else:
+                # The dialect quotes all fields. Dates and counts contain no
+                # characters which need to be escaped:
+                fields.append(f"{dialect.quotechar}%s{dialect.quotechar}")
+        count_first = variable[0] not in timestamp_columns
+        return dialect.delimiter.join(fields) + dialect.lineterminator, count_first
+
+
+def _render(value):
+    """
+    Returns a value as it is written by the CSV writer.
+    """
+    field = io.StringIO()
+    csv.writer(field, dialect=DIALECT).writerow([value])
+    return field.getvalue()[:-len(csv.get_dialect(DIALECT).lineterminator)]
@@ -0,0 +1,69 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date, timedelta
+
+from trafficdatafetcher.apiclient import StepSize
+
+# Size of the windows in months. Windows keep the responses for fine step
+# sizes small. Coarser step sizes are fetched in a single request:
+WINDOW_MONTHS = {
+    StepSize.QUARTER_OF_AN_HOUR: 1,
+    StepSize.HOUR: 12,
+}
+
+
+def split_date_range(begin, end, step_size, first_day=None):
+    """
+    Splits the range from begin to end (exclusively) into windows sized for
+    the step size. The windows are aligned to calendar months or years so
+    that the same windows are requested regardless of the range.
+
+    If begin is None, first_day is used as start of the range. If end is
+    None, the range ends after the current day. Ranges without begin and
+    first_day are not split.
+    """
+    months = WINDOW_MONTHS.get(step_size)
+    begin = begin or first_day
+    if months is None or begin is None:
+        return [(begin, end)]
+    if end is None:
+        end = date.today() + timedelta(days=1)
+
+    windows = []
+    window_begin = begin
+    while window_begin < end:
+        window_end = min(_next_boundary(window_begin, months), end)
+        windows.append((window_begin, window_end))
+        window_begin = window_end
+    return windows
+
+
+def start_of_collection(site):
+    """
+    Returns the day the collection of data began at a site or None if the
+    site does not tell.
+    """
+    try:
+        return date.fromisoformat(site["date"][:10])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _next_boundary(day, months):
+    month_index = day.year * 12 + day.month - 1
+    boundary = (month_index // months + 1) * months
+    return date(boundary // 12, boundary % 12 + 1, 1)
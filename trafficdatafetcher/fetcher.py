@@ -15,9 +15,12 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
+import sys
 from importlib.metadata import PackageNotFoundError, version
 
-from trafficdatafetcher.commands import listsites, fetchcounts, listdomains
+from trafficdatafetcher.apiclient import ApiError
+from trafficdatafetcher.commands import listsites, fetchcounts, listdomains, crawl, export, run, updatecatalog, \
+    findsites, serve
 
 
 def get_version() -> str:
@@ -35,13 +38,22 @@ def init_argparse() -> argparse.ArgumentParser:
     listdomains.register_argparser(subparsers)
     listsites.register_argparser(subparsers)
     fetchcounts.register_argparser(subparsers)
+    crawl.register_argparser(subparsers)
+    export.register_argparser(subparsers)
+    run.register_argparser(subparsers)
+    updatecatalog.register_argparser(subparsers)
+    findsites.register_argparser(subparsers)
+    serve.register_argparser(subparsers)
 
     return parser
 
 def main():
     args = init_argparse().parse_args()
     if hasattr(args, "func"):
-        args.func(**vars(args))
+        try:
+            args.func(**vars(args))
+        except ApiError as e:
+            sys.exit(f"error: {e}")
 
 
 if __name__ == "__main__":
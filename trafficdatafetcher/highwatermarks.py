@@ -0,0 +1,52 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+class HighWaterMarks:
+    """
+    Keeps track of the date of the last sample fetched from each channel.
+    The marks are stored per step size in a JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path, encoding="UTF-8") as file:
+                self._marks = json.load(file)
+        except FileNotFoundError:
+            self._marks = {}
+
+    def get(self, step_size, channel_id):
+        return self._marks.get(str(step_size), {}).get(str(channel_id))
+
+    def update(self, step_size, marks):
+        self._marks.setdefault(str(step_size), {}).update(
+            (str(channel_id), mark) for channel_id, mark in marks.items())
+
+    def save(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wt", encoding="UTF-8") as file:
+                json.dump(self._marks, file, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
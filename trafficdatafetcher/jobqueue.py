@@ -0,0 +1,171 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import sqlite3
+from threading import Lock
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Task:
+    def __init__(self, task_id, kind, payload, attempts):
+        self.id = task_id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+
+class JobQueue:
+    """
+    Persistent queue of tasks stored in an SQLite database. Each task has a
+    kind and a JSON payload. A task is only queued once, adding it again
+    has no effect, so that the tasks of an interrupted run can be added
+    again when it is resumed.
+
+    Tasks are claimed by workers and then either completed, which adds the
+    tasks following from them in the same transaction, or failed.
+
+    The queue also keeps the parameters of the run it was created for, so
+    that a run is only resumed with the same parameters.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    UNIQUE (kind, payload)
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_by_state ON tasks (state, id)")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS parameters (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )""")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def parameters(self, parameters):
+        """
+        Returns the parameters of the run the queue was created for. The
+        given parameters, a dict of JSON values, are stored if the queue has
+        none yet.
+        """
+        with self._lock, self._connection:
+            rows = self._connection.execute("SELECT name, value FROM parameters").fetchall()
+            if not rows:
+                self._connection.executemany(
+                    "INSERT INTO parameters (name, value) VALUES (?, ?)",
+                    [(name, json.dumps(value)) for name, value in parameters.items()])
+                return dict(parameters)
+        return {name: json.loads(value) for name, value in rows}
+
+    def clear(self):
+        """
+        Removes all tasks and parameters so that a new run can be started.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM tasks")
+            self._connection.execute("DELETE FROM parameters")
+
+    def put(self, kind, payload):
+        with self._lock, self._connection:
+            self._insert(kind, payload)
+
+    def resume(self):
+        """
+        Queues the tasks which were running when a previous run was
+        interrupted and the tasks which failed again.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE tasks SET state = ? WHERE state IN (?, ?)",
+                (PENDING, RUNNING, FAILED))
+
+    def claim(self):
+        """
+        Returns the oldest pending task and marks it as running, or None if
+        no task is pending.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT id, kind, payload, attempts FROM tasks WHERE state = ? ORDER BY id LIMIT 1",
+                (PENDING,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE tasks SET state = ?, attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, row[0]))
+        return Task(row[0], row[1], json.loads(row[2]), row[3] + 1)
+
+    def complete(self, task, follow_ups=()):
+        """
+        Marks the task as done and queues its follow-up tasks, given as
+        (kind, payload) pairs.
+        """
+        with self._lock, self._connection:
+            for kind, payload in follow_ups:
+                self._insert(kind, payload)
+            self._connection.execute(
+                "UPDATE tasks SET state = ?, error = NULL WHERE id = ?", (DONE, task.id))
+
+    def fail(self, task, error):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE tasks SET state = ?, error = ? WHERE id = ?",
+                (FAILED, error, task.id))
+
+    def counts(self):
+        """
+        Returns the number of tasks in each state.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall()
+        counts = dict.fromkeys((PENDING, RUNNING, DONE, FAILED), 0)
+        counts.update(rows)
+        return counts
+
+    def failures(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT kind, payload, error FROM tasks WHERE state = ? ORDER BY id",
+                (FAILED,)).fetchall()
+
+    def _insert(self, kind, payload):
+        self._connection.execute(
+            "INSERT OR IGNORE INTO tasks (kind, payload, state) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload, sort_keys=True), PENDING))
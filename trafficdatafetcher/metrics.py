@@ -0,0 +1,211 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import math
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_PREFIX = "trafficdatafetcher"
+# Metrics files with this suffix are written in the Prometheus text format:
+PROMETHEUS_SUFFIX = ".prom"
+
+RequestRecord = namedtuple("RequestRecord", ["endpoint", "status", "size", "retries", "seconds"])
+StageRecord = namedtuple("StageRecord", ["stage", "site_id", "seconds"])
+SummaryRow = namedtuple("SummaryRow", ["name", "count", "total", "quantiles"])
+
+
+class Metrics:
+    """
+    Records the requests sent to the API and the time spent in the stages
+    of a command, such as decoding responses or writing rows.
+
+    Each request is recorded with its endpoint, the status and size of the
+    final response, the number of retries and the latency of the final
+    attempt. A status of None means that no response was received. Stages
+    timed for a site are summed up per site, stages timed without a site
+    are recorded once for each time they were timed.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.requests = []
+        self._clock = clock
+        self._stages = {}
+        self._lock = Lock()
+
+    def record_request(self, endpoint, status, size, retries, seconds):
+        with self._lock:
+            self.requests.append(RequestRecord(endpoint, status, size, retries, seconds))
+
+    def record_stage(self, stage, seconds, site_id=None):
+        with self._lock:
+            if site_id is None:
+                self._stages.setdefault((stage, None), []).append(seconds)
+            else:
+                times = self._stages.setdefault((stage, site_id), [0.0])
+                times[0] += seconds
+
+    def take(self):
+        """
+        Removes the recorded requests and stages and returns them, e.g. to
+        pass them to the metrics of another process with `add`.
+        """
+        with self._lock:
+            requests, self.requests = self.requests, []
+            stages, self._stages = self._stages, {}
+        return requests, [StageRecord(stage, site_id, seconds)
+                          for (stage, site_id), times in stages.items() for seconds in times]
+
+    def add(self, requests, stages):
+        for request in requests:
+            self.record_request(*request)
+        for record in stages:
+            self.record_stage(record.stage, record.seconds, record.site_id)
+
+    @contextmanager
+    def timed(self, stage, site_id=None):
+        """
+        Records the time spent in the with-block as stage.
+        """
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, self._clock() - start, site_id)
+
+    def stages(self):
+        """
+        Returns the recorded stages ordered by stage.
+        """
+        with self._lock:
+            return [StageRecord(stage, site_id, seconds)
+                    for (stage, site_id), times in sorted(self._stages.items(), key=_stage_order)
+                    for seconds in times]
+
+    def summary(self):
+        """
+        Returns the count, total and quantiles of the request latencies per
+        endpoint and of the stage times per stage.
+        """
+        with self._lock:
+            requests = list(self.requests)
+        latencies = {}
+        for request in requests:
+            latencies.setdefault(f"request {request.endpoint}", []).append(request.seconds)
+        times = {}
+        for record in self.stages():
+            times.setdefault(record.stage, []).append(record.seconds)
+        return [_summarize(name, values) for name, values in [*latencies.items(), *times.items()]]
+
+    def save(self, file):
+        """
+        Writes the metrics to file as JSON or, if the file name ends with
+        `.prom`, in the Prometheus text format.
+        """
+        with open(file, "w", encoding="UTF-8") as output:
+            if Path(file).suffix == PROMETHEUS_SUFFIX:
+                output.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), output, indent=2)
+
+    def to_json(self):
+        return {
+            "requests": [record._asdict() for record in self.requests],
+            "stages": [record._asdict() for record in self.stages()],
+            "summary": [{"name": row.name, "count": row.count, "total": row.total,
+                         **{quantile_name(quantile): value for quantile, value in row.quantiles.items()}}
+                        for row in self.summary()],
+        }
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text format, e.g. for the
+        textfile collector of the node exporter.
+        """
+        endpoints = {}
+        for request in self.requests:
+            endpoints.setdefault(request.endpoint, []).append(request)
+        stages = {}
+        for record in self.stages():
+            stages.setdefault(record.stage, []).append(record.seconds)
+        lines = []
+        _prometheus_summary(lines, "request_seconds", "Latency of the final attempt of requests",
+                            {("endpoint", endpoint): [request.seconds for request in requests]
+                             for endpoint, requests in endpoints.items()})
+        _prometheus_counter(lines, "response_bytes_total", "Size of the response bodies",
+                            {(("endpoint", endpoint),): sum(request.size for request in requests)
+                             for endpoint, requests in endpoints.items()})
+        _prometheus_counter(lines, "request_retries_total", "Number of retried requests",
+                            {(("endpoint", endpoint),): sum(request.retries for request in requests)
+                             for endpoint, requests in endpoints.items()})
+        responses = {}
+        for request in self.requests:
+            labels = (("endpoint", request.endpoint), ("status", "none" if request.status is None
+                                                       else str(request.status)))
+            responses[labels] = responses.get(labels, 0) + 1
+        _prometheus_counter(lines, "responses_total", "Number of final responses by status", responses)
+        _prometheus_summary(lines, "stage_seconds", "Time spent in stages, summed up per site",
+                            {("stage", stage): values for stage, values in stages.items()})
+        return "".join(line + "\n" for line in lines)
+
+
+def percentile(values, quantile):
+    """
+    Returns the quantile of the values using the nearest-rank method.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(quantile * len(ordered)))
+    return ordered[rank - 1]
+
+
+def quantile_name(quantile):
+    return f"p{quantile * 100:g}"
+
+
+def _summarize(name, values):
+    return SummaryRow(name, len(values), sum(values),
+                      {quantile: percentile(values, quantile) for quantile in QUANTILES})
+
+
+def _stage_order(item):
+    (stage, site_id), _ = item
+    return stage, site_id is not None, site_id or 0
+
+
+def _prometheus_summary(lines, name, help_text, series):
+    name = f"{PROMETHEUS_PREFIX}_{name}"
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} summary")
+    for (label, value), values in series.items():
+        for quantile in QUANTILES:
+            lines.append(f'{name}{{{label}="{value}",quantile="{quantile:g}"}} {percentile(values, quantile)!r}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {sum(values)!r}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {len(values)}')
+
+
+def _prometheus_counter(lines, name, help_text, series):
+    name = f"{PROMETHEUS_PREFIX}_{name}"
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for labels, value in series.items():
+        label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+        lines.append(f"{name}{{{label_text}}} {value}")
@@ -0,0 +1,261 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from enum import auto
+from itertools import groupby
+from pathlib import Path
+
+from trafficdatafetcher.arrowutils import ColumnType
+from trafficdatafetcher.timestamps import format_months
+from trafficdatafetcher.types import EnumWithLowerCaseNames
+from trafficdatafetcher.writers import Compression, open_compressed, open_writer
+
+FILE_NAME = "counts"
+
+# Partitions are closed, least recently written first, once more are open:
+MAX_OPEN_PARTITIONS = 64
+
+# Data written to a partition is handed to the writing threads in chunks:
+CHUNK_SIZE = 1 << 20
+MAX_PENDING_CHUNKS = 4
+
+
+class Partition(EnumWithLowerCaseNames):
+    SITE = auto()
+    MONTH = auto()
+
+
+def partitions(value: str):
+    """
+    Parses a comma-separated list of partitions such as `site,month`.
+    """
+    names = [name.strip() for name in value.split(",")]
+    return list(dict.fromkeys(Partition.from_string(name) for name in names))
+
+
+class PartitionedWriter:
+    """
+    Writes rows into a file per partition in a directory tree. The rows
+    are partitioned by the site in site_column and by the month of the
+    local date in the timestamp column. The directories are named in the
+    hive layout read by pyarrow, DuckDB or Spark, for example
+    `site=100012345/month=2024-01/counts.csv.gz`. The files keep all
+    columns, so that readers add the partitions as additional columns.
+
+    Like the writers of `writers.open_writer`, the writer accepts rows as
+    dicts and series of samples with `writeseries`. The files are
+    compressed and written by a pool of threads so that partitions are
+    written in parallel. At most max_open_partitions files are open at a
+    time. CSV files which are opened again are appended to, Parquet and
+    Arrow files are continued in a new file such as `counts-1.parquet`.
+    """
+
+    def __init__(self, directory, partition_by, output_format, columns, column_types, site_column,
+                 compression=None, append=False, max_open_partitions=MAX_OPEN_PARTITIONS):
+        self._directory = Path(directory)
+        self._partition_by = list(partition_by)
+        self._output_format = output_format
+        self._columns = list(columns)
+        self._column_types = column_types
+        self._site_column = site_column
+        self._timestamp_column = next((column for column in self._columns
+                                       if column_types[column] == ColumnType.TIMESTAMP), None)
+        self._compression = compression
+        self._append = append
+        self._max_open_partitions = max_open_partitions
+        self._open_partitions = OrderedDict()
+        self._opened = {}
+        self._executor = ThreadPoolExecutor(thread_name_prefix="partitions")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def files(self):
+        """
+        Number of files written.
+        """
+        return sum(self._opened.values())
+
+    def writerow(self, row):
+        month = None
+        if Partition.MONTH in self._partition_by:
+            timestamp, offset = row[self._timestamp_column][:2]
+            month = format_months([timestamp], [offset])[0]
+        self._partition(row.get(self._site_column), month).writerow(row)
+
+    def writeseries(self, values, timestamps, offsets, counts, date_format=None):
+        site = values.get(self._site_column)
+        if Partition.MONTH not in self._partition_by:
+            self._partition(site, None).writeseries(values, timestamps, offsets, counts, date_format)
+            return
+        start = 0
+        for month, samples in groupby(format_months(timestamps, offsets)):
+            end = start + sum(1 for _ in samples)
+            self._partition(site, month).writeseries(values, timestamps[start:end], offsets[start:end],
+                                                     counts[start:end], date_format)
+            start = end
+
+    def flush(self):
+        """
+        Waits until all rows written so far are written to the files.
+        """
+        for partition in self._open_partitions.values():
+            partition.flush()
+
+    def close(self):
+        try:
+            while self._open_partitions:
+                _, partition = self._open_partitions.popitem(last=False)
+                partition.close()
+        finally:
+            self._executor.shutdown()
+
+    def _partition(self, site, month):
+        key = (site, month)
+        partition = self._open_partitions.get(key)
+        if partition is not None:
+            self._open_partitions.move_to_end(key)
+            return partition.writer
+        while len(self._open_partitions) >= self._max_open_partitions:
+            _, closed = self._open_partitions.popitem(last=False)
+            closed.close()
+        partition = self._open_partitions[key] = self._open_partition(site, month)
+        return partition.writer
+
+    def _open_partition(self, site, month):
+        directory = self._directory
+        for partition in self._partition_by:
+            directory = directory / f"{partition}={site if partition == Partition.SITE else month}"
+        directory.mkdir(parents=True, exist_ok=True)
+        opened = self._opened.get((site, month), 0)
+        self._opened[(site, month)] = opened + 1
+        extension = f".{self._output_format}"
+        if not self._output_format.is_binary:
+            compression = self._compression or Compression.NONE
+            return _OpenPartition(directory / f"{FILE_NAME}{extension}{compression.suffix}",
+                                  self._append or opened > 0, self._executor, self._output_format,
+                                  self._columns, self._column_types, compression=compression)
+        if opened == 0:
+            # Continuations of the files of an earlier run would be read
+            # together with the new files:
+            for path in directory.glob(f"{FILE_NAME}-*{extension}"):
+                path.unlink()
+        name = FILE_NAME if opened == 0 else f"{FILE_NAME}-{opened}"
+        return _OpenPartition(directory / f"{name}{extension}", False, self._executor, self._output_format,
+                              self._columns, self._column_types, codec=self._compression)
+
+
+class _OpenPartition:
+    def __init__(self, path, append, executor, output_format, columns, column_types, compression=Compression.NONE,
+                 codec=None):
+        write_header = not (append and path.exists() and path.stat().st_size > 0)
+        self._stack = ExitStack()
+        try:
+            file = open_compressed(str(path), "ab" if append else "wb", compression)
+            self._file = self._stack.enter_context(_BackgroundFile(file, executor, not output_format.is_binary))
+            self.writer = self._stack.enter_context(open_writer(output_format, self._file, columns, column_types,
+                                                                write_header, codec))
+        except BaseException:
+            self._stack.close()
+            raise
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._stack.close()
+
+
+class _BackgroundFile:
+    """
+    A file whose writes are handed to an executor in chunks. The chunks of
+    a file are written one after another, while the chunks of different
+    files are written in parallel. Text is written encoded as UTF-8.
+    """
+
+    def __init__(self, file, executor, text):
+        self._file = file
+        self._executor = executor
+        self._text = text
+        self._chunk = []
+        self._chunk_size = 0
+        self._position = 0
+        self._pending = deque()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if not self._text:
+            # The buffers passed by pyarrow are only valid during the call:
+            data = bytes(data)
+        self._chunk.append(data)
+        self._chunk_size += len(data)
+        self._position += len(data)
+        if self._chunk_size >= CHUNK_SIZE:
+            self._submit()
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        self._submit()
+        while self._pending:
+            self._pending.popleft().result()
+        self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+
+    def _submit(self):
+        if self._chunk:
+            # Each chunk waits for the previous one, which was submitted
+            # earlier and is therefore already being written:
+            previous = self._pending[-1] if self._pending else None
+            self._pending.append(self._executor.submit(self._write, previous, self._chunk))
+            self._chunk = []
+            self._chunk_size = 0
+        while self._pending and (self._pending[0].done() or len(self._pending) > MAX_PENDING_CHUNKS):
+            self._pending.popleft().result()
+
+    def _write(self, previous, chunk):
+        if previous is not None:
+            previous.result()
+        if self._text:
+            self._file.write("".join(chunk).encode("UTF-8"))
+        else:
+            self._file.write(b"".join(chunk))
@@ -0,0 +1,112 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from concurrent.futures import Future
+from functools import partial
+from threading import Lock
+
+
+class RequestPlanner:
+    """
+    Shares the responses of a client between the steps of a run so that
+    each resource is fetched only once. The planner has the same fetch
+    methods as the client.
+
+    Concurrent requests for the same resource wait for a single request.
+    Domains and sites are kept for the whole run. Channel data is dropped
+    after its last use planned with `plan_channel`, and unplanned channel
+    data right after its use. As the steps of a run follow each other, the
+    counts shared by several steps are held from the first step using them
+    until the last one. The memory of a run therefore grows with the counts
+    its steps share, not with a single channel. Failed requests are not
+    kept and are sent again when the resource is requested again.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.statistics = client.statistics
+        self.requested = 0
+        self.fetched = 0
+        self.planned = 0
+        self._results = {}
+        self._planned_uses = {}
+        self._lock = Lock()
+
+    def plan_channel(self, domain_id, channel_id, begin, end, step_size):
+        """
+        Announces a use of the data of a channel in a time range.
+        """
+        key = ("channel", domain_id, channel_id, begin, end, step_size)
+        with self._lock:
+            self.planned += 1
+            self._planned_uses[key] = self._planned_uses.get(key, 0) + 1
+
+    def fetch_domains(self):
+        return self._fetch(("domains",), self._client.fetch_domains)
+
+    def fetch_sites_in_domain(self, domain_id):
+        return self._fetch(("sites_in_domain", domain_id),
+                           partial(self._client.fetch_sites_in_domain, domain_id))
+
+    def fetch_site(self, site_id, with_token=True):
+        # Sites are kept for the run and are therefore always fetched with
+        # the token of the session:
+        return self._fetch(("site", site_id), partial(self._client.fetch_site, site_id))
+
+    def fetch_channel(self, domain_id, channel_id, begin, end, step_size, token):
+        # The token changes between sessions and does not identify the data:
+        key = ("channel", domain_id, channel_id, begin, end, step_size)
+        return self._fetch(key, partial(self._client.fetch_channel, domain_id, channel_id, begin, end,
+                                        step_size, token))
+
+    def _fetch(self, key, fetch):
+        with self._lock:
+            self.requested += 1
+            future = self._results.get(key)
+            if future is None:
+                future = self._results[key] = Future()
+                self.fetched += 1
+                owner = True
+            else:
+                owner = False
+        if owner:
+            try:
+                future.set_result(fetch())
+            except BaseException as e:
+                future.set_exception(e)
+        try:
+            return future.result()
+        finally:
+            self._release(key, future)
+
+    def _release(self, key, future):
+        """
+        Counts a use of the result of a request and drops the result if it
+        failed or no further uses are planned. Only successful uses count
+        so that retries do not use up the planned uses.
+        """
+        with self._lock:
+            kept = self._results.get(key) is future
+            if future.exception() is not None:
+                if kept:
+                    del self._results[key]
+                return
+            if key in self._planned_uses:
+                self._planned_uses[key] -= 1
+            if kept and key[0] == "channel" and self._planned_uses.get(key, 0) <= 0:
+                self._planned_uses.pop(key, None)
+                del self._results[key]
@@ -0,0 +1,40 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import deque
+from itertools import islice
+
+
+class Prefetcher:
+    """
+    Iterates over the results of calling fetch with each of the arguments in
+    order. Up to `lookahead` calls run ahead of the iteration in the executor.
+    The first calls are submitted on construction.
+    """
+
+    def __init__(self, executor, fetch, arguments, lookahead):
+        self._executor = executor
+        self._fetch = fetch
+        self._arguments = iter(arguments)
+        self._pending = deque(executor.submit(fetch, argument)
+                              for argument in islice(self._arguments, lookahead))
+
+    def __iter__(self):
+        while self._pending:
+            future = self._pending.popleft()
+            for argument in islice(self._arguments, 1):
+                self._pending.append(self._executor.submit(self._fetch, argument))
+            yield future.result()
@@ -0,0 +1,188 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+DEFAULT_RATE = 10.0
+# The rate never drops below this fraction of the configured rate:
+MIN_RATE_FACTOR = 1 / 32
+# Growth of the rate with each successful request after slowing down:
+RECOVERY_FACTOR = 1 / 50
+
+BACKOFF_BASE = 0.5
+MAX_BACKOFF = 60.0
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all threads sending requests to the API. Tokens
+    are added at `rate` per second up to `burst` tokens. Coroutines reserve
+    tokens and wait for them on their own.
+
+    The rate adapts to the responses of the API: it is halved whenever the
+    API throttles requests or fails and slowly recovers towards the
+    configured rate with every successful request. A pause, for example
+    requested by a Retry-After header, delays all requests.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, rate) if burst is None else burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._resume_at = None
+        self._lock = Lock()
+
+    def acquire(self):
+        """
+        Takes a token and waits until it is available. Returns the time
+        spent waiting in seconds.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def reserve(self):
+        """
+        Takes a token without waiting for it. Returns the time in seconds
+        the caller has to wait before the token is available.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            start = now if self._resume_at is None else max(now, self._resume_at)
+            # Tokens are reserved in advance so that waiting threads are
+            # served in the order they arrived:
+            self._tokens -= 1
+            wait = start - now
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+        return wait
+
+    def pause(self, seconds):
+        with self._lock:
+            resume_at = self._clock() + seconds
+            if self._resume_at is None or resume_at > self._resume_at:
+                self._resume_at = resume_at
+
+    def slow_down(self):
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate / 2)
+
+    def speed_up(self):
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = min(self.max_rate, self.rate * (1 + RECOVERY_FACTOR))
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._resume_at is not None and self._resume_at <= now:
+            self._resume_at = None
+
+
+class RequestStatistics:
+    """
+    Counts the requests sent to the API and the time spent waiting for the
+    rate limiter and backing off before retries.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.backoff = 0.0
+        self.max_backoff = 0.0
+        self._lock = Lock()
+
+    def count_request(self, waited):
+        with self._lock:
+            self.requests += 1
+            self.waited += waited
+
+    def count_retry(self, delay, throttled):
+        with self._lock:
+            self.retries += 1
+            self.backoff += delay
+            if throttled:
+                self.throttled += 1
+
+    def count_backoff_of_request(self, backoff):
+        with self._lock:
+            self.max_backoff = max(self.max_backoff, backoff)
+
+    def merge(self, other):
+        """
+        Adds the counts of other, e.g. of a worker process.
+        """
+        with self._lock:
+            self.requests += other.requests
+            self.retries += other.retries
+            self.throttled += other.throttled
+            self.waited += other.waited
+            self.backoff += other.backoff
+            self.max_backoff = max(self.max_backoff, other.max_backoff)
+
+    def __getstate__(self):
+        # Statistics are sent between processes without their lock:
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+
+def backoff_delay(attempt):
+    """
+    Returns the delay before retrying after the given failed attempt. The
+    delay grows exponentially and is jittered so that threads which failed
+    together do not retry together.
+    """
+    delay = min(MAX_BACKOFF, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header given either in seconds or as HTTP date.
+    Returns None if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,163 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+from itertools import groupby, repeat
+from operator import add, floordiv
+
+from trafficdatafetcher.apiclient import StepSize
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries
+from trafficdatafetcher.timestamps import NO_OFFSET
+
+_DAY = 24 * 60 * 60
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Length of the step sizes which have a fixed length in seconds:
+_SECONDS = {
+    StepSize.QUARTER_OF_AN_HOUR: 15 * 60,
+    StepSize.HOUR: 60 * 60,
+    StepSize.DAY: _DAY,
+}
+
+
+def fetched_step_size(step_sizes):
+    """
+    Returns the step size to fetch so that all step sizes can be resampled
+    from it. Weeks do not add up to months, so days are fetched if both
+    are requested.
+    """
+    finest = min(step_sizes, key=lambda step_size: step_size.value)
+    if finest == StepSize.WEEK and StepSize.MONTH in step_sizes:
+        return StepSize.DAY
+    return finest
+
+
+class Resampler:
+    """
+    Sums up the samples of a timeseries into the buckets of a coarser step
+    size like the API does: buckets begin at local midnight, weeks on
+    Monday and months on the first day of the month. A bucket is dated
+    with the offset of its first sample. The sum is missing if the count of
+    any of the samples is missing.
+
+    Samples are added in chunks. The last bucket is held back until a
+    later chunk or `flush` completes it.
+    """
+
+    def __init__(self, step_size):
+        self.step_size = step_size
+        self._pending = TimeSeries()
+
+    def add(self, series):
+        """
+        Adds the samples of a timeseries and returns the buckets they
+        complete.
+        """
+        pending = self._pending
+        pending.extend(series)
+        runs = _runs(pending, self.step_size)
+        if not runs:
+            return TimeSeries()
+        _, last_start, _ = runs[-1]
+        self._pending = pending[last_start:]
+        return _sum_runs(pending, runs[:-1], self.step_size)
+
+    def flush(self):
+        """
+        Returns the last bucket.
+        """
+        pending = self._pending
+        self._pending = TimeSeries()
+        return _sum_runs(pending, _runs(pending, self.step_size), self.step_size)
+
+
+def resample(series, step_size):
+    """
+    Sums up the samples of a timeseries into the buckets of a coarser step
+    size (see `Resampler`).
+    """
+    return _sum_runs(series, _runs(series, step_size), step_size)
+
+
+def _runs(series, step_size):
+    """
+    Returns the buckets of a timeseries as (key, start, stop) tuples. The
+    work per sample is done by map and groupby.
+    """
+    seconds = _SECONDS.get(step_size, _DAY)
+    keys = map(floordiv, _local_seconds(series), repeat(seconds))
+    runs = []
+    start = 0
+    for key, group in groupby(keys):
+        stop = start + len(list(group))
+        runs.append((key, start, stop))
+        start = stop
+    if step_size in _SECONDS:
+        return runs
+    # Days are grouped into weeks or months:
+    bucket_of_day = _week_of_day if step_size == StepSize.WEEK else _month_of_day
+    buckets = []
+    for day, start, stop in runs:
+        key = bucket_of_day(day)
+        if buckets and buckets[-1][0] == key:
+            buckets[-1] = (key, buckets[-1][1], stop)
+        else:
+            buckets.append((key, start, stop))
+    return buckets
+
+
+def _local_seconds(series):
+    timestamps = series.timestamps
+    offsets = series.offsets
+    if NO_OFFSET not in offsets:
+        return map(add, timestamps, offsets)
+    if offsets.count(NO_OFFSET) == len(offsets):
+        # Dates without offsets are in local time:
+        return timestamps
+    return (timestamp if offset == NO_OFFSET else timestamp + offset
+            for timestamp, offset in zip(timestamps, offsets))
+
+
+def _sum_runs(series, runs, step_size):
+    resampled = TimeSeries(date_format=series.date_format)
+    counts = series.counts
+    for key, start, stop in runs:
+        offset = series.offsets[start]
+        local_start = _local_start(key, step_size)
+        resampled.timestamps.append(local_start if offset == NO_OFFSET else local_start - offset)
+        resampled.offsets.append(offset)
+        bucket = counts[start:stop]
+        resampled.counts.append(NO_COUNT if NO_COUNT in bucket else sum(bucket))
+    return resampled
+
+
+def _local_start(key, step_size):
+    if step_size in _SECONDS:
+        return key * _SECONDS[step_size]
+    if step_size == StepSize.WEEK:
+        return (key * 7 - 3) * _DAY
+    first_day = date(key // 12, key % 12 + 1, 1)
+    return (first_day.toordinal() - _EPOCH_ORDINAL) * _DAY
+
+
+def _week_of_day(day):
+    # The epoch is a Thursday, weeks begin on Monday:
+    return (day + 3) // 7
+
+
+def _month_of_day(day):
+    day = date.fromordinal(day + _EPOCH_ORDINAL)
+    return day.year * 12 + day.month - 1
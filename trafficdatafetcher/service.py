@@ -0,0 +1,394 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import math
+import sys
+import time
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock
+from urllib.parse import parse_qs, urlsplit
+
+from trafficdatafetcher.apiclient import ApiError, Direction, MeansOfTransport, StepSize
+from trafficdatafetcher.cache import METADATA_TTL
+from trafficdatafetcher.commands.fetchcounts import is_channel_selected, public_sites_with_means_of_transport
+from trafficdatafetcher.timeseries import NO_COUNT, TimeSeries
+from trafficdatafetcher.timestamps import NO_OFFSET, format_date, parse_timestamp
+
+# Length of the samples of the step sizes in seconds. Weeks and months
+# are rounded down so that their next sample is not expected too late:
+SAMPLE_SECONDS = {
+    StepSize.QUARTER_OF_AN_HOUR: 15 * 60,
+    StepSize.HOUR: 60 * 60,
+    StepSize.DAY: 24 * 60 * 60,
+    StepSize.WEEK: 7 * 24 * 60 * 60,
+    StepSize.MONTH: 28 * 24 * 60 * 60,
+}
+# Longest time between two polls of a channel, so that the counts of the
+# current day, week or month are updated while it is still running:
+MAX_POLL_INTERVAL = 60 * 60
+RETRY_INTERVAL = 30
+# Dates without an offset are in local time, which is ahead of UTC by at
+# most this. Their next sample is expected that much earlier:
+MAX_UTC_OFFSET = 14 * 60 * 60
+
+
+class ChannelBuffer:
+    """
+    Keeps the latest samples of a channel in a ring buffer. A polled
+    timeseries replaces the buffered samples from its first sample on, so
+    that samples whose counts were missing are updated.
+    """
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+        self.date_format = None
+
+    def __len__(self):
+        return len(self._samples)
+
+    def update(self, series):
+        """
+        Adds the samples of the timeseries and returns the number of
+        samples with a count which were not buffered with a count before.
+        """
+        if not series:
+            return 0
+        self.date_format = series.date_format
+        first = series.timestamps[0]
+        counted = set()
+        while self._samples and self._samples[-1][0] >= first:
+            timestamp, _, count = self._samples.pop()
+            if count != NO_COUNT:
+                counted.add(timestamp)
+        self._samples.extend(zip(series.timestamps, series.offsets, series.counts))
+        return sum(1 for timestamp, count in zip(series.timestamps, series.counts)
+                   if count != NO_COUNT and timestamp not in counted)
+
+    def samples(self, limit=None, since=None):
+        """
+        Returns the buffered samples after the timestamp since as
+        timeseries, at most the last limit ones.
+        """
+        samples = [sample for sample in self._samples if since is None or sample[0] > since]
+        if limit is not None:
+            samples = samples[max(0, len(samples) - limit):]
+        series = TimeSeries(date_format=self.date_format)
+        for timestamp, offset, count in samples:
+            series.timestamps.append(timestamp)
+            series.offsets.append(offset)
+            series.counts.append(count)
+        return series
+
+    def last_counted(self):
+        """
+        Returns the timestamp and offset of the last sample with a count or
+        None if there is no such sample.
+        """
+        for timestamp, offset, count in reversed(self._samples):
+            if count != NO_COUNT:
+                return timestamp, offset
+        return None
+
+
+class PolledChannel:
+    def __init__(self, site_id, channel, step_size, buffer_size):
+        self.site_id = site_id
+        self.channel_id = channel["id"]
+        self.means_of_transport = MeansOfTransport(channel["userType"])
+        self.direction = Direction(channel["sens"])
+        self.step_size = step_size
+        self.buffer = ChannelBuffer(buffer_size)
+        self.polled = None
+        self.next_poll = 0.0
+        self.misses = 0
+        self.running = False
+
+    def describe(self):
+        last = self.buffer.last_counted()
+        return {
+            "site_id": self.site_id,
+            "channel_id": self.channel_id,
+            "means_of_transport": str(self.means_of_transport),
+            "direction": str(self.direction),
+            "step_size": str(self.step_size),
+            "samples": len(self.buffer),
+            "last_counted": None if last is None else format_date(*last, self.buffer.date_format),
+            "polled": self.polled,
+            "next_poll": self.next_poll,
+        }
+
+
+class Poller:
+    """
+    Polls the channels of sites for each step size and keeps their latest
+    samples in memory.
+
+    A channel is polled again when its next sample is expected, i.e. when
+    the period after its last counted sample has ended. Until the sample
+    arrives, the channel is polled again after the retry interval, which
+    doubles with each poll without new samples up to a quarter of the
+    sample length. Channels are polled at least every MAX_POLL_INTERVAL.
+    The sites and their tokens are fetched again after site_ttl seconds or
+    when polling one of their channels failed.
+    """
+
+    def __init__(self, client, site_ids, domain_id, step_sizes, direction, means_of_transport, buffer_size,
+                 retry_interval=RETRY_INTERVAL, site_ttl=METADATA_TTL.total_seconds(), clock=time.time,
+                 today=date.today):
+        self._client = client
+        self._site_ids = site_ids
+        self._domain_id = domain_id
+        self._step_sizes = list(dict.fromkeys(step_sizes))
+        self._direction = direction
+        self._means_of_transport = means_of_transport
+        self._buffer_size = buffer_size
+        self._retry_interval = retry_interval
+        self._site_ttl = site_ttl
+        self._clock = clock
+        self._today = today
+        self._sites = {}
+        self._stale_sites = set()
+        self._channels = {}
+        self._sites_refreshed = None
+        self._refreshing = False
+        self._lock = Lock()
+        self._wakeup = Event()
+
+    def refresh_sites(self):
+        """
+        Fetches the sites and starts polling their new channels.
+        """
+        site_ids = self._site_ids
+        if self._domain_id is not None:
+            sites = self._client.fetch_sites_in_domain(self._domain_id)
+            site_ids, _ = public_sites_with_means_of_transport(sites, self._means_of_transport)
+        for site_id in site_ids:
+            try:
+                self._fetch_site(site_id)
+            except ApiError as e:
+                print(f"serve: fetching site {site_id} failed: {e}", file=sys.stderr)
+        with self._lock:
+            self._sites_refreshed = self._clock()
+
+    def poll(self, channel):
+        """
+        Fetches the samples of the channel since its last counted sample
+        and schedules its next poll.
+        """
+        try:
+            if channel.site_id in self._stale_sites:
+                self._fetch_site(channel.site_id)
+            site = self._sites[channel.site_id]
+            samples = self._client.fetch_channel(site["domaine"], channel.channel_id, self._begin(channel),
+                                                 self._today() + timedelta(days=1), channel.step_size,
+                                                 site["token"])
+            series = TimeSeries.from_samples(samples)
+        except Exception as e:
+            # Any failure, e.g. samples which cannot be parsed, schedules a
+            # retry so that the channel is not polled again right away:
+            print(f"serve: polling channel {channel.channel_id} failed: {e}", file=sys.stderr)
+            with self._lock:
+                # The token may have expired:
+                self._stale_sites.add(channel.site_id)
+                self._schedule(channel, False)
+            return
+        with self._lock:
+            added = channel.buffer.update(series)
+            channel.polled = self._clock()
+            self._schedule(channel, added > 0)
+
+    def run(self, executor, stop):
+        """
+        Runs the polls in the executor when they are due until stop is set.
+        """
+        while not stop.is_set():
+            now = self._clock()
+            with self._lock:
+                refresh_due = not self._refreshing and (self._sites_refreshed is None
+                                                        or self._sites_refreshed + self._site_ttl <= now)
+                if refresh_due:
+                    self._refreshing = True
+                due = [channel for channel in self._channels.values()
+                       if not channel.running and channel.next_poll <= now]
+                for channel in due:
+                    channel.running = True
+                waiting = [channel.next_poll for channel in self._channels.values() if not channel.running]
+                if not self._refreshing:
+                    waiting.append(self._sites_refreshed + self._site_ttl)
+            if refresh_due:
+                executor.submit(self._run_refresh)
+            for channel in due:
+                executor.submit(self._run_poll, channel)
+            # Finished polls and refreshes wake the loop up early:
+            self._wakeup.wait(max(0.0, min(waiting) - now) if waiting else None)
+            self._wakeup.clear()
+
+    def wake_up(self):
+        self._wakeup.set()
+
+    def channels(self):
+        with self._lock:
+            return [channel.describe() for channel in self._channels.values()]
+
+    def channel(self, channel_id, step_size, limit=None, since=None):
+        """
+        Returns the description and buffered samples of a channel or None if
+        the channel is not polled.
+        """
+        with self._lock:
+            channel = self._channels.get((channel_id, step_size))
+            if channel is None:
+                return None
+            return dict(channel.describe(),
+                        counts=channel.buffer.samples(limit, since).to_samples())
+
+    def site(self, site_id):
+        """
+        Returns the details of a site without its token or None if the site
+        is not polled.
+        """
+        with self._lock:
+            site = self._sites.get(site_id)
+        if site is None:
+            return None
+        return {name: value for name, value in site.items() if name != "token"}
+
+    def _fetch_site(self, site_id):
+        site = self._client.fetch_site(site_id)
+        with self._lock:
+            self._sites[site_id] = site
+            self._stale_sites.discard(site_id)
+            for channel in site["channels"]:
+                if not is_channel_selected(channel, self._direction, self._means_of_transport):
+                    continue
+                for step_size in self._step_sizes:
+                    key = (channel["id"], step_size)
+                    if key not in self._channels:
+                        self._channels[key] = PolledChannel(site_id, channel, step_size, self._buffer_size)
+        self._wakeup.set()
+
+    def _begin(self, channel):
+        last = channel.buffer.last_counted()
+        if last is None:
+            # Enough days to fill the buffer:
+            days = math.ceil(self._buffer_size * SAMPLE_SECONDS[channel.step_size] / (24 * 60 * 60))
+            return self._today() - timedelta(days=days)
+        # The day of the last counted sample in local time:
+        return date.fromisoformat(format_date(*last)[:10])
+
+    def _schedule(self, channel, new_samples):
+        """
+        Sets the time of the next poll of the channel. Must be called while
+        holding the lock.
+        """
+        now = self._clock()
+        sample_seconds = SAMPLE_SECONDS[channel.step_size]
+        if new_samples:
+            channel.misses = 0
+        expected = None
+        last = channel.buffer.last_counted()
+        if last is not None:
+            timestamp, offset = last
+            # The next sample is complete once the period after the last
+            # counted sample has ended:
+            expected = timestamp + 2 * sample_seconds - (MAX_UTC_OFFSET if offset == NO_OFFSET else 0)
+        if expected is not None and expected > now:
+            delay = expected - now
+        else:
+            delay = min(self._retry_interval * 2 ** channel.misses, max(self._retry_interval, sample_seconds / 4))
+            channel.misses += 1
+        channel.next_poll = now + min(delay, MAX_POLL_INTERVAL)
+
+    def _run_refresh(self):
+        try:
+            self.refresh_sites()
+        except Exception as e:
+            print(f"serve: refreshing sites failed: {e}", file=sys.stderr)
+            with self._lock:
+                # Try again after the retry interval:
+                self._sites_refreshed = self._clock() - self._site_ttl + self._retry_interval
+        finally:
+            with self._lock:
+                self._refreshing = False
+            self._wakeup.set()
+
+    def _run_poll(self, channel):
+        try:
+            self.poll(channel)
+        finally:
+            with self._lock:
+                channel.running = False
+            self._wakeup.set()
+
+
+def start_server(poller, host, port):
+    """
+    Returns an HTTP server answering with the channels and sites of the
+    poller as JSON:
+     - `/channels` lists the polled channels
+     - `/channels/<channel id>/<step size>?limit=<n>&since=<date>` returns
+       the buffered samples of a channel in the format of the API
+     - `/sites/<site id>` returns the details of a site
+    Call `serve_forever()` on the returned server to answer requests.
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.poller = poller
+    return server
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            payload = self._route(parts, query)
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        if payload is None:
+            self._send(404, {"error": f"{url.path} not found"})
+        else:
+            self._send(200, payload)
+
+    def _route(self, parts, query):
+        poller = self.server.poller
+        if parts == ["channels"]:
+            return poller.channels()
+        if len(parts) == 3 and parts[0] == "channels":
+            limit = int(query["limit"]) if "limit" in query else None
+            if limit is not None and limit < 0:
+                raise ValueError(f"{limit} is not a valid limit")
+            since = parse_timestamp(query["since"]) if "since" in query else None
+            return poller.channel(int(parts[1]), StepSize.from_string(parts[2]), limit, since)
+        if len(parts) == 2 and parts[0] == "sites":
+            return poller.site(int(parts[1]))
+        return None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
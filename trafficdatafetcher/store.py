@@ -0,0 +1,239 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sqlite3
+from datetime import date
+from enum import Enum
+from itertools import repeat
+from operator import itemgetter
+from pathlib import Path
+
+from trafficdatafetcher.commands.listsites import Columns as SiteColumns
+from trafficdatafetcher.timeseries import NO_COUNT, occurrences
+from trafficdatafetcher.timestamps import NO_OFFSET, DateFormat
+
+_EPOCH = date(1970, 1, 1)
+_DAY = 24 * 60 * 60
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS samples (
+        counter_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        step_size INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,
+        occurrence INTEGER NOT NULL DEFAULT 0,
+        utc_offset INTEGER NOT NULL,
+        count INTEGER,
+        PRIMARY KEY (counter_id, channel_id, step_size, timestamp, occurrence)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS samples_by_time ON samples (step_size, timestamp)",
+    """
+    CREATE TABLE IF NOT EXISTS channels (
+        channel_id INTEGER PRIMARY KEY,
+        counter_id INTEGER NOT NULL,
+        means_of_transport INTEGER NOT NULL,
+        direction INTEGER NOT NULL,
+        date_format TEXT
+    )""",
+    f"""
+    CREATE TABLE IF NOT EXISTS sites (
+        {SiteColumns.ID} INTEGER PRIMARY KEY,
+        {", ".join(str(column) for column in SiteColumns if column != SiteColumns.ID)}
+    )""",
+]
+
+
+# Stores written before samples had an occurrence are migrated:
+_MIGRATION = [
+    "ALTER TABLE samples RENAME TO samples_without_occurrence",
+    _SCHEMA[0],
+    """
+    INSERT INTO samples (counter_id, channel_id, step_size, timestamp, utc_offset, count)
+    SELECT counter_id, channel_id, step_size, timestamp, utc_offset, count FROM samples_without_occurrence""",
+    "DROP TABLE samples_without_occurrence",
+]
+
+# Stores written before channels had a date format are migrated:
+_DATE_FORMAT_MIGRATION = "ALTER TABLE channels ADD COLUMN date_format TEXT"
+
+
+class SampleStore:
+    """
+    Stores the samples of channels and the details of their sites in an
+    SQLite database. Samples are keyed on their counter, channel, step size,
+    timestamp and occurrence, which tells apart the samples of the repeated
+    hour at the end of daylight saving time in dates without an offset.
+    Storing a sample again replaces the stored one, so that samples whose
+    counts were missing are updated once they are counted. The date format
+    of each channel is stored, so that its dates are exported the way the
+    API returned them.
+
+    A read-only store is only read from an existing database.
+    """
+
+    def __init__(self, path, read_only=False):
+        if read_only:
+            # Connecting would otherwise create an empty database:
+            self._connection = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+            self._occurrence = "samples.occurrence" if self._has_column("samples", "occurrence") else "0"
+            self._date_format = "channels.date_format" if self._has_column("channels", "date_format") else "NULL"
+            return
+        self._connection = sqlite3.connect(str(path))
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        if not self._has_column("samples", "occurrence"):
+            with self._connection:
+                for statement in _MIGRATION:
+                    self._connection.execute(statement)
+        if not self._has_column("channels", "date_format"):
+            self._connection.execute(_DATE_FORMAT_MIGRATION)
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self._connection.commit()
+        self._occurrence = "samples.occurrence"
+        self._date_format = "channels.date_format"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def commit(self):
+        self._connection.commit()
+
+    def upsert_site(self, row):
+        """
+        Stores the details of a site given as row of list-sites.
+        """
+        columns = list(SiteColumns)
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO sites ({', '.join(map(str, columns))}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [_to_sql(row.get(column)) for column in columns])
+
+    def upsert_channel(self, step_size, counter_id, channel_id, means_of_transport, direction, series):
+        """
+        Stores the samples of a timeseries of a channel. Empty timeseries
+        keep the stored date format.
+        """
+        self._connection.execute(
+            """
+            INSERT INTO channels VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id)
+            DO UPDATE SET counter_id = excluded.counter_id, means_of_transport = excluded.means_of_transport,
+                          direction = excluded.direction,
+                          date_format = COALESCE(excluded.date_format, channels.date_format)""",
+            (channel_id, counter_id, means_of_transport.value, direction.value,
+             _date_format_to_sql(series.date_format)))
+        counts = (None if count == NO_COUNT else count for count in series.counts)
+        self._connection.executemany(
+            """
+            INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (counter_id, channel_id, step_size, timestamp, occurrence)
+            DO UPDATE SET utc_offset = excluded.utc_offset, count = excluded.count""",
+            zip(repeat(counter_id), repeat(channel_id), repeat(step_size.value), series.timestamps,
+                map(itemgetter(1), occurrences(series.timestamps)), series.offsets, counts))
+
+    def query_counts(self, step_size, counter_ids=None, domain_id=None, begin=None, end=None,
+                     directions=None, means_of_transport=None):
+        """
+        Returns the counts of each counter, means of transport and direction
+        as (counter id, means of transport, direction, timestamp, offset,
+        count, date format) tuples ordered in this order. The counts of the
+        channels of a counter with the same means of transport and direction
+        are summed up. The sum is missing if any of the counts is missing.
+        The range from begin to end (exclusively) is in local time of the
+        samples. The date format is the one of `timestamps.date_format`, or
+        None for dates in the format of the API.
+        """
+        conditions = ["samples.step_size = ?"]
+        parameters = [step_size.value]
+        if counter_ids is not None:
+            conditions.append(f"samples.counter_id IN ({', '.join('?' * len(counter_ids))})")
+            parameters.extend(counter_ids)
+        if domain_id is not None:
+            conditions.append(f"samples.counter_id IN (SELECT {SiteColumns.ID} FROM sites "
+                              f"WHERE {SiteColumns.DOMAIN_ID} = ?)")
+            parameters.append(domain_id)
+        local_time = f"samples.timestamp + CASE WHEN samples.utc_offset = {NO_OFFSET} THEN 0 " \
+                     f"ELSE samples.utc_offset END"
+        # Offsets are less than a day. The timestamp conditions allow the
+        # index to narrow down the samples:
+        if begin is not None:
+            conditions.append(f"samples.timestamp >= ? AND {local_time} >= ?")
+            parameters.extend([_seconds(begin) - _DAY, _seconds(begin)])
+        if end is not None:
+            conditions.append(f"samples.timestamp < ? AND {local_time} < ?")
+            parameters.extend([_seconds(end) + _DAY, _seconds(end)])
+        if directions is not None:
+            conditions.append(f"channels.direction IN ({', '.join('?' * len(directions))})")
+            parameters.extend(direction.value for direction in directions)
+        if means_of_transport is not None:
+            conditions.append(f"channels.means_of_transport IN ({', '.join('?' * len(means_of_transport))})")
+            parameters.extend(value.value for value in means_of_transport)
+        rows = self._connection.execute(
+            f"""
+            SELECT samples.counter_id, channels.means_of_transport, channels.direction,
+                   samples.timestamp, MIN(samples.utc_offset),
+                   CASE WHEN COUNT(samples.count) < COUNT(*) THEN NULL ELSE SUM(samples.count) END,
+                   MIN({self._date_format})
+            FROM samples JOIN channels ON channels.channel_id = samples.channel_id
+            WHERE {" AND ".join(conditions)}
+            GROUP BY samples.counter_id, channels.means_of_transport, channels.direction, samples.timestamp,
+                     {self._occurrence}
+            ORDER BY samples.counter_id, channels.means_of_transport, channels.direction, samples.timestamp,
+                     {self._occurrence}
+            """, parameters)
+        return (row[:6] + (_date_format_from_sql(row[6]),) for row in rows)
+
+    def _has_column(self, table, column):
+        """
+        Returns whether the table has the column, or does not exist yet.
+        """
+        columns = [row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")]
+        return not columns or column in columns
+
+
+def _seconds(day):
+    return (day - _EPOCH).days * _DAY
+
+
+def _date_format_to_sql(date_format):
+    # Date formats are stored as their separator, fraction and format of
+    # offsets, such as `T.000+HH:MM`:
+    if date_format is None:
+        return None
+    return "".join(date_format)
+
+
+def _date_format_from_sql(value):
+    if value is None:
+        return None
+    separator, rest = value[0], value[1:]
+    offset = next(offset for offset in ("+HH:MM", "+HHMM", "Z") if rest.endswith(offset))
+    return DateFormat(separator, rest[:-len(offset)], offset)
+
+
+def _to_sql(value):
+    if isinstance(value, Enum):
+        return str(value)
+    return value
@@ -0,0 +1,109 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+from operator import itemgetter
+
+from trafficdatafetcher.timestamps import date_format, format_date, parse_dates
+
+# Count of samples for which the API returned null:
+NO_COUNT = -1
+
+
+def occurrences(timestamps):
+    """
+    Yields (timestamp, occurrence) pairs which tell apart the samples of a
+    series with the same timestamp, such as the repeated hour at the end of
+    daylight saving time in dates without an offset. The occurrence counts
+    the earlier samples with the timestamp.
+    """
+    last_timestamp = None
+    occurrence = 0
+    for timestamp in timestamps:
+        occurrence = occurrence + 1 if timestamp == last_timestamp else 0
+        last_timestamp = timestamp
+        yield timestamp, occurrence
+
+
+class TimeSeries:
+    """
+    Samples of a channel stored in parallel arrays. A sample consists of
+    its date as seconds since the epoch, the offset of the date from UTC in
+    seconds (see `timestamps.parse_date`) and its count. Missing counts are
+    stored as NO_COUNT.
+
+    The dates are formatted in the date format of the series, which is
+    taken from the first date returned by the API (see
+    `timestamps.date_format`), so that they are written back unchanged.
+    """
+
+    __slots__ = ("timestamps", "offsets", "counts", "date_format")
+
+    def __init__(self, timestamps=None, offsets=None, counts=None, date_format=None):
+        self.timestamps = array("q") if timestamps is None else timestamps
+        self.offsets = array("i") if offsets is None else offsets
+        self.counts = array("q") if counts is None else counts
+        self.date_format = date_format
+
+    @classmethod
+    def from_samples(cls, samples):
+        """
+        Creates a timeseries from samples as returned by the API.
+        """
+        timestamps, offsets = parse_dates(map(itemgetter("date"), samples))
+        return cls(timestamps, offsets,
+                   array("q", [NO_COUNT if count is None else count
+                               for count in map(itemgetter("comptage"), samples)]),
+                   date_format(samples[0]["date"]) if samples else None)
+
+    def to_samples(self):
+        """
+        Returns the samples in the format of the API.
+        """
+        return [{"date": self.date(index), "comptage": self.count(index)}
+                for index in range(len(self))]
+
+    def date(self, index):
+        return format_date(self.timestamps[index], self.offsets[index], self.date_format)
+
+    def count(self, index):
+        count = self.counts[index]
+        return None if count == NO_COUNT else count
+
+    def extend(self, other):
+        if self.date_format is None:
+            self.date_format = other.date_format
+        self.timestamps.extend(other.timestamps)
+        self.offsets.extend(other.offsets)
+        self.counts.extend(other.counts)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        # Only slices are supported:
+        return TimeSeries(self.timestamps[index], self.offsets[index],
+                          self.counts[index], self.date_format)
+
+    def __eq__(self, other):
+        return (isinstance(other, TimeSeries)
+                and self.timestamps == other.timestamps
+                and self.offsets == other.offsets
+                and self.counts == other.counts
+                and self.date_format == other.date_format)
+
+    def __repr__(self):
+        return f"TimeSeries({self.to_samples()!r})"
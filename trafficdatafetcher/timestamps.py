@@ -0,0 +1,239 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_SECOND = timedelta(seconds=1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_SECONDS_PER_DAY = 24 * 60 * 60
+
+# Offset of dates which are given in local time without an offset:
+NO_OFFSET = -2 ** 31
+
+
+class DateFormat(NamedTuple):
+    """
+    Format of dates which format_date does not render the way the API does
+    by default: the separator of day and time of day, the fractional
+    seconds shared by all dates and the format of offsets, one of `+HHMM`,
+    `+HH:MM` and `Z`, which renders UTC as `Z` and other offsets as
+    `+HH:MM`.
+    """
+    separator: str
+    fraction: str
+    offset: str
+
+
+# Channels which are merged share their dates and are read in lockstep. A
+# small cache is therefore enough to parse most dates only once:
+@lru_cache(maxsize=1024)
+def parse_date(value: str) -> Tuple[int, int]:
+    """
+    Parses the date of a sample into seconds since the epoch and its offset
+    from UTC in seconds. Dates without an offset are taken as UTC and have
+    the offset NO_OFFSET.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        parsed = _strptime_date(value)
+    if parsed.tzinfo is None:
+        return (parsed - _EPOCH) // _SECOND, NO_OFFSET
+    return (parsed - _EPOCH_UTC) // _SECOND, parsed.utcoffset() // _SECOND
+
+
+# Z, offsets without a colon and fractions of other than three or six
+# digits are only supported by fromisoformat since Python 3.11:
+_DATE_FORMATS = [f"%Y-%m-%d{separator}%H:%M:%S{fraction}{offset}"
+                 for separator in ("T", " ") for fraction in ("", ".%f") for offset in ("%z", "")]
+
+
+def _strptime_date(value):
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date: {value!r}")
+
+
+def parse_dates(values: Iterable[str]) -> Tuple[array, array]:
+    """
+    Parses the dates of many samples like parse_date and returns arrays of
+    their timestamps and offsets.
+
+    The dates of a channel share few days, times of day and offsets, which
+    are parsed once each. Dates are only parsed on their own if they have
+    fractional seconds or no time.
+    """
+    days = {}
+    times = {}
+    offsets = {}
+    timestamp_array = array("q")
+    offset_array = array("i")
+    for value in values:
+        day, time_of_day, offset_text = value[:10], value[10:19], value[19:]
+        # Offsets of the form +HH:MM, +HHMM, Z or none:
+        offset = offsets.get(offset_text)
+        if offset is None:
+            offset = offsets[offset_text] = parse_date(value)[1] \
+                if offset_text[:1] in ("", "+", "-", "Z") else False
+        seconds_of_day = times.get(time_of_day)
+        if seconds_of_day is None:
+            seconds_of_day = times[time_of_day] = _parse_time_of_day(time_of_day)
+        if offset is False or seconds_of_day is False:
+            timestamp, offset = parse_date(value)
+        else:
+            days_since_epoch = days.get(day)
+            if days_since_epoch is None:
+                days_since_epoch = days[day] = date.fromisoformat(day).toordinal() - _EPOCH_ORDINAL
+            timestamp = days_since_epoch * _SECONDS_PER_DAY + seconds_of_day
+            if offset != NO_OFFSET:
+                timestamp -= offset
+        timestamp_array.append(timestamp)
+        offset_array.append(offset)
+    return timestamp_array, offset_array
+
+
+def _parse_time_of_day(value):
+    """
+    Parses the separator and time of a date into seconds since midnight.
+    Returns False if value is not of the form `THH:MM:SS` or ` HH:MM:SS`.
+    """
+    if len(value) != 9 or value[0] not in ("T", " ") or value[3] != ":" or value[6] != ":":
+        return False
+    try:
+        parsed = time.fromisoformat(value[1:])
+    except ValueError:
+        return False
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+def date_format(value: str) -> Optional[DateFormat]:
+    """
+    Returns the format of a date, or None if format_date renders the date
+    unchanged without a format. Dates without a time are not supported and
+    have no format.
+    """
+    if len(value) < 19:
+        return None
+    separator, rest = value[10], value[19:]
+    fraction = ""
+    if rest[:1] == ".":
+        end = 1
+        while rest[end:end + 1].isdigit():
+            end += 1
+        fraction, rest = rest[:end], rest[end:]
+    if rest == "Z":
+        offset = "Z"
+    elif len(rest) == 6 and rest[3] == ":":
+        offset = "+HH:MM"
+    else:
+        offset = "+HHMM"
+    if not fraction and offset == "+HHMM" and separator == ("T" if rest else " "):
+        return None
+    return DateFormat(separator, fraction, offset)
+
+
+def parse_timestamp(value: str) -> int:
+    """
+    Parses the date of a sample into seconds since the epoch. Dates without
+    an offset are taken as UTC.
+    """
+    return parse_date(value)[0]
+
+
+@lru_cache(maxsize=1024)
+def format_date(timestamp: int, offset: int, date_format: Optional[DateFormat] = None) -> str:
+    """
+    Formats a date parsed with parse_date the way the API does, or in the
+    format returned by date_format for the original date.
+    """
+    separator, offset_text = _format_offset(offset, date_format)
+    local = _EPOCH + timedelta(seconds=timestamp if offset == NO_OFFSET else timestamp + offset)
+    fraction = "" if date_format is None else date_format.fraction
+    return f"{local:%Y-%m-%d}{separator}{local:%H:%M:%S}{fraction}{offset_text}"
+
+
+def format_dates(timestamps: Iterable[int], offsets: Iterable[int],
+                 date_format: Optional[DateFormat] = None) -> List[str]:
+    """
+    Formats the dates of many samples like format_date.
+
+    The dates of a series share few days, times of day and offsets, which
+    are formatted once each.
+    """
+    days = {}
+    times = {}
+    offset_texts = {}
+    dates = []
+    for timestamp, offset in zip(timestamps, offsets):
+        texts = offset_texts.get(offset)
+        if texts is None:
+            texts = offset_texts[offset] = _format_offset(offset, date_format)
+        separator, offset_text = texts
+        local = timestamp if offset == NO_OFFSET else timestamp + offset
+        days_since_epoch, seconds_of_day = divmod(local, _SECONDS_PER_DAY)
+        day = days.get(days_since_epoch)
+        if day is None:
+            day = days[days_since_epoch] = f"{date.fromordinal(days_since_epoch + _EPOCH_ORDINAL):%Y-%m-%d}"
+        time_of_day = times.get(seconds_of_day)
+        if time_of_day is None:
+            hours, seconds = divmod(seconds_of_day, 3600)
+            time_of_day = times[seconds_of_day] = f"{hours:02d}:{seconds // 60:02d}:{seconds % 60:02d}" \
+                + ("" if date_format is None else date_format.fraction)
+        dates.append(day + separator + time_of_day + offset_text)
+    return dates
+
+
+def format_months(timestamps: Iterable[int], offsets: Iterable[int]) -> List[str]:
+    """
+    Formats the months (YYYY-MM) of the local dates of many samples.
+    """
+    months = {}
+    formatted = []
+    for timestamp, offset in zip(timestamps, offsets):
+        local = timestamp if offset == NO_OFFSET else timestamp + offset
+        days_since_epoch = local // _SECONDS_PER_DAY
+        month = months.get(days_since_epoch)
+        if month is None:
+            month = months[days_since_epoch] = f"{date.fromordinal(days_since_epoch + _EPOCH_ORDINAL):%Y-%m}"
+        formatted.append(month)
+    return formatted
+
+
+def _format_offset(offset, date_format):
+    """
+    Returns the separator of day and time of day and the offset as they are
+    formatted by format_date.
+    """
+    if date_format is None:
+        separator, style = (" " if offset == NO_OFFSET else "T"), "+HHMM"
+    else:
+        separator, style = date_format.separator, date_format.offset
+    if offset == NO_OFFSET:
+        return separator, ""
+    if offset == 0 and style == "Z":
+        return separator, "Z"
+    hours, minutes = divmod(abs(offset) // 60, 60)
+    sign = "-" if offset < 0 else "+"
+    colon = "" if style == "+HHMM" else ":"
+    return separator, f"{sign}{hours:02d}{colon}{minutes:02d}"
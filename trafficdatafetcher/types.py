@@ -26,4 +26,18 @@ class EnumWithLowerCaseNames(Enum):
         try:
             return cls[value.upper()]
         except KeyError:
-            raise ValueError(f"{value} is not a valid {cls.__name__}")
\ No newline at end of file
+            raise ValueError(f"{value} is not a valid {cls.__name__}")
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"{value} is not a positive number")
+    return number
+
+
+def positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise ValueError(f"{value} is not a positive number")
+    return number
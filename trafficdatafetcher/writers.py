@@ -0,0 +1,145 @@
+# Traffic Data Fetcher - Retrieve data from Eco Counter's traffic counter API
+# Copyright (C) 2025  Christoph Böhne
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import os
+import sys
+from contextlib import contextmanager
+from enum import auto
+
+from trafficdatafetcher.arrowutils import ColumnType, open_arrow, open_parquet
+from trafficdatafetcher.csvutils import open_csv
+from trafficdatafetcher.types import EnumWithLowerCaseNames
+
+
+class OutputFormat(EnumWithLowerCaseNames):
+    CSV = auto()
+    PARQUET = auto()
+    ARROW = auto()
+
+    @property
+    def is_binary(self):
+        return self != OutputFormat.CSV
+
+
+class Compression(EnumWithLowerCaseNames):
+    NONE = auto()
+    GZIP = auto()
+    ZSTD = auto()
+
+    @property
+    def suffix(self):
+        return _SUFFIXES.get(self, "")
+
+    @classmethod
+    def from_file_name(cls, file):
+        """
+        Returns the compression matching the extension of the file name.
+        """
+        for compression, suffix in _SUFFIXES.items():
+            if file is not None and file.endswith(suffix):
+                return compression
+        return cls.NONE
+
+
+_SUFFIXES = {
+    Compression.GZIP: ".gz",
+    Compression.ZSTD: ".zst",
+}
+
+
+@contextmanager
+def open_writer(output_format, file, columns, column_types, write_header=True, compression=None):
+    """
+    Opens a writer for rows in the given format. All writers accept rows as
+    dicts keyed by the columns. Values of timestamp columns are (timestamp,
+    offset) pairs as returned by `timestamps.parse_date`, optionally
+    followed by the date format of `timestamps.date_format`. With
+    `writeseries(values, timestamps, offsets, counts, date_format)`, all
+    writers also write the samples of a series at once, with the values of
+    the other columns given as dict. CSV files are written to text files,
+    all other formats to binary files. Parquet and Arrow files compress
+    their columns with compression, CSV files are compressed by
+    `open_output` instead.
+    """
+    if output_format == OutputFormat.CSV:
+        timestamp_columns = [column for column in columns
+                             if column_types[column] == ColumnType.TIMESTAMP]
+        yield open_csv(file, columns, write_header, timestamp_columns)
+        return
+    codec = None if compression is None else str(compression)
+    if output_format == OutputFormat.PARQUET:
+        writer = open_parquet(file, columns, column_types, codec)
+    else:
+        writer = open_arrow(file, columns, column_types, codec)
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+@contextmanager
+def open_output(file, append, binary, compression=Compression.NONE):
+    """
+    Opens the output file and tells whether a header needs to be written.
+    The output is compressed with compression as it is written.
+    """
+    if file == "-":
+        output = sys.stdout.buffer if binary else sys.stdout
+        if compression == Compression.NONE:
+            yield output, True
+            return
+        file = sys.stdout.buffer
+        write_header = True
+    else:
+        write_header = not (append and os.path.exists(file) and os.path.getsize(file) > 0)
+    output = open_compressed(file, "ab" if append else "wb", compression)
+    if not binary:
+        output = io.TextIOWrapper(output, encoding="UTF-8")
+    with output:
+        yield output, write_header
+
+
+def open_compressed(file, mode, compression):
+    """
+    Opens a binary file which is compressed with compression. With
+    compression, the file may also be a file object, which is not closed
+    with the returned file. Appending to a compressed file adds a gzip
+    member or a zstd frame, which are read as continuation of the file.
+    """
+    if compression == Compression.GZIP:
+        if isinstance(file, str):
+            return gzip.open(file, mode)
+        return gzip.GzipFile(fileobj=file, mode=mode)
+    if compression == Compression.ZSTD:
+        return _open_zstd(file, mode)
+    return open(file, mode)
+
+
+def _open_zstd(file, mode):
+    try:
+        # Part of the standard library since Python 3.14:
+        from compression import zstd
+        return zstd.ZstdFile(file, mode)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        sys.exit("error: zstd compression requires zstandard. "
+                 "Install it with `pip install traffic-data-fetcher[zstd]`")
+    return zstandard.open(file, mode)